@@ -0,0 +1,130 @@
+import argparse, csv, os, sys
+
+from modules.results.results_store import open_results_store
+from modules.results.compare import compare_measurements
+from modules.results.report import CELL_FIELDS
+
+# --------------- PARSER CONFIG --------------
+
+parser = argparse.ArgumentParser(description="Detects regressions between runs saved in the results database of the NLHPC AI BENCHMARK")
+
+parser.add_argument(
+    "--candidate",
+    type=int,
+    help="Id of the run to evaluate. Default: the last run",
+    required=False,
+    default=None,
+    dest="candidate"
+)
+
+parser.add_argument(
+    "--baseline",
+    type=int,
+    help="Id of the baseline run. Default: rolling baseline of the previous --baseline_runs runs with the same configuration",
+    required=False,
+    default=None,
+    dest="baseline"
+)
+
+parser.add_argument(
+    "--baseline_runs",
+    type=int,
+    help="Number of previous runs with the same configuration hash pooled in the rolling baseline. Default=5",
+    required=False,
+    default=5,
+    dest="baseline_runs"
+)
+
+parser.add_argument(
+    "--metrics",
+    type=lambda value: [metric.strip() for metric in value.split(",")],
+    help="Comma separated metrics to compare. Default: tokens/s, latency, energy and goodput metrics",
+    required=False,
+    default=None,
+    dest="metrics"
+)
+
+parser.add_argument(
+    "--alpha",
+    type=float,
+    help="Significance level of the permutation test. Default=0.05",
+    required=False,
+    default=0.05,
+    dest="alpha"
+)
+
+parser.add_argument(
+    "--min_change",
+    type=float,
+    help="Minimum relative change reported as a regression or improvement. Default=0.02",
+    required=False,
+    default=0.02,
+    dest="min_change"
+)
+
+args = parser.parse_args()
+
+# --------------- LOAD THE RUNS ----------
+
+result_path = os.getenv('RESULT_PATH') or "."
+results_store = open_results_store(result_path)
+if results_store is None:
+    parser.error("The results database is disabled (RESULTS_DB=none)")
+
+runs = {run["id"]: run for run in results_store.get_runs()}
+if not runs:
+    parser.error("There are no runs in the results database")
+
+candidate_id = args.candidate if args.candidate is not None else max(runs)
+if candidate_id not in runs:
+    parser.error(f"Run {candidate_id} not found")
+candidate_run = runs[candidate_id]
+
+if args.baseline is not None:
+    if args.baseline not in runs:
+        parser.error(f"Run {args.baseline} not found")
+    baseline_runs = [runs[args.baseline]]
+else:
+    baseline_runs = results_store.get_runs(config_hash=candidate_run["config_hash"], before=candidate_id, limit=args.baseline_runs)
+    if not baseline_runs:
+        parser.error(f"There are no previous runs with the configuration of run {candidate_id} ({candidate_run['config_hash']})")
+
+candidate = results_store.query(run_id=candidate_id)
+baseline = [measurement for run in baseline_runs for measurement in results_store.query(run_id=run["id"])]
+results_store.close()
+
+# --------------- PRINT WHAT CHANGED BETWEEN THE RUNS ----------
+
+print(f"Candidate run {candidate_id} vs baseline run(s) {', '.join(str(run['id']) for run in baseline_runs)}")
+for field in ("hostname", "git_sha", "container_image", "vllm_version", "ollama_version", "driver_version", "config_hash"):
+    baseline_values = sorted({str(run[field]) for run in baseline_runs})
+    if baseline_values != [str(candidate_run[field])]:
+        print(f"  {field}: {', '.join(baseline_values)} -> {candidate_run[field]}")
+
+# --------------- COMPARE ----------
+
+rows = compare_measurements(baseline, candidate, metrics=args.metrics, alpha=args.alpha, min_change=args.min_change)
+
+output_file = os.path.join(result_path, "compare.csv")
+columns = list(CELL_FIELDS) + ["metric", "n_baseline", "n_candidate", "baseline_mean", "candidate_mean", "change", "p_value", "status"]
+with open(output_file, mode='w', newline='', encoding='utf-8') as csvfile:
+    writer = csv.DictWriter(csvfile, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+regressions = [row for row in rows if row["status"] == "regression"]
+insufficient = [row for row in rows if row["status"] == "insufficient repetitions"]
+for row in rows:
+    if row["status"] == "unchanged":
+        continue
+    change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+    print(f"{row['status'].upper()}: {row['model']} | {row['num_gpus']} gpus | {row['test_app']} {row['load_mode']} {row['workload']} | "
+          f"{row['metric']}: {row['baseline_mean']:.4g} -> {row['candidate_mean']:.4g} ({change}, p={row['p_value']:.3g})")
+
+print(f"\n{len(rows)} comparisons, {len(regressions)} regressions. Saved in {output_file}")
+if insufficient:
+    print(f"{len(insufficient)} comparisons have too few repetitions to reach alpha={args.alpha} "
+          "(increase -r or --baseline_runs), their changes could not be tested")
+
+# Non zero exit status when there are regressions (or comparisons that could not be tested), so the comparison can gate a job
+sys.exit(1 if regressions else 2 if insufficient else 0)
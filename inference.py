@@ -1,5 +1,6 @@
-import json, argparse, csv, os, sys, io
+import json, argparse, csv, os, sys, io, shutil
 from functools import partial
+from contextlib import closing
 
 # --------------- PARSER CONFIG --------------
 
@@ -34,30 +35,269 @@ parser.add_argument(
 parser.add_argument(
     "--gpu_backend",
     type=str,
-    help="gpu backend to be used in the test.",
+    help="gpu backend to be used in the test. Options: cuda-rocm-sim-auto",
     required=False,
     default="cuda",
+    choices=["cuda", "rocm", "sim", "auto"],
     dest="gpu_backend"
 )
 
+parser.add_argument(
+    "--load_mode",
+    type=str,
+    help="How the requests are sent. Options: serial-concurrent-open_loop-goodput_search-load_time (weight load time of the models, no requests)-batch_sweep (vLLM-bench saturation curve)",
+    required=False,
+    default="serial",
+    dest="load_mode"
+)
+
+parser.add_argument(
+    "--concurrency", "-c",
+    type=lambda levels: list(map(int, levels.split(","))),
+    help="Comma separated in-flight request levels for the concurrent mode (e.g. 1,2,4,8)",
+    required=False,
+    default=[1],
+    dest="concurrency"
+)
+
+parser.add_argument(
+    "--num_requests",
+    type=int,
+    help="Requests to send per concurrency level. Default = concurrency * number of prompts",
+    required=False,
+    default=0,
+    dest="num_requests"
+)
+
+parser.add_argument(
+    "--request_rates",
+    type=lambda rates: list(map(float, rates.split(","))),
+    help="Comma separated arrival rates (requests/s) for the open_loop mode (e.g. 0.5,1,2,4)",
+    required=False,
+    default=[1.0],
+    dest="request_rates"
+)
+
+parser.add_argument(
+    "--arrival",
+    type=str,
+    help="Arrival process for the open_loop mode. Options: poisson-fixed",
+    required=False,
+    default="poisson",
+    dest="arrival"
+)
+
+parser.add_argument(
+    "--max_tokens",
+    type=int,
+    help="Maximum number of tokens to generate per request in the vLLM-serve test",
+    required=False,
+    default=128,
+    dest="max_tokens"
+)
+
+parser.add_argument(
+    "--serve_launch",
+    type=str,
+    help="vLLM-serve: 'attach' sends the requests to the server already running in VLLM_HOST, 'vllm' launches `vllm serve` for each model (VLLM_BENCH_ARGS configuration), 'mock' launches the local mock server (no gpus needed). Default=attach",
+    required=False,
+    default="attach",
+    choices=["attach", "vllm", "mock"],
+    dest="serve_launch"
+)
+
+parser.add_argument(
+    "--search_param",
+    type=str,
+    help="Load ramped by the goodput_search mode. Options: rate-concurrency",
+    required=False,
+    default="rate",
+    choices=["rate", "concurrency"],
+    dest="search_param"
+)
+
+parser.add_argument(
+    "--search_start",
+    type=float,
+    help="First load (requests/s or concurrency) tested by the goodput_search mode",
+    required=False,
+    default=1.0,
+    dest="search_start"
+)
+
+parser.add_argument(
+    "--slo_ttft",
+    type=float,
+    help="SLO for the p99 time to first token in seconds",
+    required=False,
+    default=2.0,
+    dest="slo_ttft"
+)
+
+parser.add_argument(
+    "--slo_tpot",
+    type=float,
+    help="SLO for the p99 time per output token in seconds",
+    required=False,
+    default=0.1,
+    dest="slo_tpot"
+)
+
+parser.add_argument(
+    "--slo_e2e",
+    type=float,
+    help="SLO for the p99 end to end latency in seconds (disabled by default)",
+    required=False,
+    default=None,
+    dest="slo_e2e"
+)
+
+parser.add_argument(
+    "--stream",
+    action="store_true",
+    help="Stream the ollama responses to measure the time to first token and inter-token latencies",
+    required=False,
+    dest="stream"
+)
+
+parser.add_argument(
+    "--mmap",
+    action="store_true",
+    help="load_time mode: read the weight files through mmap (as the safetensors loader) instead of read()",
+    required=False,
+    dest="mmap"
+)
+
+parser.add_argument(
+    "--bench_harness",
+    type=str,
+    help="vLLM-bench: 'engine' keeps the engine loaded in this process for every repetition and workload, 'script' runs benchmark_throughput.py (VLLM_BENCH_SCRIPT) in a subprocess. Default=engine",
+    required=False,
+    default="engine",
+    choices=["engine", "script"],
+    dest="bench_harness"
+)
+
+parser.add_argument(
+    "--bench_workloads",
+    type=str,
+    help="vLLM-bench: comma separated input_len x output_len x num_prompts workloads (e.g. 128x128x1000,1024x128x200). Default: the --input-len, --output-len and --num-prompts of the model configuration",
+    required=False,
+    default=None,
+    dest="bench_workloads"
+)
+
+parser.add_argument(
+    "--batch_sizes",
+    type=lambda sizes: list(map(int, sizes.split(","))),
+    help="Comma separated batch sizes or max_num_seqs values measured by the batch_sweep mode (e.g. 1,2,4,8,16,32,64,128,256)",
+    required=False,
+    default=[1, 2, 4, 8, 16, 32, 64, 128, 256],
+    dest="batch_sizes"
+)
+
+parser.add_argument(
+    "--sweep_param",
+    type=str,
+    help="Parameter swept by the batch_sweep mode. 'batch_size': requests submitted at once to the engine, 'max_num_seqs': sequences scheduled per step, with the requests of the workload. Default=batch_size",
+    required=False,
+    default="batch_size",
+    choices=["batch_size", "max_num_seqs"],
+    dest="sweep_param"
+)
+
+parser.add_argument(
+    "--warmup",
+    type=int,
+    help="Warm-up requests per model, excluded from the results. Ollama: the model is unloaded first and the first warm-up request is saved as the cold-load measurement. vLLM-bench: requests sent after loading the engine. 0 disables it. Default=1",
+    required=False,
+    default=1,
+    dest="warmup"
+)
+
+parser.add_argument(
+    "--target_ci",
+    type=float,
+    help="Adaptive repetitions: repeat each cell until the 95%% confidence interval of --convergence_metric is narrower than this fraction of the mean (e.g. 0.05). -r is then the minimum number of repetitions (at least 3)",
+    required=False,
+    default=None,
+    dest="target_ci"
+)
+
+parser.add_argument(
+    "--max_rep",
+    type=int,
+    help="Adaptive repetitions: maximum number of repetitions of each cell. Default=10",
+    required=False,
+    default=10,
+    dest="max_rep"
+)
+
+parser.add_argument(
+    "--convergence_metric",
+    type=str,
+    help="Adaptive repetitions: metric whose confidence interval is evaluated. Default: seconds (or time_to_ready) with load_time, goodput with goodput_search, tokens_per_second otherwise",
+    required=False,
+    default=None,
+    dest="convergence_metric"
+)
+
 args = parser.parse_args()
 
+if (args.load_mode == "open_loop" and any(rate <= 0 for rate in args.request_rates)):
+    parser.error("The --request_rates must be greater than 0")
+if (args.load_mode == "goodput_search" and (args.search_start <= 0 or (args.search_param == "concurrency" and args.search_start < 1))):
+    parser.error("The --search_start must be greater than 0 (at least 1 with --search_param=concurrency)")
+if (args.test_app == "vLLM-serve" and args.load_mode not in ("open_loop", "goodput_search")):
+    parser.error("The vLLM-serve test only supports --load_mode=open_loop or --load_mode=goodput_search")
+if (args.load_mode in ("open_loop", "goodput_search") and args.test_app not in ("ollama", "vLLM-serve")):
+    parser.error(f"The {args.load_mode} mode needs --test_app=ollama or --test_app=vLLM-serve")
+if (args.load_mode == "concurrent" and args.test_app != "ollama"):
+    parser.error("The concurrent mode needs --test_app=ollama")
+
+if (args.load_mode == "batch_sweep" and args.test_app != "vLLM-bench"):
+    parser.error("The batch_sweep mode needs --test_app=vLLM-bench")
+if (args.load_mode == "batch_sweep" and args.bench_harness != "engine"):
+    parser.error("The batch_sweep mode needs --bench_harness=engine, the engine is loaded once for every point of the sweep")
+
 # --------------- LOAD NECESSARY MODULES --------------
 
-if (args.gpu_backend == "rocm"):
-    from modules.gpu_monitor.gpu_monitor_rocm import GpuMonitor
-else:
-    from modules.gpu_monitor.gpu_monitor_cuda import GpuMonitor
+from modules.gpu_monitor.gpu_backends import load_gpu_sampler
+GpuSampler = load_gpu_sampler(args.gpu_backend)
+from modules.gpu_monitor.gpu_sampler import sort_gpu_stats
+
+from modules.metrics.energy_metrics import energy_efficiency
+from modules.results.results_store import open_results_store
+from modules.results.results_csv import results_csv_path
+from modules.results.run_metadata import collect_run_metadata
+from modules.metrics.repetition_stats import RepetitionController
+from modules.planner.memory_planner import *
 
 if (args.test_app == "vLLM-bench" or args.test_app == "vLLM-inference"):
     from modules.vLLM.models_data_utils import *
     from modules.vLLM.vLLM_bench_utils import *
+    from modules.vLLM.models_prepull import *
+    from modules.vLLM.throughput_harness import *
+elif (args.test_app == "vLLM-serve"):
+    from modules.vLLM.openai_async_api import *
+    from modules.vLLM.vllm_server import *
 else:
     from modules.ollama.ollama_api import *
+    from modules.ollama.ollama_async_api import *
+
+if (args.load_mode != "serial"):
+    from modules.load_generator.load_generator import *
+
+if (args.load_mode == "goodput_search"):
+    from modules.load_generator.goodput_search import *
+
+if (args.load_mode == "load_time"):
+    from modules.load_time.weight_load import *
 
 # --------------- LOAD ENVIRONMENT VARIABLES ----------
 
 ollama_host = os.getenv('OLLAMA_HOST') or "127.0.0.1:11434"
+vllm_host = os.getenv('VLLM_HOST') or "127.0.0.1:8000"
 test_data_json = os.getenv('TEST_DATA') or 'data.json'
 result_path = os.getenv('RESULT_PATH') or "."
 
@@ -66,6 +306,39 @@ try:
 except:
     max_vram = 64
 
+# Memory of the Ollama models: context length, parallel sequences and KV cache type of the service
+try:
+    ollama_context_length = int(os.getenv('OLLAMA_CONTEXT_LENGTH') or "4096")
+    ollama_num_parallel = int(os.getenv('OLLAMA_NUM_PARALLEL') or "1")
+except:
+    ollama_context_length, ollama_num_parallel = 4096, 1
+ollama_kv_cache_type = os.getenv('OLLAMA_KV_CACHE_TYPE') or "f16"
+
+try:
+    gpu_sampling_interval = float(os.getenv('GPU_SAMPLING_INTERVAL') or "0.1")
+    gpu_vram_sampling_interval = float(os.getenv('GPU_VRAM_SAMPLING_INTERVAL') or gpu_sampling_interval)
+except:
+    gpu_sampling_interval = gpu_vram_sampling_interval = 0.1
+
+try:
+    model_pull_parallel = int(os.getenv('MODEL_PULL_PARALLEL') or "4")
+    model_pull_retries = int(os.getenv('MODEL_PULL_RETRIES') or "3")
+except:
+    model_pull_parallel, model_pull_retries = 4, 3
+
+# Behaviour of the mock server of the vLLM-serve test (--serve_launch=mock)
+try:
+    mock_server_ttft = float(os.getenv('MOCK_SERVER_TTFT') or "0.05")
+    mock_server_tokens_per_second = float(os.getenv('MOCK_SERVER_TOKENS_PER_SECOND') or "50")
+    mock_server_max_num_seqs = int(os.getenv('MOCK_SERVER_MAX_NUM_SEQS') or "64")
+except:
+    mock_server_ttft, mock_server_tokens_per_second, mock_server_max_num_seqs = 0.05, 50.0, 64
+
+gpu_sampler_process = os.getenv('GPU_SAMPLER_PROCESS') == "1"
+store_gpu_samples = os.getenv('RESULTS_DB_GPU_SAMPLES') == "1"
+# Node-local storage (e.g. NVMe scratch) where the load_time mode stages the weights
+local_stage_dir = os.getenv('LOCAL_STAGE_DIR') or os.getenv('TMPDIR') or "/tmp"
+
 # -------------- LOAD TEST DATA ---------------
 
 # Read the Json file
@@ -76,11 +349,38 @@ with open(test_data_json, 'r') as test_data_json_file:
 models_name_list = test_data.get('models', [])
 prompts_list = test_data.get('prompts', [])
 
-# ------------ DOWNLOAD DE MODELS WITH OLLAMA API -----------
+# Input and output tokens of every backend are counted with the tokenizer of the model, so the tokens/s are
+# comparable. The ollama models only have the tokenizers given in data.json ("tokenizers": {model: HF tokenizer})
+from modules.tokenizer.tokenizer_service import TokenizerService
+tokenizer_service = TokenizerService(test_data.get('tokenizers'), model_tokenizers=args.test_app != "ollama")
+
+# Optional workload (dataset or synthetic prompts with controlled input/output lengths) instead of the prompt list
+workload_spec = test_data.get('workload')
+workload_requests = None
+workload_suffix = ""
+if workload_spec:
+    from modules.workload.workload import build_workload, workload_label
+    workload_requests = build_workload(workload_spec, tokenizer_service)
+    prompts_list = [request["prompt"] for request in workload_requests]
+    workload_suffix = f",workload={workload_label(workload_spec)}"
+    if not workload_requests:
+        sys.exit(f"The workload {workload_label(workload_spec)} has no requests (are all the prompts of the dataset longer than max_input_len?)")
+    print(f"Workload {workload_label(workload_spec)}: {len(workload_requests)} requests, "
+          f"{sum(request['input_len'] for request in workload_requests) / len(workload_requests):.0f} input and "
+          f"{sum(request['output_len'] for request in workload_requests) / len(workload_requests):.0f} output tokens on average")
+
+# ------------ DOWNLOAD THE MISSING MODELS -----------
 
+# Only the models missing in the local inventory (ollama /api/tags or the HF_HOME cache) are pulled, several at a time
+models_available = None
 if (args.test_app == "ollama"):
-    for model in models_name_list:
-        download_model_ollama(model, ollama_host)
+    models_available = prepull_models_ollama(models_name_list, ollama_host, model_pull_parallel, model_pull_retries)
+elif (args.test_app == "vLLM-bench" or args.test_app == "vLLM-inference"):
+    models_available = prepull_models_hf(models_name_list, model_pull_parallel, model_pull_retries)
+
+if models_available is not None and not all(models_available.values()):
+    print(f"Skipping the models that could not be downloaded: {', '.join(model for model, available in models_available.items() if not available)}")
+    models_name_list = [model for model in models_name_list if models_available[model]]
 
 # ----------- GET BENCH CONFIGURATION FOR VLLM-BENCH -----------
 
@@ -95,25 +395,649 @@ if (args.test_app == "vLLM-inference"):
     with open(vllm_bench_args_path, 'r') as vllm_bench_args_file:
         vllm_bench_args = json.load(vllm_bench_args_file)
 
+if (args.test_app == "vLLM-serve" and args.serve_launch == "vllm"):
+    # The engine options of each model are passed to `vllm serve`, the models without configuration use the defaults
+    vllm_bench_args_path = os.getenv('VLLM_BENCH_ARGS') or 'vllm_config.json'
+    with open(vllm_bench_args_path, 'r') as vllm_bench_args_file:
+        vllm_bench_args = json.load(vllm_bench_args_file)
+
 
 # ------------ GET MODELS INFORMATION -----------
 
 if args.test_app == "ollama":
     model_parameters_and_quantization = list(map(partial(obtain_model_data_ollama, port=ollama_host), models_name_list))
     models_weight = [calculate_theorical_weight(parameters, quantization) for parameters, quantization in model_parameters_and_quantization]
+    # The weights, the KV cache of the parallel sequences and the runtime overhead must fit in the MAX_VRAM of every gpu,
+    # otherwise ollama offloads part of the model to the cpu and the model is skipped
+    models_plan = []
+    for model, weight in zip(models_name_list, models_weight):
+        memory_plan = plan_ollama(weight * 1e9, obtain_model_geometry_ollama(model, ollama_host), args.num_gpus, max_vram,
+                                  ollama_context_length, ollama_num_parallel, ollama_kv_cache_type)
+        if not memory_plan["fits"]:
+            print(f"Skipping {model}: {memory_plan['required_gb']:.1f} GB per gpu needed, {memory_plan['budget_gb']:.1f} GB available ({memory_plan['reason']})")
+        models_plan.append(memory_plan)
+
+
+elif args.test_app == "vLLM-bench":
+    # Parameters and size from config.json and the safetensors headers (cached on disk), once per model
+    models_info = {}
+    # Memory plan (weights, KV cache, activations and overhead per rank) of each tensor parallel size tested
+    models_plan = {}
+    # Layer geometry of each model, to plan other configurations (e.g. the max_num_seqs of the batch_sweep mode)
+    models_geometry = {}
+    for model in models_name_list:
+        try:
+            vllm_bench_args_model = vllm_bench_args[model]
+        except:
+            raise RuntimeError(f"{model} configuration not found")
+        try:
+            dtype_config = vllm_bench_args_model[vllm_bench_args_model.index("--dtype") + 1]
+        except ValueError:
+            dtype_config = None
+        print(f"Loading {model} config...")
+        models_info[model] = get_model_info(model_name=model, dtype=dtype_config)
+        geometry = models_geometry[model] = resolve_model_metadata(model)["geometry"]
+        plan = partial(plan_vllm, models_info[model][2] * 1e9, geometry, vllm_bench_args_model, gpu_memory_gb=max_vram)
+        models_plan[model] = {}
+        g = 1
+        while g <= args.num_gpus:
+            models_plan[model][g] = plan(g)
+            g = g << 1
+        min_gpus, memory_plan = min_viable_gpus(plan, args.num_gpus)
+        if min_gpus is None:
+            print(f"{model} does not fit in {args.num_gpus} gpus: {memory_plan['reason']} ({memory_plan['required_gb']:.1f} GB per gpu needed, {memory_plan['budget_gb']:.1f} GB available)")
+        else:
+            print(f"{model} needs at least {min_gpus} gpus ({memory_plan['required_gb']:.1f} GB per gpu, up to {memory_plan['max_concurrent_seqs']} concurrent sequences)")
+        print("done!")
 
+# ------------ START THE GPU SAMPLER ----------
 
-# elif args.test_app == "vLLM-bench" or args.test_app == "vLLM-inference":
-#     models_info = []
-#     for model in models_name_list:
-#         models_info = list(map(get_model_info, models_name_list))
+# A single sampler for the whole job, each measurement is a window over its sample stream
+# With GPU_SAMPLER_PROCESS=1 the sampler runs in its own process, away from the GIL of the load generator
+if gpu_sampler_process:
+    from modules.gpu_monitor.gpu_sampler_process import GpuSamplerProcess
+    gpu_sampler = GpuSamplerProcess(GpuSampler, gpu_sampling_interval, vram_interval=gpu_vram_sampling_interval)
+else:
+    gpu_sampler = GpuSampler(gpu_sampling_interval, vram_interval=gpu_vram_sampling_interval)
+gpu_sampler.start()
+gpu_devices = gpu_sampler.get_devices()
+print(f"Sampling {len(gpu_devices)} gpus ({args.gpu_backend} backend):", ", ".join(f"{device['id']} ({device['clock_mhz']} MHz)" for device in gpu_devices))
 
 # ------------ OPEN THE CSV FILE AND START THE INFERENCE ----------
 
+gpu_stats_header = [f"GPU_{idx}_{metric}" for idx in range(len(gpu_devices)) for metric in ("Power_avg", "Power_max", "VRAM_usage_avg", "VRAM_usage_max")]
 
-if (args.test_app == "ollama"):
+# Each cell (e.g. a model at a concurrency level) is repeated -r times, or until it converges with --target_ci
+# The load_time scenarios measure the read seconds, or the time to ready of the model
+convergence_metric = args.convergence_metric or {"load_time": ("seconds", "time_to_ready"), "goodput_search": "goodput"}.get(args.load_mode, "tokens_per_second")
+repetition_control = RepetitionController(args.rep, args.target_ci, args.max_rep, convergence_metric)
+
+# Every measurement is also saved in the results database (one row per measurement, long-format gpu metrics)
+results_store = open_results_store(result_path)
+
+# The run is registered with its metadata (versions, container image, driver, git commit, config hash)
+# so compare.py can detect regressions between runs of the same configuration
+run_id = None
+if results_store is not None:
+    run_config = {key: value for key, value in vars(args).items() if key not in ("rep", "target_ci", "max_rep", "convergence_metric")}
+    run_config.update(models=models_name_list, prompts=prompts_list)
+    if workload_spec:
+        run_config.update(prompts=None, workload=workload_spec)
+    if args.test_app in ("vLLM-bench", "vLLM-inference") or (args.test_app == "vLLM-serve" and args.serve_launch == "vllm"):
+        run_config["vllm_bench_args"] = vllm_bench_args
+    ollama_version = get_ollama_version(ollama_host) if args.test_app == "ollama" else None
+    run_id = results_store.start_run(collect_run_metadata(run_config, args.gpu_backend, gpu_sampler.get_driver_version(), ollama_version))
+    print(f"Results run id: {run_id}")
+
+def gpu_window_metrics(window):
+    """Summary and energy of each gpu during a sampler window"""
+    gpu_metrics = gpu_sampler.get_window_summary(window)
+    gpu_metrics.update(gpu_sampler.get_window_energy(window))
+    return gpu_metrics
+
+def store_measurement(model, metrics, gpu_metrics, window=None, **fields):
+    """Saves a measurement in the results database, with the raw gpu samples of the window if RESULTS_DB_GPU_SAMPLES=1"""
+    if results_store is None:
+        return
+    gpu_samples = None
+    if store_gpu_samples and window is not None:
+        gpu_samples = gpu_sampler.get_samples(*gpu_sampler.get_window_bounds(window))
+    fields = {"run_id": run_id, "load_mode": args.load_mode, "num_gpus": args.num_gpus, **fields}
+    results_store.add_measurement(args.test_app, model, metrics, gpu_stats=gpu_metrics, gpu_samples=gpu_samples, **fields)
 
-    output_file = os.path.join(result_path, "ollama_benchmark_results.csv")
+def warm_up_model(model, r):
+    """
+    Unloads an Ollama model and sends the --warmup requests before measuring it, so the model load is not
+    part of the measured requests. The first request, which loads the model, is saved as the cold-load measurement.
+    """
+    if args.warmup <= 0:
+        return
+    unload_model_ollama(model.strip(), ollama_host)
+    print(f"Loading {model} (cold start)...")
+    sys.stdout.flush()
+    gpu_sampler.open_window("cold_load")
+    prompt_eval_duration, prompt_eval_count, response, latency = query_ollama(prompts_list[0].strip(), model.strip(), port=ollama_host, stream=True)
+    gpu_stats = gpu_sampler.close_window("cold_load")
+    if isinstance(prompt_eval_duration, str):
+        print(f"The cold start of {model} failed: {prompt_eval_count}")
+        return
+    sorted_gpu_stats = sort_gpu_stats(gpu_stats)
+
+    output_file = os.path.join(result_path, "ollama_cold_start_results.csv")
+    file_exists = os.path.isfile(output_file)
+    with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(["Model"
+                            , "Num_Gpus"
+                            , "Load_duration"
+                            , "Prompt_eval_duration"
+                            , "Total_duration"
+                            , "TTFT"
+                            , "E2E_latency"]
+                            + gpu_stats_header)
+        writer.writerow([model,
+                        args.num_gpus,
+                        latency["load_duration"],
+                        latency["prompt_eval_duration"],
+                        latency["total_duration"],
+                        latency["ttft"],
+                        latency["e2e_latency"]]
+                        + list(sorted_gpu_stats.values()))
+
+    measurement = {"eval_duration": prompt_eval_duration, "eval_count": prompt_eval_count, **latency}
+    store_measurement(model, measurement, gpu_window_metrics("cold_load"), window="cold_load", load_mode="cold_load",
+                      repetition=r, workload="cold_load", prompt=prompts_list[0], response=response)
+    print(f"{model} loaded in {latency['load_duration']} s (time to first token {latency['ttft']} s)")
+
+    # The remaining warm-up requests are not measured
+    for warmup_idx in range(1, args.warmup):
+        query_ollama(prompts_list[warmup_idx % len(prompts_list)].strip(), model.strip(), port=ollama_host, stream=args.stream)
+
+def start_serving(model, query):
+    """
+    Launches the OpenAI-compatible server of a model for the vLLM-serve test (--serve_launch) and sends the
+    --warmup requests, which are not measured. With --serve_launch=attach the server of VLLM_HOST is used.
+
+    Returns:
+        tuple: the server process (None when attaching) and the seconds until it was ready (None when attaching)
+    """
+    server, ready_time = None, None
+    if args.serve_launch != "attach":
+        port = vllm_host.rsplit(":", 1)[1]
+        if args.serve_launch == "vllm":
+            command = serve_command(model.strip(), vllm_bench_args.get(model), args.num_gpus, port)
+        else:
+            command = mock_command(model.strip(), port, ttft=mock_server_ttft, tokens_per_second=mock_server_tokens_per_second,
+                                   max_num_seqs=mock_server_max_num_seqs)
+        print(f"Launching the {args.serve_launch} server of {model}...")
+        sys.stdout.flush()
+        log_path = os.path.join(result_path, f"vllm_serve_{model.strip().replace('/', '_')}.log")
+        server, ready_time = launch_server(command, vllm_host, log_path=log_path)
+        print(f"Server ready in {ready_time:.1f} s")
+    if args.warmup > 0:
+        run_concurrent_load(query, workload_requests or [prompt.strip() for prompt in prompts_list], 1, args.warmup)
+    return server, ready_time
+
+def serving_schedule(done):
+    """
+    Repetitions of the models in the open_loop and goodput_search modes. The repetitions of the Ollama
+    models are interleaved, each one after a warm up, while with vLLM-serve every repetition of a model
+    runs against the same server, launched once per model and stopped after its last repetition (as the
+    engine of the vLLM-bench test). Use it with contextlib.closing so the server is stopped if the
+    measurement fails.
+
+    Args:
+        done (callable): Tells if every cell of a model already has its repetitions.
+    Yields:
+        tuple: repetition, model, query function and the seconds until its server was ready (None with Ollama)
+    """
+    if args.test_app == "ollama":
+        for r in repetition_control.repetitions():
+            for model_idx, model in enumerate(models_name_list):
+                if not models_plan[model_idx]["fits"] or done(model):
+                    continue
+                warm_up_model(model, r)
+                yield r, model, partial(async_query_ollama, model=model.strip(), port=ollama_host, stream=True), None
+        return
+    for model in models_name_list:
+        if done(model):
+            continue
+        query = partial(async_query_openai, model=model.strip(), host=vllm_host, max_tokens=args.max_tokens)
+        try:
+            server, server_ready_time = start_serving(model, query)
+        except RuntimeError as e:
+            print(f"Skipping {model}: {e}")
+            continue
+        try:
+            for r in repetition_control.repetitions():
+                if done(model):
+                    break
+                yield r, model, query, server_ready_time
+        finally:
+            stop_server(server)
+
+def engine_workload(model):
+    """
+    Workload of data.json as one more workload of the vLLM engine harness (vLLM-bench and batch_sweep).
+
+    Returns:
+        dict: average input_len and output_len, num_prompts, requests and name of the workload
+    """
+    # The token ids of the workload are only valid for the model whose tokenizer measured them
+    requests = workload_requests if workload_spec.get("tokenizer") == model else \
+        [{**request, "prompt_token_ids": None} for request in workload_requests]
+    return {"input_len": round(sum(request["input_len"] for request in requests) / len(requests)),
+            "output_len": round(sum(request["output_len"] for request in requests) / len(requests)),
+            "num_prompts": len(requests), "requests": requests, "name": workload_label(workload_spec)}
+
+def token_accounting(model, prompts, responses, elapsed_time=None):
+    """
+    Input and output tokens counted with the tokenizer of the model (TokenizerService), the same basis for every
+    backend, and the output tokens per second over elapsed_time. Empty if the model has no tokenizer.
+    """
+    model = model.strip()
+    if not tokenizer_service.exact(model):
+        return {}
+    input_tokens = sum(tokenizer_service.count_batch(model, [prompt["prompt"] if isinstance(prompt, dict) else prompt for prompt in prompts]))
+    output_tokens = sum(tokenizer_service.count_batch(model, responses))
+    tokens = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+    if elapsed_time is not None:
+        tokens["tokenizer_tokens_per_second"] = output_tokens / elapsed_time if elapsed_time > 0 else None
+    return tokens
+
+def load_token_accounting(model, results, prompts, elapsed_time):
+    """token_accounting of the successful requests of a load test"""
+    ok = [result for result in results if result["error"] is None]
+    return token_accounting(model, [prompts[result["request_idx"] % len(prompts)] for result in ok],
+                            [result["response"] for result in ok], elapsed_time)
+
+if (args.test_app == "ollama" and args.load_mode == "concurrent"):
+
+    # The columns added after the first versions go at the end, after the gpu columns
+    header = (["Model"
+              , "Params"
+              , "Quantization"
+              , "Theorical_size"
+              , "Num_Gpus"
+              , "Concurrency"
+              , "Num_requests"
+              , "Num_errors"
+              , "Elapsed_time"
+              , "Tokens/s"
+              , "Requests/s"
+              , "Latency_avg"
+              , "Latency_p50"
+              , "Latency_p90"
+              , "Latency_p99"
+              , "Latency_max"
+              , "TTFT_avg"
+              , "TTFT_p50"
+              , "TTFT_p90"
+              , "TTFT_p99"
+              , "ITL_p50"
+              , "ITL_p99"
+              , "Per_request_Tokens/s_avg"
+              , "Energy_J"
+              , "J/token"
+              , "Tokens/J"]
+              + gpu_stats_header
+              + ["Load_duration_max"
+              , "Prompt_eval_duration_avg"])
+    output_file = results_csv_path(os.path.join(result_path, "ollama_concurrency_results.csv"), header)
+    file_exists = os.path.isfile(output_file)
+    prompts = workload_requests or [prompt.strip() for prompt in prompts_list]
+
+    with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(header)
+
+        for r in repetition_control.repetitions():
+            for model, model_data, weight, memory_plan in zip(models_name_list, model_parameters_and_quantization, models_weight, models_plan):
+                if not memory_plan["fits"]:
+                    continue
+                query = partial(async_query_ollama, model=model.strip(), port=ollama_host, stream=args.stream)
+                if all(repetition_control.done((model, concurrency)) for concurrency in args.concurrency):
+                    continue
+                warm_up_model(model, r)
+                for concurrency in args.concurrency:
+                    if repetition_control.done((model, concurrency)):
+                        continue
+                    print(f"Running {model} with {concurrency} concurrent requests...")
+                    sys.stdout.flush()
+                    gpu_sampler.open_window("concurrency_level")
+                    results, elapsed_time = run_concurrent_load(query, prompts, concurrency, args.num_requests)
+                    gpu_stats = gpu_sampler.close_window("concurrency_level")
+                    load_stats = summarize_load(results, elapsed_time)
+                    load_stats.update(load_token_accounting(model, results, prompts, elapsed_time))
+                    energy = energy_efficiency(gpu_sampler.get_window_energy("concurrency_level")["energy_j"], load_stats["total_tokens"])
+                    sorted_gpu_stats = sort_gpu_stats(gpu_stats)
+                    # Write in the CSV file
+                    writer.writerow([model,
+                                    model_data[0], #Params
+                                    model_data[1], #Quantization
+                                    weight,
+                                    args.num_gpus,
+                                    concurrency,
+                                    load_stats["num_requests"],
+                                    load_stats["num_errors"],
+                                    load_stats["elapsed_time"],
+                                    load_stats["tokens_per_second"],
+                                    load_stats["requests_per_second"],
+                                    load_stats["latency_avg"],
+                                    load_stats["latency_p50"],
+                                    load_stats["latency_p90"],
+                                    load_stats["latency_p99"],
+                                    load_stats["latency_max"],
+                                    load_stats["ttft_avg"],
+                                    load_stats["ttft_p50"],
+                                    load_stats["ttft_p90"],
+                                    load_stats["ttft_p99"],
+                                    load_stats["itl_p50"],
+                                    load_stats["itl_p99"],
+                                    load_stats["per_request_tokens_per_second_avg"],
+                                    energy["energy_j"],
+                                    energy["joules_per_token"],
+                                    energy["tokens_per_joule"]]
+                                    + list(sorted_gpu_stats.values())
+                                    + [load_stats["load_duration_max"],
+                                    load_stats["prompt_eval_duration_avg"]])
+                    csvfile.flush()
+                    measurement = {"concurrency": concurrency, "theorical_size": weight, **load_stats, **energy}
+                    store_measurement(model, measurement, gpu_window_metrics("concurrency_level"), window="concurrency_level",
+                                      params=model_data[0], quantization=model_data[1], repetition=r,
+                                      workload=f"concurrency={concurrency}{workload_suffix}")
+                    repetition_control.add((model, concurrency), measurement)
+
+elif (args.load_mode == "open_loop"):
+
+    output_file = os.path.join(result_path, f"{args.test_app}_open_loop_results.csv")
+    file_exists = os.path.isfile(output_file)
+    prompts = workload_requests or [prompt.strip() for prompt in prompts_list]
+    # vLLM-serve: throughput and latencies reported by the server, to compare with the ones seen by the client
+    server_stats_keys = ["server_generation_tokens_per_second", "server_prompt_tokens_per_second", "server_ttft_avg",
+                         "server_queue_time_avg", "server_e2e_latency_avg", "server_preemptions"] if args.test_app == "vLLM-serve" else []
+    server_stats_header = ["Server_tokens/s", "Server_prompt_tokens/s", "Server_TTFT_avg", "Server_queue_time_avg",
+                           "Server_E2E_avg", "Server_preemptions"] if args.test_app == "vLLM-serve" else []
+
+    with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(["Model"
+                            , "Num_Gpus"
+                            , "Arrival"
+                            , "Request_rate"
+                            , "Achieved_rate"
+                            , "Num_requests"
+                            , "Num_errors"
+                            , "Elapsed_time"
+                            , "Tokens/s"
+                            , "Requests/s"
+                            , "TTFT_p50"
+                            , "TTFT_p90"
+                            , "TTFT_p99"
+                            , "TPOT_p50"
+                            , "TPOT_p90"
+                            , "TPOT_p99"
+                            , "E2E_p50"
+                            , "E2E_p90"
+                            , "E2E_p99"
+                            , "Energy_J"
+                            , "J/token"
+                            , "Tokens/J"]
+                            + server_stats_header
+                            + gpu_stats_header)
+
+        with closing(serving_schedule(lambda model: all(repetition_control.done((model, rate)) for rate in args.request_rates))) as schedule:
+            for r, model, query, server_ready_time in schedule:
+                for rate in args.request_rates:
+                    if repetition_control.done((model, rate)):
+                        continue
+                    # By default each rate lasts ~30 seconds of arrivals
+                    num_requests = args.num_requests if args.num_requests > 0 else max(len(prompts), int(rate * 30))
+                    print(f"Running {model} at {rate} requests/s ({args.arrival})...")
+                    sys.stdout.flush()
+                    # The counters of the server (/metrics) are read around the measurement
+                    server_before = scrape_server_metrics(vllm_host) if args.test_app == "vLLM-serve" else {}
+                    gpu_sampler.open_window("open_loop_rate")
+                    results, elapsed_time, achieved_rate = run_open_loop_load(query, prompts, rate, num_requests, args.arrival, seed=r)
+                    gpu_stats = gpu_sampler.close_window("open_loop_rate")
+                    load_stats = summarize_load(results, elapsed_time)
+                    load_stats.update(load_token_accounting(model, results, prompts, elapsed_time))
+                    server_stats = {}
+                    if args.test_app == "vLLM-serve":
+                        server_stats = server_metrics_delta(server_before, scrape_server_metrics(vllm_host), elapsed_time)
+                        server_stats["server_ready_time"] = server_ready_time
+                    energy = energy_efficiency(gpu_sampler.get_window_energy("open_loop_rate")["energy_j"], load_stats["total_tokens"])
+                    sorted_gpu_stats = sort_gpu_stats(gpu_stats)
+                    # Write in the CSV file
+                    writer.writerow([model,
+                                    args.num_gpus,
+                                    args.arrival,
+                                    rate,
+                                    achieved_rate,
+                                    load_stats["num_requests"],
+                                    load_stats["num_errors"],
+                                    load_stats["elapsed_time"],
+                                    load_stats["tokens_per_second"],
+                                    load_stats["requests_per_second"],
+                                    load_stats["ttft_p50"],
+                                    load_stats["ttft_p90"],
+                                    load_stats["ttft_p99"],
+                                    load_stats["tpot_p50"],
+                                    load_stats["tpot_p90"],
+                                    load_stats["tpot_p99"],
+                                    load_stats["latency_p50"],
+                                    load_stats["latency_p90"],
+                                    load_stats["latency_p99"],
+                                    energy["energy_j"],
+                                    energy["joules_per_token"],
+                                    energy["tokens_per_joule"]]
+                                    + [server_stats.get(key) for key in server_stats_keys]
+                                    + list(sorted_gpu_stats.values()))
+                    csvfile.flush()
+                    measurement = {"request_rate": rate, "achieved_rate": achieved_rate, **load_stats, **server_stats, **energy}
+                    store_measurement(model, measurement, gpu_window_metrics("open_loop_rate"), window="open_loop_rate",
+                                      repetition=r, workload=f"rate={rate},arrival={args.arrival}{workload_suffix}", config={"arrival": args.arrival})
+                    repetition_control.add((model, rate), measurement)
+
+elif (args.load_mode == "goodput_search"):
+
+    output_file = os.path.join(result_path, f"{args.test_app}_goodput_results.csv")
+    file_exists = os.path.isfile(output_file)
+    prompts = workload_requests or [prompt.strip() for prompt in prompts_list]
+    slo = {"ttft_p99": args.slo_ttft, "tpot_p99": args.slo_tpot, "latency_p99": args.slo_e2e}
+
+    with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(["Model"
+                            , "Num_Gpus"
+                            , "Search_param"
+                            , "SLO_TTFT_p99"
+                            , "SLO_TPOT_p99"
+                            , "SLO_E2E_p99"
+                            , "Max_load"
+                            , "Goodput"
+                            , "Tokens/s"
+                            , "Requests/s"
+                            , "TTFT_p99"
+                            , "TPOT_p99"
+                            , "E2E_p99"
+                            , "Num_trials"]
+                            + gpu_stats_header)
+
+        with closing(serving_schedule(lambda model: repetition_control.done((model,)))) as schedule:
+            for r, model, query, server_ready_time in schedule:
+                trials_gpu_stats = {}
+                trials_gpu_metrics = {}
+
+                def measure_load(load):
+                    server_before = scrape_server_metrics(vllm_host) if args.test_app == "vLLM-serve" else {}
+                    gpu_sampler.open_window("goodput_trial")
+                    if args.search_param == "concurrency":
+                        num_requests = args.num_requests if args.num_requests > 0 else load * max(len(prompts), 10)
+                        results, elapsed_time = run_concurrent_load(query, prompts, load, num_requests)
+                    else:
+                        num_requests = args.num_requests if args.num_requests > 0 else max(len(prompts), int(load * 30))
+                        results, elapsed_time, _ = run_open_loop_load(query, prompts, load, num_requests, args.arrival, seed=r)
+                    trials_gpu_stats[load] = gpu_sampler.close_window("goodput_trial")
+                    trials_gpu_metrics[load] = gpu_window_metrics("goodput_trial")
+                    load_stats = summarize_load(results, elapsed_time)
+                    load_stats.update(load_token_accounting(model, results, prompts, elapsed_time))
+                    if args.test_app == "vLLM-serve":
+                        load_stats.update(server_metrics_delta(server_before, scrape_server_metrics(vllm_host), elapsed_time))
+                    return load_stats, goodput(results, elapsed_time, slo)
+
+                print(f"Searching the max {args.search_param} of {model} with {args.num_gpus} gpus...")
+                sys.stdout.flush()
+                integer = args.search_param == "concurrency"
+                start = int(args.search_start) if integer else args.search_start
+                max_load, best, trials = search_max_load(measure_load, slo, start=start, integer=integer)
+
+                if max_load is None:
+                    print(f"{model} violates the SLO even at {args.search_param}={start}")
+                    load_stats, load_goodput = {}, 0
+                    gpu_stats = trials_gpu_stats[start]
+                    gpu_metrics = trials_gpu_metrics[start]
+                else:
+                    load_stats, load_goodput = best
+                    gpu_stats = trials_gpu_stats[max_load]
+                    gpu_metrics = trials_gpu_metrics[max_load]
+                sorted_gpu_stats = sort_gpu_stats(gpu_stats)
+                # Write in the CSV file
+                writer.writerow([model,
+                                args.num_gpus,
+                                args.search_param,
+                                args.slo_ttft,
+                                args.slo_tpot,
+                                args.slo_e2e,
+                                max_load,
+                                load_goodput,
+                                load_stats.get("tokens_per_second"),
+                                load_stats.get("requests_per_second"),
+                                load_stats.get("ttft_p99"),
+                                load_stats.get("tpot_p99"),
+                                load_stats.get("latency_p99"),
+                                len(trials)]
+                                + list(sorted_gpu_stats.values()))
+                csvfile.flush()
+                measurement = {"slo_ttft_p99": args.slo_ttft, "slo_tpot_p99": args.slo_tpot, "slo_e2e_p99": args.slo_e2e,
+                               "max_load": max_load, "goodput": load_goodput, "num_trials": len(trials), **load_stats}
+                store_measurement(model, measurement, gpu_metrics, repetition=r, workload=f"goodput_search={args.search_param}{workload_suffix}",
+                                  config={"search_param": args.search_param, "arrival": args.arrival})
+                repetition_control.add((model,), measurement)
+
+elif (args.load_mode == "load_time"):
+
+    output_file = os.path.join(result_path, f"{args.test_app}_load_time_results.csv")
+    file_exists = os.path.isfile(output_file)
+    # cold: page cache evicted, warm: read again from the page cache, staged: copy in LOCAL_STAGE_DIR
+    # The models are also loaded with a cold and a warm page cache (time to ready): by the ollama service, or
+    # by a vLLM engine, which is also loaded from the staged copy to measure if staging cuts the time to ready
+    scenarios = ["cold", "warm", "stage_copy", "staged_cold", "staged_warm", "ready_cold", "ready_warm"]
+    if args.test_app != "ollama":
+        scenarios += ["staged_ready_cold"]
+
+    with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(["Model"
+                            , "Num_Gpus"
+                            , "Scenario"
+                            , "Read_mode"
+                            , "Size_GB"
+                            , "Seconds"
+                            , "GB/s"
+                            , "Time_to_ready"
+                            , "Load_duration"]
+                            + gpu_stats_header)
+
+        for r in repetition_control.repetitions():
+            for model_idx, model in enumerate(models_name_list):
+                if all(repetition_control.done((model, scenario)) for scenario in scenarios):
+                    continue
+                if args.test_app == "ollama":
+                    weight_files = model_blob_paths_ollama(model.strip(), ollama_host)
+                    # A loaded model keeps its blob mapped, so its pages could not be evicted
+                    unload_model_ollama(model.strip(), ollama_host)
+                else:
+                    weight_files = model_weight_files_hf(model.strip())
+                if not weight_files:
+                    print(f"The weight files of {model} are not in this node")
+                    continue
+
+                def measure(scenario, files=None, model_path=None):
+                    print(f"Measuring the {scenario} load of {model}...")
+                    sys.stdout.flush()
+                    gpu_sampler.open_window("load_time")
+                    if scenario == "stage_copy":
+                        # The vLLM engines load the staged shards by their names
+                        stage_dir, staged_files, stats = stage_files(weight_files, local_stage_dir, keep_names=args.test_app != "ollama")
+                    elif "ready" in scenario and args.test_app == "ollama":
+                        unload_model_ollama(model.strip(), ollama_host)
+                        if scenario == "ready_cold":
+                            drop_page_cache(weight_files)
+                        stats = load_model_ollama(model.strip(), ollama_host) or {}
+                    elif "ready" in scenario:
+                        # Time until a vLLM engine loaded from model_path (HF_HOME or the staged copy) accepts requests
+                        if scenario.endswith("cold"):
+                            drop_page_cache(files)
+                        try:
+                            harness = ThroughputHarness(model_path, vllm_bench_args[model], tensor_parallel_size=args.num_gpus)
+                            stats = {"time_to_ready": harness.load_time}
+                            harness.close()
+                        except (RuntimeError, ValueError) as e:
+                            print(f"Error loading {model} from {model_path}: {e}")
+                            stats = {}
+                    else:
+                        stats = read_files(files, use_mmap=args.mmap)
+                    gpu_stats = gpu_sampler.close_window("load_time")
+                    size_gb = stats.get("bytes", sum(os.path.getsize(path) for path in weight_files)) / 1e9
+                    sorted_gpu_stats = sort_gpu_stats(gpu_stats)
+                    writer.writerow([model,
+                                    args.num_gpus,
+                                    scenario,
+                                    "mmap" if args.mmap else "read",
+                                    size_gb,
+                                    stats.get("seconds"),
+                                    stats.get("gb_per_second"),
+                                    stats.get("time_to_ready"),
+                                    stats.get("load_duration")]
+                                    + list(sorted_gpu_stats.values()))
+                    csvfile.flush()
+                    measurement = {"size_gb": size_gb, **stats}
+                    store_measurement(model, measurement, gpu_window_metrics("load_time"), window="load_time", repetition=r,
+                                      workload=f"load_time={scenario}", config={"read_mode": "mmap" if args.mmap else "read", "stage_dir": local_stage_dir})
+                    # A failed load counts as a repetition without the metric
+                    repetition_control.add((model, scenario), measurement if stats else {})
+                    if scenario == "stage_copy":
+                        return stage_dir, staged_files
+
+                drop_page_cache(weight_files)
+                measure("cold", weight_files)
+                measure("warm", weight_files)
+                stage_dir, staged_files = measure("stage_copy")
+                try:
+                    drop_page_cache(staged_files)
+                    measure("staged_cold", staged_files)
+                    measure("staged_warm", staged_files)
+                    if args.test_app != "ollama":
+                        copy_checkpoint_files(os.path.dirname(weight_files[0]), stage_dir)
+                        measure("staged_ready_cold", staged_files, stage_dir)
+                finally:
+                    shutil.rmtree(stage_dir, ignore_errors=True)
+                if args.test_app == "ollama":
+                    measure("ready_cold")
+                    measure("ready_warm")
+                else:
+                    measure("ready_cold", weight_files, os.path.dirname(weight_files[0]))
+                    measure("ready_warm", weight_files, os.path.dirname(weight_files[0]))
+
+elif (args.load_mode == "batch_sweep"):
+
+    output_file = os.path.join(result_path, "vllm_batch_sweep_results.csv")
     file_exists = os.path.isfile(output_file)
 
     with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
@@ -122,55 +1046,208 @@ if (args.test_app == "ollama"):
             writer.writerow(["Model"
                             , "Params"
                             , "Quantization"
-                            , "Tokens/s"
-                            , "Eval_duration"
-                            , "Eval_count"
-                            , "Theorical_size"
                             , "Num_Gpus"
-                            , "Prompt"
-                            , "Response"
-                            , "GPU_0_Power_avg"
-                            , "GPU_0_Power_max"
-                            , "GPU_0_VRAM_usage_avg"
-                            , "GPU_0_VRAM_usage_max"
-                            , "GPU_1_Power_avg"
-                            , "GPU_1_Power_max"
-                            , "GPU_1_VRAM_usage_avg"
-                            , "GPU_1_VRAM_usage_max"
-                            , "GPU_2_Power_avg"
-                            , "GPU_2_Power_max"
-                            , "GPU_2_VRAM_usage_avg"
-                            , "GPU_2_VRAM_usage_max"
-                            , "GPU_3_Power_avg"
-                            , "GPU_3_Power_max"
-                            , "GPU_3_VRAM_usage_avg"
-                            , "GPU_3_VRAM_usage_max"
-                            , "GPU_4_Power_avg"
-                            , "GPU_4_Power_max"
-                            , "GPU_4_VRAM_usage_avg"
-                            , "GPU_4_VRAM_usage_max"
-                            , "GPU_5_Power_avg"
-                            , "GPU_5_Power_max"
-                            , "GPU_5_VRAM_usage_avg"
-                            , "GPU_5_VRAM_usage_max"])
-
-        for r in range(args.rep):
-            for model, model_data, weight in zip(models_name_list, model_parameters_and_quantization, models_weight):
-                if weight > max_vram*args.num_gpus:
+                            , "Sweep_param"
+                            , "Batch_size"
+                            , "Input_len"
+                            , "Output_len"
+                            , "Num_requests"
+                            , "Elapsed_time"
+                            , "Tokens/s"
+                            , "Total_tokens/s"
+                            , "Requests/s"
+                            , "TTFT_p50"
+                            , "TTFT_p99"
+                            , "TPOT_p50"
+                            , "TPOT_p99"
+                            , "E2E_latency_p50"
+                            , "E2E_latency_p99"
+                            , "Prefill_time_fraction"
+                            , "Planned_max_seqs"
+                            , "VRAM_peak"
+                            , "Energy_J"
+                            , "J/token"
+                            , "Tokens/J"]
+                            + gpu_stats_header)
+
+        for model in models_name_list:
+            vllm_bench_args_model = vllm_bench_args[model]
+            model_data = models_info[model]
+            workloads = bench_workloads(vllm_bench_args_model, parse_workloads(args.bench_workloads) if args.bench_workloads else None)
+            if workload_requests:
+                workloads.append(engine_workload(model))
+            batch_sizes = sorted(set(args.batch_sizes))
+            # The engine of the sweep schedules up to the largest point, which is the configuration planned
+            sweep_config = {**engine_config(vllm_bench_args_model), "max_num_seqs": batch_sizes[-1]}
+            g = 1
+            while g <= args.num_gpus:
+                memory_plan = plan_vllm(model_data[2] * 1e9, models_geometry[model], sweep_config, g, gpu_memory_gb=max_vram)
+                cells = [(model, g, workload_name(workload), args.sweep_param, batch_size)
+                         for workload in workloads for batch_size in batch_sizes]
+                if not memory_plan["fits"]:
+                    print(f"{model} with {g} gpus and max_num_seqs={batch_sizes[-1]} does not fit: {memory_plan['reason']}")
+                if not memory_plan["fits"] or all(repetition_control.done(cell) for cell in cells):
+                    g = g << 1
                     continue
-                for prompt in prompts_list:
-                    gpu_monitor = GpuMonitor(0.1)
-                    gpu_monitor.start()
-                    prompt_eval_duration, prompt_eval_count, response = query_ollama(prompt.strip(), model.strip(), port=ollama_host)
-                    gpu_monitor.stop()
+
+                # The engine is loaded once for the whole curve, with room for the largest point: the CUDA graphs
+                # are captured up to max_num_seqs, and the max_num_seqs sweep can only lower it afterwards
+                print(f"Loading {model} with {g} gpus (max_num_seqs={batch_sizes[-1]})...")
+                sys.stdout.flush()
+                try:
+                    harness = ThroughputHarness(model, sweep_config, tensor_parallel_size=g)
+                except (RuntimeError, ValueError) as e:
+                    print(f"Error loading {model} with {g} gpus: {e}")
+                    g = g << 1
+                    continue
+                print(f"Engine ready in {harness.load_time:.1f} s")
+                harness.warmup(args.warmup)
+
+                engine_failed = False
+                try:
+                    if args.sweep_param == "max_num_seqs" and not harness.set_max_num_seqs(batch_sizes[-1]):
+                        print("The scheduler of the engine runs in another process, the max_num_seqs sweep needs "
+                              "VLLM_ENABLE_V1_MULTIPROCESSING=0 (or the V0 engine). Skipping it")
+                        g = g << 1
+                        continue
+                    for r in repetition_control.repetitions():
+                        for workload in workloads:
+                            for batch_size in batch_sizes:
+                                cell = (model, g, workload_name(workload), args.sweep_param, batch_size)
+                                if repetition_control.done(cell):
+                                    continue
+                                requests = workload.get("requests")
+                                num_prompts = workload["num_prompts"]
+                                if args.sweep_param == "batch_size":
+                                    # One batch of batch_size requests submitted at once to the engine
+                                    num_prompts = batch_size
+                                    if requests:
+                                        requests = [requests[idx % len(requests)] for idx in range(batch_size)]
+                                else:
+                                    harness.set_max_num_seqs(batch_size)
+                                print(f"Measuring {model} with {g} gpus, {args.sweep_param}={batch_size}...")
+                                sys.stdout.flush()
+                                gpu_sampler.open_window("batch_sweep")
+                                try:
+                                    result = harness.run(workload["input_len"], workload["output_len"], num_prompts,
+                                                         seed=r, requests=requests)
+                                except Exception as e:
+                                    # e.g. torch.OutOfMemoryError at the largest points or a dead engine: the rest
+                                    # of the curve of this engine is not measured
+                                    gpu_sampler.close_window("batch_sweep")
+                                    print(f"The {args.sweep_param}={batch_size} point of {model} with {g} gpus failed: {e}")
+                                    repetition_control.add(cell, {})
+                                    engine_failed = True
+                                    break
+                                gpu_stats = gpu_sampler.close_window("batch_sweep")
+                                sorted_gpu_stats = sort_gpu_stats(gpu_stats)
+                                # Peak of the most loaded gpu. vLLM preallocates the KV cache (gpu_memory_utilization),
+                                # so it only grows with the batch through the activations and the sampler
+                                # (None on every gpu if the window never became active, e.g. a short point below min_w_usage)
+                                vram_peak = max((value for key, value in gpu_stats.items()
+                                                 if key.endswith("_vram_usage_max") and value is not None), default=None)
+                                energy = energy_efficiency(gpu_sampler.get_window_energy("batch_sweep").get("energy_j"), result["output_tokens"])
+
+                                writer.writerow([model,
+                                                model_data[0], #Params
+                                                model_data[1], #Quantization
+                                                g,
+                                                args.sweep_param,
+                                                batch_size,
+                                                workload["input_len"],
+                                                workload["output_len"],
+                                                result["num_requests"],
+                                                result["elapsed_time"],
+                                                result["tokens_per_second"],
+                                                result["total_tokens_per_second"],
+                                                result["requests_per_second"],
+                                                result.get("ttft_p50"),
+                                                result.get("ttft_p99"),
+                                                result.get("tpot_p50"),
+                                                result.get("tpot_p99"),
+                                                result.get("e2e_latency_p50"),
+                                                result.get("e2e_latency_p99"),
+                                                result.get("prefill_time_fraction"),
+                                                memory_plan["max_concurrent_seqs"],
+                                                vram_peak,
+                                                energy["energy_j"],
+                                                energy["joules_per_token"],
+                                                energy["tokens_per_joule"]
+                                                ]
+                                                + list(sorted_gpu_stats.values()))
+                                csvfile.flush()
+                                measurement = {key: value for key, value in result.items() if key != "outputs"}
+                                measurement.update({"batch_size": batch_size, "vram_peak": vram_peak, "theorical_size": model_data[2],
+                                                    "planned_max_concurrent_seqs": memory_plan["max_concurrent_seqs"],
+                                                    "engine_load_time": harness.load_time, **energy})
+                                measurement["tokenizer_tokens_per_second"] = result["tokens_per_second"]
+                                store_measurement(model, measurement, gpu_window_metrics("batch_sweep"), window="batch_sweep",
+                                                  params=model_data[0], quantization=model_data[1], num_gpus=g, repetition=r,
+                                                  workload=f"batch_sweep={workload_name(workload)},{args.sweep_param}={batch_size}",
+                                                  config={"sweep_param": args.sweep_param, "engine_args": vllm_bench_args_model})
+                                repetition_control.add(cell, measurement)
+                            if engine_failed:
+                                break
+                        if engine_failed:
+                            break
+                finally:
+                    harness.close()
+                g = g << 1
+
+elif (args.test_app == "ollama"):
+
+    # The columns added after the first versions go at the end, after the gpu columns
+    header = (["Model"
+              , "Params"
+              , "Quantization"
+              , "Tokens/s"
+              , "Eval_duration"
+              , "Eval_count"
+              , "Theorical_size"
+              , "Num_Gpus"
+              , "Prompt"
+              , "Response"]
+              + gpu_stats_header
+              + ["TTFT"
+              , "ITL_avg"
+              , "ITL_p50"
+              , "ITL_p99"
+              , "E2E_latency"
+              , "Load_duration"
+              , "Prompt_eval_duration"
+              , "Total_duration"
+              , "Energy_J"
+              , "J/token"
+              , "Tokens/J"])
+    output_file = results_csv_path(os.path.join(result_path, "ollama_benchmark_results.csv"), header)
+    file_exists = os.path.isfile(output_file)
+
+    with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(header)
+
+        for r in repetition_control.repetitions():
+            for model, model_data, weight, memory_plan in zip(models_name_list, model_parameters_and_quantization, models_weight, models_plan):
+                if not memory_plan["fits"]:
+                    continue
+                if all(repetition_control.done((model, prompt_idx)) for prompt_idx in range(len(prompts_list))):
+                    continue
+                warm_up_model(model, r)
+                for prompt_idx, prompt in enumerate(prompts_list):
+                    if repetition_control.done((model, prompt_idx)):
+                        continue
+                    gpu_sampler.open_window("ollama_prompt")
+                    prompt_eval_duration, prompt_eval_count, response, latency = query_ollama(prompt.strip(), model.strip(), port=ollama_host, stream=args.stream)
+                    gpu_stats = gpu_sampler.close_window("ollama_prompt")
                     # If the values are errors, we exit the program
                     if (isinstance(prompt_eval_duration, str)):
                         print(prompt_eval_count)
                         sys.exit()
                     # Calculate tokens/s
                     tokens_per_second = prompt_eval_count / (prompt_eval_duration / 1e9)
-                    gpu_stats = gpu_monitor.get_stats()
-                    sorted_gpu_stats = {key: gpu_stats[key] for key in sorted(gpu_stats.keys())}
+                    energy = energy_efficiency(gpu_sampler.get_window_energy("ollama_prompt")["energy_j"], prompt_eval_count)
+                    sorted_gpu_stats = sort_gpu_stats(gpu_stats)
                     # Write in the CSV file
                     writer.writerow([model, 
                                     model_data[0], #Params
@@ -182,93 +1259,189 @@ if (args.test_app == "ollama"):
                                     args.num_gpus,
                                     prompt,
                                     response] 
-                                    + list(sorted_gpu_stats.values()))
+                                    + list(sorted_gpu_stats.values())
+                                    + [latency["ttft"],
+                                    latency["itl_avg"],
+                                    latency["itl_p50"],
+                                    latency["itl_p99"],
+                                    latency["e2e_latency"],
+                                    latency["load_duration"],
+                                    latency["prompt_eval_duration"],
+                                    latency["total_duration"],
+                                    energy["energy_j"],
+                                    energy["joules_per_token"],
+                                    energy["tokens_per_joule"]])
+                    measurement = {"tokens_per_second": tokens_per_second, "eval_duration": prompt_eval_duration,
+                                   "eval_count": prompt_eval_count, "theorical_size": weight, **latency, **energy,
+                                   **token_accounting(model, [prompt], [response])}
+                    store_measurement(model, measurement, gpu_window_metrics("ollama_prompt"), window="ollama_prompt",
+                                      params=model_data[0], quantization=model_data[1], repetition=r,
+                                      workload=f"prompt={prompt_idx}", prompt=prompt, response=response)
+                    repetition_control.add((model, prompt_idx), measurement)
 
 
 elif args.test_app == "vLLM-bench":
-    output_file = os.path.join(result_path, "vllm_benchmark_results.csv")
+    # The columns added after the first versions go at the end, after the gpu columns
+    header = (["Model"
+              , "Params"
+              , "Quantization"
+              , "Tokens/s"
+              , "Requests/s"
+              , "Theorical Weight"
+              , "Num_Gpus"]
+              + gpu_stats_header
+              + ["Energy_J"
+              , "J/token"
+              , "Tokens/J"
+              , "Input_len"
+              , "Output_len"
+              , "Num_requests"
+              , "Input_tokens"
+              , "Output_tokens"
+              , "Elapsed_time"
+              , "Total_tokens/s"
+              , "TTFT_p50"
+              , "TTFT_p99"
+              , "TPOT_p50"
+              , "TPOT_p99"
+              , "Queue_time_p50"
+              , "Queue_time_p99"
+              , "Request_tokens/s_p50"
+              , "Prefill_tokens/s_p50"
+              , "Decode_tokens/s_p50"
+              , "Prefill_time_fraction"])
+    output_file = results_csv_path(os.path.join(result_path, "vllm_benchmark_results.csv"), header)
     file_exists = os.path.isfile(output_file)
 
     with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
         if not file_exists:
-            writer.writerow(["Model"
-                            , "Params"
-                            , "Quantization"
-                            , "Tokens/s"
-                            , "Requests/s"
-                            , "Theorical Weight"
-                            , "Num_Gpus"
-                            , "GPU_0_Power_avg"
-                            , "GPU_0_Power_max"
-                            , "GPU_0_VRAM_usage_avg"
-                            , "GPU_0_VRAM_usage_max"
-                            , "GPU_1_Power_avg"
-                            , "GPU_1_Power_max"
-                            , "GPU_1_VRAM_usage_avg"
-                            , "GPU_1_VRAM_usage_max"
-                            , "GPU_2_Power_avg"
-                            , "GPU_2_Power_max"
-                            , "GPU_2_VRAM_usage_avg"
-                            , "GPU_2_VRAM_usage_max"
-                            , "GPU_3_Power_avg"
-                            , "GPU_3_Power_max"
-                            , "GPU_3_VRAM_usage_avg"
-                            , "GPU_3_VRAM_usage_max"
-                            , "GPU_4_Power_avg"
-                            , "GPU_4_Power_max"
-                            , "GPU_4_VRAM_usage_avg"
-                            , "GPU_4_VRAM_usage_max"
-                            , "GPU_5_Power_avg"
-                            , "GPU_5_Power_max"
-                            , "GPU_5_VRAM_usage_avg"
-                            , "GPU_5_VRAM_usage_max"])
-
-        for r in range(args.rep):
-            for model in models_name_list:
-                g = 1
-                # Get bench config
-                try:
-                    vllm_bench_args_model = vllm_bench_args[model]
-                except:
-                    raise RuntimeError(f"{model} configuration not found")
-                
-                try:
-                    dtype_config = vllm_bench_args[model][vllm_bench_args_model.index("--dtype") + 1]
-                except ValueError:
-                    dtype_config = None
-                
-                print(f"Loading {model} config...")
-                model_data = get_model_info(model_name=model, dtype=dtype_config)
-                print("done!")
-
-                while g <= args.num_gpus:
-                    
-                    if model_data[2] > max_vram*g:
-                        print(f"The model {model} weight exceds avaible VRAM")
-                        print(f"model config\nParams: {model_data[0]}\tQuantization: {model_data[1]}\tWeight: {model_data[2]}GB")
+            writer.writerow(header)
+
+        for model in models_name_list:
+            # Get bench config
+            vllm_bench_args_model = vllm_bench_args[model]
+            model_data = models_info[model]
+            workloads = bench_workloads(vllm_bench_args_model, parse_workloads(args.bench_workloads) if args.bench_workloads else None)
+            if workload_requests:
+                workloads.append(engine_workload(model))
+            g = 1
+            while g <= args.num_gpus:
+                memory_plan = models_plan[model][g]
+                # Configurations that would run out of memory are skipped before launching the engine
+                if not memory_plan["fits"] or all(repetition_control.done((model, g, workload_name(workload))) for workload in workloads):
+                    g = g << 1
+                    continue
+
+                # The engine is loaded once for every repetition and workload of this number of gpus
+                harness = None
+                if args.bench_harness == "engine":
+                    print(f"Loading {model} with {g} gpus...")
+                    sys.stdout.flush()
+                    try:
+                        harness = ThroughputHarness(model, vllm_bench_args_model, tensor_parallel_size=g)
+                    except (RuntimeError, ValueError) as e:
+                        print(f"Error loading {model} with {g} gpus: {e}")
                         g = g << 1
                         continue
-                    gpu_monitor = GpuMonitor(0.1)
-                    gpu_monitor.start()
-                    # Run the bench
-                    tokens_per_second, requests_per_second = run_vllm_bench(model, num_gpus=g, config=vllm_bench_args_model)
-                    gpu_monitor.stop()
-                    # Get the gpu metrics
-                    gpu_stats = gpu_monitor.get_stats()
-                    sorted_gpu_stats = {key: gpu_stats[key] for key in sorted(gpu_stats.keys())}
-                    
-                    # Save the data
-                    writer.writerow([model, 
-                                    model_data[0], #Params
-                                    model_data[1], #Quantization
-                                    tokens_per_second,
-                                    requests_per_second,
-                                    model_data[2], # Weight
-                                    g
-                                    ] 
-                                    + list(sorted_gpu_stats.values()))
-                    g = g << 1
+                    print(f"Engine ready in {harness.load_time:.1f} s")
+                    harness.warmup(args.warmup)
+
+                engine_failed = False
+                try:
+                    for r in repetition_control.repetitions():
+                        for workload in workloads:
+                            cell = (model, g, workload_name(workload))
+                            if repetition_control.done(cell):
+                                continue
+                            gpu_sampler.open_window("vllm_bench")
+                            # Run the bench
+                            if harness is not None:
+                                try:
+                                    result = harness.run(workload["input_len"], workload["output_len"], workload["num_prompts"],
+                                                         seed=r, requests=workload.get("requests"))
+                                except Exception as e:
+                                    # e.g. torch.OutOfMemoryError or a dead engine: the engine is not reused
+                                    gpu_sampler.close_window("vllm_bench")
+                                    print(f"The benchmark of {model} with {g} gpus failed: {e}")
+                                    repetition_control.add(cell, {})
+                                    engine_failed = True
+                                    break
+                            elif workload.get("requests"):
+                                # benchmark_throughput.py only generates fixed shapes
+                                print(f"The workload {workload_name(workload)} needs --bench_harness=engine, skipping it")
+                                gpu_sampler.close_window("vllm_bench")
+                                repetition_control.add(cell, {})
+                                continue
+                            else:
+                                result = run_vllm_bench(model, vllm_bench_args_model, num_gpus=g, workload=workload)
+                            gpu_stats = gpu_sampler.close_window("vllm_bench")
+                            if result is None:
+                                print(f"The benchmark of {model} with {g} gpus failed")
+                                repetition_control.add(cell, {})
+                                continue
+                            # Get the gpu metrics
+                            sorted_gpu_stats = sort_gpu_stats(gpu_stats)
+                            if harness is not None:
+                                # The window of the engine covers only the generation
+                                generation_energy = gpu_sampler.get_window_energy("vllm_bench")
+                            else:
+                                # With the script the window also covers the model load of the subprocess, so the energy
+                                # is integrated only over the generation time that ends when the benchmark finishes
+                                window_end = gpu_sampler.get_window_bounds("vllm_bench")[1]
+                                generation_energy = gpu_sampler.get_energy_between(window_end - result["elapsed_time"], window_end)
+                            energy = energy_efficiency(generation_energy["energy_j"], result["output_tokens"])
+
+                            # Save the data
+                            writer.writerow([model,
+                                            model_data[0], #Params
+                                            model_data[1], #Quantization
+                                            result["tokens_per_second"],
+                                            result["requests_per_second"],
+                                            model_data[2], # Weight
+                                            g
+                                            ]
+                                            + list(sorted_gpu_stats.values())
+                                            + [energy["energy_j"],
+                                            energy["joules_per_token"],
+                                            energy["tokens_per_joule"],
+                                            workload["input_len"],
+                                            workload["output_len"],
+                                            result["num_requests"],
+                                            result["input_tokens"],
+                                            result["output_tokens"],
+                                            result["elapsed_time"],
+                                            result["total_tokens_per_second"],
+                                            # Per request metrics of the engine (the script does not report them)
+                                            result.get("ttft_p50"),
+                                            result.get("ttft_p99"),
+                                            result.get("tpot_p50"),
+                                            result.get("tpot_p99"),
+                                            result.get("queue_time_p50"),
+                                            result.get("queue_time_p99"),
+                                            result.get("request_tokens_per_second_p50"),
+                                            result.get("prefill_tokens_per_second_p50"),
+                                            result.get("decode_tokens_per_second_p50"),
+                                            result.get("prefill_time_fraction")])
+                            csvfile.flush()
+                            measurement = {key: value for key, value in result.items() if key != "outputs"}
+                            measurement.update({"theorical_size": model_data[2], "planned_vram_gb": memory_plan["required_gb"],
+                                                "planned_max_concurrent_seqs": memory_plan["max_concurrent_seqs"], **energy})
+                            # The tokens of vLLM are the ones of the tokenizer of the model
+                            measurement["tokenizer_tokens_per_second"] = result["tokens_per_second"]
+                            if harness is not None:
+                                measurement["engine_load_time"] = harness.load_time
+                            store_measurement(model, measurement, gpu_window_metrics("vllm_bench"), window="vllm_bench",
+                                              params=model_data[0], quantization=model_data[1], num_gpus=g, repetition=r,
+                                              workload=f"vllm_bench={workload_name(workload)}",
+                                              config={"harness": args.bench_harness, "engine_args": vllm_bench_args_model})
+                            repetition_control.add(cell, measurement)
+                        if engine_failed:
+                            break
+                finally:
+                    if harness is not None:
+                        harness.close()
+                g = g << 1
 
 
 elif args.test_app == "vLLM-inference":
@@ -279,12 +1452,14 @@ elif args.test_app == "vLLM-inference":
             sys.stdout.flush()
 
             result = subprocess.run(
-                ["python", 
-                "/home/intern02/NLHPC-AI-inference-benchmark/modules/vLLM/vllm_serve.py",
+                [sys.executable,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules", "vLLM", "vllm_serve.py"),
                 "--gpus", str(g),
                 "--model_name", model,
                 "--gpu_backend", args.gpu_backend
-                ]
+                ],
+                # vllm_serve.py saves its measurements in the same run
+                env={**os.environ, "BENCHMARK_RUN_ID": str(run_id or "")}
             )
 
             time.sleep(30)
@@ -293,4 +1468,12 @@ elif args.test_app == "vLLM-inference":
                 print("vLLM execution failed\n\n", f"Test failed for {model} with {g} gpus")
             else:
                 print("Done!")
-            
+
+gpu_sampler.stop()
+if results_store is not None:
+    results_store.close()
+tokenizer_service.close()
+
+sampling = gpu_sampler.get_timing_stats()
+print(f"GPU sampling: {sampling['achieved_hz']} Hz achieved of {sampling['target_hz']} Hz, "
+      f"{sampling['missed_ticks']} missed ticks, lag p99 {sampling['lag_p99']} s")
@@ -0,0 +1,75 @@
+import os
+import importlib
+
+# Modulo de cada backend, todos definen GpuSampler (GpuSamplerBase) y GpuMonitor
+GPU_BACKENDS = {
+    "cuda": "modules.gpu_monitor.gpu_monitor_cuda",
+    "rocm": "modules.gpu_monitor.gpu_monitor_rocm",
+    "sim": "modules.gpu_monitor.gpu_monitor_sim"
+}
+
+def detect_gpu_backend():
+    """
+    Detecta el backend de la maquina: cuda si NVML encuentra GPU's, rocm si pyamdgpuinfo las encuentra,
+    y el backend simulado en otro caso (por ejemplo, nodos solo con CPU).
+
+    Returns:
+        str: Nombre del backend
+    """
+    try:
+        from pynvml import nvmlInit, nvmlDeviceGetCount, nvmlShutdown
+        nvmlInit()
+        count = nvmlDeviceGetCount()
+        nvmlShutdown()
+        if count > 0:
+            return "cuda"
+    except Exception:
+        pass
+    try:
+        from pyamdgpuinfo import detect_gpus
+        if detect_gpus() > 0:
+            return "rocm"
+    except Exception:
+        pass
+    return "sim"
+
+def load_gpu_sampler(backend):
+    """
+    Importa el muestreador de un backend. La libreria del backend (pynvml, pyamdgpuinfo) solo se importa
+    al elegirlo, asi los demas backends funcionan sin ella.
+
+    Args:
+        backend (str): cuda, rocm, sim o auto
+    Returns:
+        class: GpuSampler del backend
+    """
+    if backend == "auto":
+        backend = detect_gpu_backend()
+    if backend not in GPU_BACKENDS:
+        raise ValueError(f"Unknown gpu backend '{backend}'. Options: {', '.join(GPU_BACKENDS)}, auto")
+    return importlib.import_module(GPU_BACKENDS[backend]).GpuSampler
+
+def visible_devices(env_vars, device_count):
+    """
+    GPU's asignadas al job segun las variables de visibilidad (CUDA_VISIBLE_DEVICES, ROCR_VISIBLE_DEVICES, ...),
+    que SLURM define al reservar GPU's. Si ninguna esta definida se usan todas las GPU's del nodo.
+
+    Args:
+        env_vars (list[str]): Variables a consultar en orden, se usa la primera definida
+        device_count (int): Cantidad de GPU's del nodo
+    Returns:
+        list[str]: Identificadores de las GPU's visibles (indices o UUIDs, tal como aparecen en la variable)
+    """
+    for env_var in env_vars:
+        value = os.getenv(env_var)
+        if value is None:
+            continue
+        devices = []
+        for device in value.split(","):
+            device = device.strip()
+            # Como en el runtime de CUDA, la lista termina en el primer identificador invalido
+            if not device or (device.lstrip("-").isdigit() and not 0 <= int(device) < device_count):
+                break
+            devices.append(device)
+        return devices
+    return [str(idx) for idx in range(device_count)]
@@ -1,70 +1,59 @@
 from pynvml import *
-import os
-import threading
-import time
+from modules.gpu_monitor.gpu_sampler import GpuSamplerBase, GpuMonitorMixin
+from modules.gpu_monitor.gpu_backends import visible_devices
 
-class GpuMonitor():
-    def __init__(self, interval=0.1):
-        """
-        Detecta las GPU's disponibles, asigna una lista de objetos gpu1, gpu2, gpuX
-
-        Monitorea el uso de los recursos en intervalos regulares (por defecto 0.1 segundos)
-
-        Args:
-            interval (float): Intervalo entre mediciones
-        """
+class GpuSampler(GpuSamplerBase):
+    """
+    Muestreador de larga duracion para GPU's NVIDIA (NVML). nvmlInit se llama una sola vez
+    al crear el muestreador y nvmlShutdown al detenerlo. Solo se muestrean las GPU's de
+    CUDA_VISIBLE_DEVICES (indices o UUIDs), o todas si no esta definida.
+    """
 
+    def _init_devices(self):
         nvmlInit()
-
-        # VARS
-        self.interval = interval
-        self.gpus = [nvmlDeviceGetHandleByIndex(i) for i in range(nvmlDeviceGetCount())]
-        self.vram_usage = [[] for _ in range(len(self.gpus))]
-        self.power = [[] for _ in range(len(self.gpus))]
-        self.running = False
-        self.thread = None
+        self.device_ids = visible_devices(["CUDA_VISIBLE_DEVICES"], nvmlDeviceGetCount())
+        gpus = [nvmlDeviceGetHandleByIndex(int(device)) if device.isdigit() else nvmlDeviceGetHandleByUUID(device)
+                for device in self.device_ids]
+        # El contador de energia total solo existe desde Volta
         try:
-            self.min_w_usage = int(os.getenv('GPU_MIN_W_USAGE') or "0")
-        except:
-            self.min_w_usage = 0
+            for gpu in gpus:
+                nvmlDeviceGetTotalEnergyConsumption(gpu)
+            self.energy_counter = True
+        except NVMLError:
+            self.energy_counter = False
+        return gpus
 
-    def start(self):
-        """Inicia el monitoreo en un hilo separado"""
-        if (self.running):
-            print("El monitoreo ya ha empezado")
-            return
-        self.running = True
-        self.thread = threading.Thread(target=self._monitor)
-        self.thread.start()
-    
-    def stop(self):
-        """Detiene el Hilo de monitoreo"""
-        self.running = False
-        if self.thread:
-            self.thread.join()
+    def _shutdown_devices(self):
         nvmlShutdown()
-    
-    def _monitor(self):
-        # Comenzamos a registrar las metricas una vez el consumo de energia sea mayor que 41 mW
-        start = False
-        while self.running:
-            if start:
-                # Registramos las metricas para cada gpu
-                for idx, gpu in enumerate(self.gpus):
-                    self.vram_usage[idx].append(nvmlDeviceGetMemoryInfo(gpu).used)
-                    self.power[idx].append(nvmlDeviceGetPowerUsage(gpu)/1000)
-            else:
-                start = any(nvmlDeviceGetPowerUsage(gpu) > self.min_w_usage for gpu in self.gpus)
-            time.sleep(self.interval)
 
-    def get_stats(self):
+    def _read_power(self, gpu):
+        return nvmlDeviceGetPowerUsage(gpu)/1000
+
+    def _read_vram(self, gpu):
+        return nvmlDeviceGetMemoryInfo(gpu).used
+
+    def _read_clock(self, gpu):
+        return nvmlDeviceGetClockInfo(gpu, NVML_CLOCK_SM)
+
+    def _read_driver_version(self):
+        version = nvmlSystemGetDriverVersion()
+        return version.decode() if isinstance(version, bytes) else version
+
+    def _read_energy(self, gpu):
+        if not self.energy_counter:
+            return None
+        return nvmlDeviceGetTotalEnergyConsumption(gpu)/1000
+
+
+class GpuMonitor(GpuMonitorMixin, GpuSampler):
+    def __init__(self, interval=0.1):
         """
-        Obtiene estadísticas agregadas (promedio, máximo) de las métricas recopiladas en _monitor.
+        Detecta las GPU's disponibles y monitorea el uso de los recursos en intervalos regulares
+        (por defecto 0.1 segundos) entre start y stop.
+
+        Para varias mediciones en un mismo job es preferible usar un unico GpuSampler con ventanas.
+
+        Args:
+            interval (float): Intervalo entre mediciones
         """
-        stats = {}
-        for idx in range(len(self.gpus)):
-            stats[f"gpu_{idx}_vram_usage_avg"] = sum(self.vram_usage[idx]) / len(self.vram_usage[idx]) if self.vram_usage[idx] else None
-            stats[f"gpu_{idx}_vram_usage_max"] = max(self.vram_usage[idx]) if self.vram_usage[idx] else None
-            stats[f"gpu_{idx}_power_avg"] = sum(self.power[idx]) / len(self.power[idx]) if self.power[idx] else None
-            stats[f"gpu_{idx}_power_max"] = max(self.power[idx]) if self.power[idx] else None
-        return stats
\ No newline at end of file
+        super().__init__(interval)
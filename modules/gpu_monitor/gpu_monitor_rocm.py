@@ -1,68 +1,47 @@
 from pyamdgpuinfo import *
-import os
-import threading
-import time
+from modules.gpu_monitor.gpu_sampler import GpuSamplerBase, GpuMonitorMixin
+from modules.gpu_monitor.gpu_backends import visible_devices
 
-class GpuMonitor():
-    def __init__(self, interval=0.1):
-        """
-        Detecta las GPU's disponibles, asigna una lista de objetos gpu1, gpu2, gpuX
+class GpuSampler(GpuSamplerBase):
+    """
+    Muestreador de larga duracion para GPU's AMD (pyamdgpuinfo). Solo se muestrean las GPU's de
+    ROCR_VISIBLE_DEVICES (o HIP_VISIBLE_DEVICES), o todas las del nodo si no estan definidas.
+    """
 
-        Monitorea el uso de los recursos en intervalos regulares (por defecto 0.1 segundos)
+    def _init_devices(self):
+        self.device_ids = visible_devices(["ROCR_VISIBLE_DEVICES", "HIP_VISIBLE_DEVICES"], detect_gpus())
+        # pyamdgpuinfo solo acepta indices
+        self.device_ids = [device for device in self.device_ids if device.isdigit()]
+        return [get_gpu(int(device)) for device in self.device_ids]
 
-        Args:
-            interval (float): Intervalo entre mediciones
-        """
-        
-        # VARS
-        self.interval = interval
-        gpus_ids = list(map(int, "0,1,2,3,4,5".split(",")))
-        self.gpus = list(map(get_gpu, gpus_ids))
-        self.vram_usage = [[] for _ in range(len(self.gpus))]
-        self.power = [[] for _ in range(len(self.gpus))]
-        self.running = False
-        self.thread = None
+    def _read_power(self, gpu):
+        return gpu.query_power()
+
+    def _read_vram(self, gpu):
+        return gpu.query_vram_usage()
+
+    def _read_clock(self, gpu):
+        # query_sclk retorna Hz
+        return gpu.query_sclk() / 1e6
+
+    def _read_driver_version(self):
+        # Version del modulo amdgpu del kernel (no existe con el driver incluido en el kernel)
         try:
-            self.min_w_usage = int(os.getenv('GPU_MIN_W_USAGE') or "0")
-        except:
-            self.min_w_usage = 0
+            with open("/sys/module/amdgpu/version", "r") as version_file:
+                return version_file.read().strip()
+        except OSError:
+            return None
 
-    def start(self):
-        """Inicia el monitoreo en un hilo separado"""
-        if (self.running):
-            print("El monitoreo ya ha empezado")
-            return
-        self.running = True
-        self.thread = threading.Thread(target=self._monitor)
-        self.thread.start()
-    
-    def stop(self):
-        """Detiene el Hilo de monitoreo"""
-        self.running = False
-        if self.thread:
-            self.thread.join()
-    
-    def _monitor(self):
-        # Comenzamos a registrar las metricas una vez el consumo de energia sea mayor que 41 mW
-        start = False
-        while self.running:
-            if start:
-                # Registramos las metricas para cada gpu
-                for id_gpu in range(len(self.gpus)):
-                    self.vram_usage[id_gpu].append(self.gpus[id_gpu].query_vram_usage())
-                    self.power[id_gpu].append(self.gpus[id_gpu].query_power())
-            else:
-                start = any(gpu.query_power() > self.min_w_usage for gpu in self.gpus)
-            time.sleep(self.interval)
 
-    def get_stats(self):
+class GpuMonitor(GpuMonitorMixin, GpuSampler):
+    def __init__(self, interval=0.1):
         """
-        Obtiene estadísticas agregadas (promedio, máximo) de las métricas recopiladas en _monitor.
+        Detecta las GPU's disponibles y monitorea el uso de los recursos en intervalos regulares
+        (por defecto 0.1 segundos) entre start y stop.
+
+        Para varias mediciones en un mismo job es preferible usar un unico GpuSampler con ventanas.
+
+        Args:
+            interval (float): Intervalo entre mediciones
         """
-        stats = {}
-        for idx in range(len(self.gpus)):
-            stats[f"gpu_{idx}_vram_usage_avg"] = sum(self.vram_usage[idx]) / len(self.vram_usage[idx]) if self.vram_usage[idx] else None
-            stats[f"gpu_{idx}_vram_usage_max"] = max(self.vram_usage[idx]) if self.vram_usage[idx] else None
-            stats[f"gpu_{idx}_power_avg"] = sum(self.power[idx]) / len(self.power[idx]) if self.power[idx] else None
-            stats[f"gpu_{idx}_power_max"] = max(self.power[idx]) if self.power[idx] else None
-        return stats
\ No newline at end of file
+        super().__init__(interval)
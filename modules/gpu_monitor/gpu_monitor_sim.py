@@ -0,0 +1,135 @@
+import os
+import csv
+import time
+import bisect
+from modules.gpu_monitor.gpu_sampler import GpuSamplerBase, GpuMonitorMixin
+from modules.gpu_monitor.gpu_backends import visible_devices
+
+class SimulatedGpu():
+    def __init__(self, idx, trace=None, idle_w=50.0, max_w=300.0, vram_bytes=16e9, period=10.0,
+                 idle_clock=300.0, max_clock=1800.0):
+        """
+        GPU simulada y determinista: sus lecturas solo dependen del tiempo transcurrido desde que se creo.
+
+        Si se entrega una traza se reproduce (en bucle) la potencia y VRAM registradas para esta GPU. Si no,
+        se usa un modelo sintetico de ciclo de trabajo: durante la primera mitad de cada periodo la GPU esta
+        ocupada (max_w, vram_bytes, max_clock) y durante la segunda mitad en reposo (idle_w, 10% de la VRAM,
+        idle_clock). Cada GPU esta desfasada un 10% del periodo respecto de la anterior.
+
+        Args:
+            idx (int): Indice de la GPU
+            trace (list[tuple]): Filas (tiempo, potencia, vram) de esta GPU ordenadas por tiempo (por defecto, modelo sintetico)
+            idle_w (float): Potencia en reposo en W
+            max_w (float): Potencia bajo carga en W
+            vram_bytes (float): VRAM usada bajo carga en bytes
+            period (float): Periodo del ciclo de trabajo en segundos
+            idle_clock (float): Frecuencia en reposo en MHz
+            max_clock (float): Frecuencia bajo carga en MHz
+        """
+        self.idx = idx
+        self.trace = trace
+        self.trace_times = [row[0] for row in trace] if trace else None
+        self.idle_w = idle_w
+        self.max_w = max_w
+        self.vram_bytes = vram_bytes
+        self.period = period
+        self.idle_clock = idle_clock
+        self.max_clock = max_clock
+        self.start = time.monotonic()
+
+    def _elapsed(self):
+        return time.monotonic() - self.start
+
+    def _trace_row(self):
+        # Ultima fila de la traza anterior al instante actual, la traza se repite al terminar
+        duration = (self.trace_times[-1] - self.trace_times[0]) or 1.0
+        elapsed = self.trace_times[0] + self._elapsed() % duration
+        return self.trace[max(bisect.bisect_right(self.trace_times, elapsed) - 1, 0)]
+
+    def busy(self):
+        phase = (self._elapsed() / self.period + 0.1 * self.idx) % 1
+        return phase < 0.5
+
+    def power(self):
+        if self.trace:
+            return self._trace_row()[1]
+        return self.max_w if self.busy() else self.idle_w
+
+    def vram(self):
+        if self.trace:
+            return self._trace_row()[2]
+        return self.vram_bytes if self.busy() else 0.1 * self.vram_bytes
+
+    def clock(self):
+        if self.trace:
+            power = self._trace_row()[1]
+            load = (power - self.idle_w) / (self.max_w - self.idle_w) if self.max_w > self.idle_w else 1.0
+            return self.idle_clock + min(max(load, 0.0), 1.0) * (self.max_clock - self.idle_clock)
+        return self.max_clock if self.busy() else self.idle_clock
+
+
+def read_gpu_trace(trace_path):
+    """
+    Lee una traza de GPU en CSV con las columnas time (s), gpu (indice), power (W) y vram (bytes).
+    Por ejemplo, las muestras de GPU_SAMPLES_SPILL o de otro job exportadas a CSV.
+
+    Returns:
+        dict: Filas (tiempo, potencia, vram) de cada GPU ordenadas por tiempo
+    """
+    traces = {}
+    with open(trace_path, 'r') as trace_file:
+        for row in csv.DictReader(trace_file):
+            traces.setdefault(int(row["gpu"]), []).append((float(row["time"]), float(row["power"]), float(row["vram"])))
+    for rows in traces.values():
+        rows.sort()
+    return traces
+
+
+class GpuSampler(GpuSamplerBase):
+    """
+    Muestreador sobre GPU's simuladas, para ejecutar y medir el benchmark completo en maquinas sin GPU.
+    Se configura con variables de entorno:
+        GPU_SIM_DEVICES: cantidad de GPU's simuladas (por defecto 1, o las de la traza)
+        GPU_SIM_TRACE: CSV con la traza a reproducir (ver read_gpu_trace)
+        GPU_SIM_IDLE_W, GPU_SIM_MAX_W, GPU_SIM_VRAM_GB, GPU_SIM_PERIOD: parametros del modelo sintetico
+    Como los backends reales, respeta CUDA_VISIBLE_DEVICES / ROCR_VISIBLE_DEVICES.
+    """
+
+    def _init_devices(self):
+        trace_path = os.getenv('GPU_SIM_TRACE')
+        traces = read_gpu_trace(trace_path) if trace_path else {}
+        try:
+            device_count = int(os.getenv('GPU_SIM_DEVICES') or max(len(traces), 1))
+            idle_w = float(os.getenv('GPU_SIM_IDLE_W') or "50")
+            max_w = float(os.getenv('GPU_SIM_MAX_W') or "300")
+            vram_bytes = float(os.getenv('GPU_SIM_VRAM_GB') or "16") * 1e9
+            period = float(os.getenv('GPU_SIM_PERIOD') or "10")
+        except:
+            device_count, idle_w, max_w, vram_bytes, period = 1, 50.0, 300.0, 16e9, 10.0
+        self.device_ids = visible_devices(["CUDA_VISIBLE_DEVICES", "ROCR_VISIBLE_DEVICES"], device_count)
+        self.device_ids = [device for device in self.device_ids if device.isdigit()]
+        return [SimulatedGpu(int(device), traces.get(int(device)), idle_w, max_w, vram_bytes, period)
+                for device in self.device_ids]
+
+    def _read_power(self, gpu):
+        return gpu.power()
+
+    def _read_vram(self, gpu):
+        return gpu.vram()
+
+    def _read_clock(self, gpu):
+        return gpu.clock()
+
+    def _read_driver_version(self):
+        return "sim"
+
+
+class GpuMonitor(GpuMonitorMixin, GpuSampler):
+    def __init__(self, interval=0.1):
+        """
+        Monitorea GPU's simuladas en intervalos regulares (por defecto 0.1 segundos) entre start y stop.
+
+        Args:
+            interval (float): Intervalo entre mediciones
+        """
+        super().__init__(interval)
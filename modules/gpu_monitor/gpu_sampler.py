@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+from modules.gpu_monitor.sample_buffer import SampleRingBuffer
+from modules.gpu_monitor.sampler_window import SamplerWindow
+from modules.metrics.streaming_stats import StreamingStats
+from modules.metrics.energy_metrics import integrate_power
+
+class GpuSamplerBase():
+    def __init__(self, interval=0.1, capacity=65536, vram_interval=None):
+        """
+        Muestreador de GPU de larga duracion: se inicia una sola vez por job y registra muestras con
+        timestamp de forma continua. Las mediciones se delimitan abriendo y cerrando ventanas con nombre,
+        que pueden solaparse (por ejemplo, requests concurrentes).
+
+        Las muestras se guardan en un buffer circular de tamaño fijo (opcionalmente volcado al archivo
+        GPU_SAMPLES_SPILL) y cada ventana mantiene agregados en linea, por lo que la memoria no crece
+        con la duracion del job y consultar las estadisticas es O(1).
+
+        Las muestras se toman sobre una grilla fija del reloj monotonico (sin deriva por la latencia de las
+        consultas): si una lectura tarda mas que el intervalo, los ticks perdidos se saltan y se contabilizan.
+        Cada muestra guarda su timestamp real. Para intervalos de pocos milisegundos con muchas GPU's la VRAM,
+        que cambia lentamente, puede leerse con un intervalo mayor (vram_interval).
+
+        Cada ventana integra ademas la energia consumida por GPU (regla del trapecio sobre las muestras, o el
+        contador de energia del driver cuando el backend lo soporta).
+
+        Las clases hijas (una por backend, ver gpu_backends) implementan _init_devices, _shutdown_devices,
+        _read_power y _read_vram, y opcionalmente _read_clock, _read_energy y _read_driver_version. _init_devices solo retorna las
+        GPU's asignadas al job y puede definir device_ids con sus identificadores.
+
+        Args:
+            interval (float): Intervalo entre mediciones
+            capacity (int): Cantidad de muestras que se mantienen en memoria
+            vram_interval (float): Intervalo entre lecturas de VRAM (por defecto, igual a interval)
+        """
+
+        # VARS
+        self.interval = interval
+        self.vram_interval = vram_interval or interval
+        self.device_ids = None
+        self.gpus = self._init_devices()
+        if self.device_ids is None:
+            self.device_ids = [str(idx) for idx in range(len(self.gpus))]
+        # Cada fila: timestamp, vram de cada GPU, potencia de cada GPU
+        self.samples = SampleRingBuffer(capacity, 1 + 2 * len(self.gpus), os.getenv('GPU_SAMPLES_SPILL'))
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        # Estadisticas del muestreo: atraso de cada muestra respecto de su tick y ticks perdidos
+        self.lag = StreamingStats()
+        self.missed_ticks = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        try:
+            self.min_w_usage = int(os.getenv('GPU_MIN_W_USAGE') or "0")
+        except:
+            self.min_w_usage = 0
+
+    def _init_devices(self):
+        """Inicializa la libreria del backend y retorna la lista de handles de las GPU's"""
+        raise NotImplementedError
+
+    def _shutdown_devices(self):
+        """Libera la libreria del backend"""
+        pass
+
+    def _read_power(self, gpu):
+        """Potencia actual de la GPU en W"""
+        raise NotImplementedError
+
+    def _read_vram(self, gpu):
+        """VRAM usada por la GPU en bytes"""
+        raise NotImplementedError
+
+    def _read_clock(self, gpu):
+        """Frecuencia actual del reloj de computo de la GPU en MHz, None si el backend no la expone"""
+        return None
+
+    def _read_driver_version(self):
+        """Version del driver de las GPU's, None si el backend no la expone"""
+        return None
+
+    def _read_energy(self, gpu):
+        """Energia acumulada por la GPU en J, None si el backend no tiene contador de energia"""
+        return None
+
+    def get_devices(self):
+        """
+        GPU's muestreadas y su frecuencia actual.
+
+        Returns:
+            list[dict]: id (identificador segun el backend) y clock_mhz de cada GPU
+        """
+        return [{"id": device, "clock_mhz": self._read_clock(gpu)} for device, gpu in zip(self.device_ids, self.gpus)]
+
+    def get_driver_version(self):
+        """Version del driver de las GPU's (None si no se conoce)"""
+        return self._read_driver_version()
+
+    def start(self):
+        """Inicia el muestreo en un hilo separado"""
+        if (self.running):
+            print("El monitoreo ya ha empezado")
+            return
+        self.running = True
+        # Hilo daemon para no bloquear la salida del programa si el benchmark termina con un error
+        self.thread = threading.Thread(target=self._monitor, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Detiene el hilo de muestreo y libera el backend"""
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.samples.close()
+        self._shutdown_devices()
+
+    def _monitor(self):
+        read_power = self._read_power
+        read_vram = self._read_vram
+        vram_usage = [read_vram(gpu) for gpu in self.gpus]
+        last_vram = time.monotonic()
+        grid_start = time.monotonic()
+        tick = 0
+        while self.running:
+            scheduled = grid_start + tick * self.interval
+            timestamp = time.monotonic()
+            # La potencia se lee primero en cada tick; la VRAM solo cuando corresponde segun vram_interval
+            power = [read_power(gpu) for gpu in self.gpus]
+            if timestamp - last_vram >= self.vram_interval:
+                vram_usage = [read_vram(gpu) for gpu in self.gpus]
+                last_vram = timestamp
+            with self.lock:
+                self.samples.append([timestamp] + vram_usage + power)
+                self.lag.add(timestamp - scheduled)
+                if self.first_timestamp is None:
+                    self.first_timestamp = timestamp
+                self.last_timestamp = timestamp
+                for window in self.windows.values():
+                    if window.end is None:
+                        window.add_sample(timestamp, vram_usage, power)
+
+            # Siguiente tick de la grilla, saltando los que ya pasaron
+            tick += 1
+            now = time.monotonic()
+            next_tick = grid_start + tick * self.interval
+            if now > next_tick:
+                missed = int((now - next_tick) / self.interval) + 1
+                self.missed_ticks += missed
+                tick += missed
+                next_tick = grid_start + tick * self.interval
+            time.sleep(next_tick - now)
+
+    def get_timing_stats(self):
+        """
+        Calidad del muestreo desde que se inicio el muestreador.
+
+        Returns:
+            dict: target_hz, achieved_hz, samples, missed_ticks y atraso de las muestras respecto de su tick
+                (lag_avg, lag_p99, lag_max en segundos)
+        """
+        with self.lock:
+            elapsed = (self.last_timestamp - self.first_timestamp) if self.first_timestamp is not None else 0
+            return {
+                "target_hz": 1 / self.interval,
+                "achieved_hz": (self.samples.total - 1) / elapsed if elapsed > 0 else None,
+                "samples": self.samples.total,
+                "missed_ticks": self.missed_ticks,
+                "lag_avg": self.lag.mean if self.lag.count else None,
+                "lag_p99": self.lag.sketch.quantile(99),
+                "lag_max": self.lag.max
+            }
+
+    def open_window(self, name):
+        """
+        Abre una ventana de medicion. Si ya existia una ventana con el mismo nombre se reemplaza.
+
+        Args:
+            name (str): Nombre de la ventana
+        """
+        energy_counters = [self._read_energy(gpu) for gpu in self.gpus]
+        with self.lock:
+            start = time.monotonic()
+            # La potencia al abrir la ventana se aproxima con la ultima muestra registrada
+            latest = self.samples.latest()
+            start_power = list(latest[1 + len(self.gpus):]) if latest is not None else [0.0] * len(self.gpus)
+            self.windows[name] = SamplerWindow(start, start_power, self.min_w_usage, energy_counters)
+
+    def close_window(self, name):
+        """
+        Cierra una ventana de medicion.
+
+        Args:
+            name (str): Nombre de la ventana
+        Returns:
+            dict: Estadisticas de la ventana (ver get_window_stats)
+        """
+        energy_counters = [self._read_energy(gpu) for gpu in self.gpus]
+        with self.lock:
+            self.windows[name].close(time.monotonic(), energy_counters)
+        return self.get_window_stats(name)
+
+    def discard_window(self, name):
+        """Elimina una ventana que ya no se va a consultar"""
+        with self.lock:
+            self.windows.pop(name, None)
+
+    def get_window_stats(self, name):
+        """
+        Obtiene estadísticas agregadas (promedio, máximo) de una ventana.
+        Si la ventana sigue abierta se obtienen con las muestras registradas hasta ahora.
+
+        Args:
+            name (str): Nombre de la ventana
+        Returns:
+            dict: gpu_{idx}_vram_usage_avg/max y gpu_{idx}_power_avg/max para cada GPU
+        """
+        with self.lock:
+            return self.windows[name].stats()
+
+    def get_window_summary(self, name):
+        """
+        Resumen completo de una ventana: cantidad de muestras, promedio, desviacion estandar, minimo,
+        maximo y percentiles 50/90/99 de la VRAM y la potencia de cada GPU.
+
+        Args:
+            name (str): Nombre de la ventana
+        Returns:
+            dict: gpu_{idx}_{vram_usage|power}_{count|avg|std|min|max|p50|p90|p99}
+        """
+        with self.lock:
+            return self.windows[name].summary()
+
+    def get_window_energy(self, name):
+        """
+        Energia consumida durante una ventana cerrada.
+
+        Args:
+            name (str): Nombre de la ventana
+        Returns:
+            dict: gpu_{idx}_energy_j para cada GPU, energy_j (total) y energy_source (counter o trapezoid)
+        """
+        with self.lock:
+            return self.windows[name].energy_stats()
+
+    def get_window_bounds(self, name):
+        """Inicio y fin (None si sigue abierta) de una ventana segun time.monotonic()"""
+        with self.lock:
+            window = self.windows[name]
+            return window.start, window.end
+
+    def get_energy_between(self, start, end):
+        """
+        Energia consumida entre start y end (segun time.monotonic()) integrando las muestras crudas
+        que siguen en el buffer. Permite medir un sub intervalo de una ventana.
+
+        Returns:
+            dict: gpu_{idx}_energy_j para cada GPU, energy_j (total) y energy_source. None si el buffer
+                ya sobrescribio muestras del intervalo (la energia quedaria subestimada)
+        """
+        with self.lock:
+            covered = self.samples.covers(start)
+        if not covered:
+            return missing_energy(len(self.gpus), start, end)
+        rows = self.get_samples(start, end)
+        timestamps = [row[0] for row in rows]
+        energy = {}
+        for idx in range(len(self.gpus)):
+            power = [row[1 + len(self.gpus) + idx] for row in rows]
+            energy[f"gpu_{idx}_energy_j"] = integrate_power(timestamps, power)
+        energy["energy_j"] = sum(energy.values())
+        energy["energy_source"] = "trapezoid"
+        return energy
+
+    def get_samples(self, start, end):
+        """
+        Muestras crudas que siguen en el buffer entre start y end (segun time.monotonic()).
+
+        Returns:
+            list: filas [timestamp, vram de cada GPU..., potencia de cada GPU...]
+        """
+        with self.lock:
+            return self.samples.rows_between(start, end)
+
+
+def sort_gpu_stats(stats):
+    """
+    Ordena las estadisticas gpu_{idx}_{metrica} por indice de GPU (numerico, gpu_2 antes que gpu_10) y
+    luego por metrica, el mismo orden de las columnas GPU_{idx}_* de los CSV.
+    """
+    def key(name):
+        _, idx, metric = name.split("_", 2)
+        return int(idx), metric
+    return {name: stats[name] for name in sorted(stats, key=key)}
+
+
+def missing_energy(num_gpus, start, end):
+    """Energia de un intervalo que ya no esta completo en el buffer: se informa None en vez de subestimarla"""
+    print(f"El buffer de muestras ya no cubre el intervalo de {end - start:.1f} s, la energia no se informa "
+          "(aumentar la capacidad del buffer o usar las ventanas del muestreador)")
+    energy = {f"gpu_{idx}_energy_j": None for idx in range(num_gpus)}
+    energy["energy_j"] = None
+    energy["energy_source"] = None
+    return energy
+
+
+class GpuMonitorMixin():
+    """
+    Interfaz del antiguo GpuMonitor (start, stop, get_stats) sobre una unica ventana del muestreador.
+    """
+
+    def start(self):
+        super().start()
+        self.open_window("monitor")
+
+    def stop(self):
+        self.close_window("monitor")
+        super().stop()
+
+    def get_stats(self):
+        return self.get_window_stats("monitor")
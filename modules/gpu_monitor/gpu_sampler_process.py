@@ -0,0 +1,200 @@
+import os
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from modules.gpu_monitor.sample_buffer import SampleRingBuffer
+from modules.gpu_monitor.gpu_sampler import missing_energy
+from modules.metrics.energy_metrics import integrate_power
+
+def _sampler_process(sampler_class, interval, vram_interval, capacity, shm_name, ready_event, commands):
+    """
+    Proceso hijo: muestrea las GPU's con sampler_class escribiendo en la memoria compartida, y atiende las
+    operaciones de ventanas que le envia el proceso principal por commands (metodo, argumentos)
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    sampler = sampler_class(interval, capacity=1, vram_interval=vram_interval)
+    sampler.samples.close()
+    # Reemplazamos el buffer privado del muestreador por el buffer compartido con el proceso principal
+    sampler.samples = SampleRingBuffer(capacity, 1 + 2 * len(sampler.gpus), os.getenv('GPU_SAMPLES_SPILL'), buffer=shm.buf)
+    sampler.start()
+    ready_event.set()
+    # Las ventanas viven en este proceso y mantienen sus agregados en linea, asi no dependen de que el
+    # buffer compartido conserve todas las muestras de una ventana larga
+    while True:
+        method, params = commands.recv()
+        if method == "stop":
+            break
+        try:
+            commands.send((True, getattr(sampler, method)(*params)))
+        except Exception as e:
+            commands.send((False, e))
+    sampler.stop()
+    commands.send(sampler.get_timing_stats())
+    sampler.samples.release()
+    shm.close()
+
+
+class GpuSamplerProcess():
+    def __init__(self, sampler_class, interval=0.1, capacity=65536, vram_interval=None):
+        """
+        Ejecuta un muestreador (GpuSampler de algun backend) en un proceso separado, para que la contencion
+        del GIL en el cliente del benchmark (parseo de JSON, tokenizacion, generador de carga asyncio) no
+        afecte la cadencia del muestreo ni las mediciones del cliente.
+
+        Las ventanas se abren y cierran en el proceso hijo, que mantiene sus agregados en linea como
+        GpuSamplerBase (con los contadores de energia del driver si existen), por lo que sus estadisticas
+        no dependen de la capacidad del buffer. El proceso hijo escribe ademas las muestras crudas en un
+        buffer circular en memoria compartida, que este proceso lee sin copiarlo (get_samples,
+        get_energy_between). Tiene la misma interfaz de ventanas que GpuSamplerBase.
+
+        Args:
+            sampler_class (class): GpuSampler del backend (gpu_monitor_cuda o gpu_monitor_rocm)
+            interval (float): Intervalo entre mediciones
+            capacity (int): Cantidad de muestras crudas en el buffer compartido
+            vram_interval (float): Intervalo entre lecturas de VRAM (por defecto, igual a interval)
+        """
+        self.sampler_class = sampler_class
+        self.interval = interval
+        self.vram_interval = vram_interval
+        self.capacity = capacity
+        self.timing_stats = None
+        self.process = None
+        # Las operaciones de ventanas se serializan sobre el pipe con el proceso hijo
+        self.lock = threading.Lock()
+
+        # Consultamos la cantidad de GPU's para dimensionar la memoria compartida
+        probe = sampler_class(interval, capacity=1)
+        self.num_gpus = len(probe.gpus)
+        self.devices = probe.get_devices()
+        self.driver_version = probe.get_driver_version()
+        probe.samples.close()
+        probe._shutdown_devices()
+
+        width = 1 + 2 * self.num_gpus
+        self.shm = shared_memory.SharedMemory(create=True, size=SampleRingBuffer.required_size(capacity, width))
+        self.samples = SampleRingBuffer(capacity, width, buffer=self.shm.buf)
+
+    def get_devices(self):
+        """GPU's muestreadas y su frecuencia al crear el muestreador (ver GpuSamplerBase.get_devices)"""
+        return self.devices
+
+    def get_driver_version(self):
+        """Version del driver de las GPU's (None si no se conoce)"""
+        return self.driver_version
+
+    def start(self):
+        """Inicia el proceso de muestreo y espera a que tome la primera muestra"""
+        if self.process is not None:
+            print("El monitoreo ya ha empezado")
+            return
+        # fork: el script principal no tiene guardia __main__, spawn lo volveria a ejecutar
+        context = multiprocessing.get_context("fork")
+        ready_event = context.Event()
+        self.commands, child_commands = context.Pipe()
+        self.process = context.Process(
+            target=_sampler_process,
+            args=(self.sampler_class, self.interval, self.vram_interval, self.capacity, self.shm.name,
+                  ready_event, child_commands),
+            daemon=True
+        )
+        self.process.start()
+        ready_event.wait()
+
+    def stop(self):
+        """Detiene el proceso de muestreo y libera la memoria compartida"""
+        if self.process is None:
+            return
+        with self.lock:
+            self.commands.send(("stop", ()))
+            self.timing_stats = self.commands.recv()
+        self.process.join()
+        self.process = None
+        self.samples.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def _call(self, method, *params):
+        # Ejecuta un metodo de ventanas del muestreador en el proceso hijo
+        with self.lock:
+            self.commands.send((method, params))
+            ok, result = self.commands.recv()
+        if not ok:
+            raise result
+        return result
+
+    def open_window(self, name):
+        """
+        Abre una ventana de medicion. Si ya existia una ventana con el mismo nombre se reemplaza.
+
+        Args:
+            name (str): Nombre de la ventana
+        """
+        self._call("open_window", name)
+
+    def close_window(self, name):
+        """
+        Cierra una ventana de medicion.
+
+        Args:
+            name (str): Nombre de la ventana
+        Returns:
+            dict: Estadisticas de la ventana (ver get_window_stats)
+        """
+        return self._call("close_window", name)
+
+    def discard_window(self, name):
+        """Elimina una ventana que ya no se va a consultar"""
+        self._call("discard_window", name)
+
+    def get_window_stats(self, name):
+        """Ver GpuSamplerBase.get_window_stats"""
+        return self._call("get_window_stats", name)
+
+    def get_window_summary(self, name):
+        """Ver GpuSamplerBase.get_window_summary"""
+        return self._call("get_window_summary", name)
+
+    def get_window_energy(self, name):
+        """Ver GpuSamplerBase.get_window_energy"""
+        return self._call("get_window_energy", name)
+
+    def get_window_bounds(self, name):
+        """Inicio y fin (None si sigue abierta) de una ventana segun time.monotonic()"""
+        return self._call("get_window_bounds", name)
+
+    def get_samples(self, start, end):
+        """Ver GpuSamplerBase.get_samples"""
+        return self.samples.rows_between(start, end)
+
+    def get_energy_between(self, start, end):
+        """Ver GpuSamplerBase.get_energy_between"""
+        if not self.samples.covers(start):
+            return missing_energy(self.num_gpus, start, end)
+        rows = self.get_samples(start, end)
+        timestamps = [row[0] for row in rows]
+        energy = {}
+        for idx in range(self.num_gpus):
+            power = [row[1 + self.num_gpus + idx] for row in rows]
+            energy[f"gpu_{idx}_energy_j"] = integrate_power(timestamps, power)
+        energy["energy_j"] = sum(energy.values())
+        energy["energy_source"] = "trapezoid"
+        return energy
+
+    def get_timing_stats(self):
+        """
+        Calidad del muestreo del proceso hijo (ver GpuSamplerBase.get_timing_stats). Las estadisticas
+        completas estan disponibles despues de stop; mientras el proceso corre solo se informa la tasa.
+        """
+        if self.timing_stats is not None:
+            return self.timing_stats
+        rows = list(self.samples.rows())
+        elapsed = rows[-1][0] - rows[0][0] if len(rows) > 1 else 0
+        return {
+            "target_hz": 1 / self.interval,
+            "achieved_hz": (len(rows) - 1) / elapsed if elapsed > 0 else None,
+            "samples": self.samples.total,
+            "missed_ticks": None,
+            "lag_avg": None,
+            "lag_p99": None,
+            "lag_max": None
+        }
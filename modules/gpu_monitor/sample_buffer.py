@@ -0,0 +1,133 @@
+import os, mmap
+from array import array
+
+class SampleRingBuffer():
+    """
+    Fixed size ring buffer of rows of float64 values (e.g. timestamp, vram and power of each gpu).
+    The memory used is capacity * width * 8 bytes no matter how long the job runs. Optionally the rows
+    that get overwritten are spilled to a binary file so the whole history can be read afterwards
+    with read_spill.
+
+    The buffer can live in memory provided by the caller (e.g. a multiprocessing SharedMemory block of
+    required_size bytes), so a sampler in another process writes the rows and the benchmark reads them
+    without copies. The first 16 bytes of that memory keep the number of rows written and the number of
+    rows whose write has started, so a reader can detect the rows overwritten while it copies them.
+
+    The spill file is truncated when the buffer is created, so it holds the samples of one job only
+    (use a different path per job, e.g. with the SLURM job id). The rows still in memory are written to it
+    on close, so after close it has the whole history.
+    """
+
+    def __init__(self, capacity, width, spill_path=None, buffer=None):
+        """
+        Args:
+            capacity (int): Maximum number of rows kept in memory.
+            width (int): Number of values of each row.
+            spill_path (str): File where the overwritten rows are written, truncated on creation (default, no spill).
+            buffer (bytes-like): Writable memory of at least required_size(capacity, width) bytes (default, private memory).
+        """
+        self.capacity = capacity
+        self.width = width
+        if buffer is None:
+            buffer = bytearray(self.required_size(capacity, width))
+        self.view = memoryview(buffer)
+        self.header = self.view[:16].cast('q')
+        self.data = self.view[16:self.required_size(capacity, width)].cast('d')
+        self.spill_file = open(spill_path, 'wb') if spill_path else None
+
+    @staticmethod
+    def required_size(capacity, width):
+        """Bytes needed by a buffer of capacity rows of width values (header included)"""
+        return 16 + 8 * capacity * width
+
+    @property
+    def total(self):
+        """Number of rows appended since the buffer was created"""
+        return self.header[0]
+
+    def append(self, row):
+        total = self.header[0]
+        pos = (total % self.capacity) * self.width
+        if self.spill_file is not None and total >= self.capacity:
+            self.spill_file.write(self.data[pos:pos + self.width])
+        self.header[1] = total + 1
+        self.data[pos:pos + self.width] = array('d', row)
+        # El contador se actualiza despues de escribir la fila: un lector no ve la fila nueva hasta que esta
+        # completa. Al dar la vuelta se sobrescribe una fila antigua, los lectores descartan esas filas (ver rows)
+        self.header[0] = total + 1
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def latest(self):
+        """Newest row, None if the buffer is empty"""
+        total = self.total
+        if total == 0:
+            return None
+        pos = ((total - 1) % self.capacity) * self.width
+        row = self.data[pos:pos + self.width].tolist()
+        return row if self._intact(total - 1) else None
+
+    def _intact(self, index):
+        """
+        True if the row index was not overwritten while it was being copied. The writer (another process)
+        marks the start of the write of the row index + capacity, which overwrites it, before writing it.
+        """
+        return self.header[1] <= index + self.capacity
+
+    def covers(self, start):
+        """True if every row since start (first value, timestamp) is still in memory"""
+        total = self.total
+        if total <= self.capacity:
+            return True
+        pos = (total % self.capacity) * self.width
+        return self.data[pos] <= start
+
+    def rows(self):
+        """
+        Iterates over copies of the rows in memory, from the oldest to the newest. The rows that the writer
+        overwrote while they were being read are skipped.
+        """
+        total = self.total
+        for i in range(total - min(total, self.capacity), total):
+            pos = (i % self.capacity) * self.width
+            row = array('d', self.data[pos:pos + self.width])
+            if self._intact(i):
+                yield row
+
+    def rows_between(self, start, end):
+        """Rows whose first value (timestamp) is between start and end"""
+        return [row.tolist() for row in self.rows() if start <= row[0] <= end]
+
+    def close(self):
+        """Writes the rows still in memory to the spill file (so it has the whole history) and closes it"""
+        if self.spill_file is not None:
+            for row in self.rows():
+                self.spill_file.write(row)
+            self.spill_file.close()
+            self.spill_file = None
+
+    def release(self):
+        """Releases the views over the buffer (needed before closing a SharedMemory block)"""
+        self.header.release()
+        self.data.release()
+        self.view.release()
+
+
+def read_spill(spill_path, width):
+    """
+    Maps a spill file in memory without copying it.
+
+    Args:
+        spill_path (str): File written by SampleRingBuffer.
+        width (int): Number of values of each row.
+    Returns:
+        memoryview: Flat view of float64 values, row i is [i * width:(i + 1) * width] (empty if nothing was spilled).
+    """
+    if os.path.getsize(spill_path) == 0:
+        # mmap no acepta archivos vacios
+        return memoryview(b"").cast('d')
+    with open(spill_path, 'rb') as spill_file:
+        mapped = mmap.mmap(spill_file.fileno(), 0, access=mmap.ACCESS_READ)
+    rows = len(mapped) // (8 * width)
+    return memoryview(mapped)[:rows * width * 8].cast('d')
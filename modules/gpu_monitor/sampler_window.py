@@ -0,0 +1,87 @@
+from modules.metrics.streaming_stats import StreamingStats
+from modules.metrics.energy_metrics import integrate_power
+
+class SamplerWindow():
+    def __init__(self, start, start_power, min_w_usage=0, energy_counters=None):
+        """
+        Ventana de medicion sobre el flujo de muestras de un muestreador. Mantiene agregados en linea de la
+        VRAM y potencia de cada GPU, y la energia integrada desde la apertura hasta el cierre.
+
+        Args:
+            start (float): Apertura de la ventana (time.monotonic())
+            start_power (list[float]): Potencia de cada GPU al abrir la ventana (ultima muestra conocida)
+            min_w_usage (float): Las estadisticas se registran desde que alguna GPU supera este consumo
+            energy_counters (list[float]): Contadores de energia del driver al abrir (None si no existen)
+        """
+        self.start = start
+        self.end = None
+        self.min_w_usage = min_w_usage
+        self.active = False
+        self.vram_usage = [StreamingStats() for _ in start_power]
+        self.power = [StreamingStats() for _ in start_power]
+        self.energy = [0.0] * len(start_power)
+        self.energy_source = "trapezoid"
+        self.last_sample = (start, list(start_power))
+        self.energy_counters = energy_counters or [None] * len(start_power)
+
+    def add_sample(self, timestamp, vram_usage, power):
+        # Integramos la potencia desde la muestra anterior (trapecio)
+        last_timestamp, last_power = self.last_sample
+        for idx in range(len(self.energy)):
+            self.energy[idx] += integrate_power([last_timestamp, timestamp], [last_power[idx], power[idx]])
+        self.last_sample = (timestamp, power)
+        # La ventana empieza a registrar cuando el consumo supera min_w_usage en alguna GPU
+        if not self.active:
+            self.active = any(gpu_power > self.min_w_usage for gpu_power in power)
+            if not self.active:
+                return
+        for idx in range(len(self.energy)):
+            self.vram_usage[idx].add(vram_usage[idx])
+            self.power[idx].add(power[idx])
+
+    def close(self, end, energy_counters=None):
+        self.end = end
+        # Completamos la integral hasta el cierre con la potencia de la ultima muestra
+        last_timestamp, last_power = self.last_sample
+        for idx in range(len(self.energy)):
+            self.energy[idx] += last_power[idx] * (end - last_timestamp)
+        # Si el driver tiene contador de energia usamos la diferencia del contador
+        energy_counters = energy_counters or [None] * len(self.energy)
+        if None not in energy_counters and None not in self.energy_counters:
+            self.energy = [end - start for start, end in zip(self.energy_counters, energy_counters)]
+            self.energy_source = "counter"
+
+    def stats(self):
+        """
+        Returns:
+            dict: gpu_{idx}_vram_usage_avg/max y gpu_{idx}_power_avg/max para cada GPU
+        """
+        stats = {}
+        for idx in range(len(self.energy)):
+            stats[f"gpu_{idx}_vram_usage_avg"] = self.vram_usage[idx].mean if self.vram_usage[idx].count else None
+            stats[f"gpu_{idx}_vram_usage_max"] = self.vram_usage[idx].max
+            stats[f"gpu_{idx}_power_avg"] = self.power[idx].mean if self.power[idx].count else None
+            stats[f"gpu_{idx}_power_max"] = self.power[idx].max
+        return stats
+
+    def summary(self):
+        """
+        Returns:
+            dict: gpu_{idx}_{vram_usage|power}_{count|avg|std|min|max|p50|p90|p99}
+        """
+        summary = {}
+        for idx in range(len(self.energy)):
+            for metric, values in (("vram_usage", self.vram_usage[idx]), ("power", self.power[idx])):
+                for stat, value in values.summary().items():
+                    summary[f"gpu_{idx}_{metric}_{stat}"] = value
+        return summary
+
+    def energy_stats(self):
+        """
+        Returns:
+            dict: gpu_{idx}_energy_j para cada GPU, energy_j (total) y energy_source (counter o trapezoid)
+        """
+        energy = {f"gpu_{idx}_energy_j": energy_j for idx, energy_j in enumerate(self.energy)}
+        energy["energy_j"] = sum(self.energy)
+        energy["energy_source"] = self.energy_source
+        return energy
@@ -0,0 +1,111 @@
+from modules.metrics.latency_stats import time_per_output_token
+
+def meets_slo(load_stats, slo):
+    """
+    Checks if an aggregated load level satisfies the SLO.
+
+    Args:
+        load_stats (dict): Output of summarize_load.
+        slo (dict): Maximum allowed value for summarize_load keys, e.g. {"ttft_p99": 2.0, "tpot_p99": 0.1}.
+            Keys with a None value are ignored.
+    Returns:
+        bool: True if no request failed and every SLO metric is below its limit.
+    """
+    if load_stats["num_errors"] > 0:
+        return False
+    for metric, limit in slo.items():
+        if limit is None:
+            continue
+        if load_stats[metric] is None or load_stats[metric] > limit:
+            return False
+    return True
+
+
+def goodput(results, elapsed_time, slo):
+    """
+    Requests per second that individually satisfied the latency limits of the SLO.
+
+    Args:
+        results (list[dict]): Per-request results of a load test.
+        elapsed_time (float): Wall time of the load test in seconds.
+        slo (dict): Same dict used by meets_slo, the ttft/tpot/latency limits are applied per request.
+    Returns:
+        float: Goodput in requests per second.
+    """
+    limits = {
+        "ttft": slo.get("ttft_p99"),
+        "tpot": slo.get("tpot_p99"),
+        "e2e_latency": slo.get("latency_p99")
+    }
+    good = 0
+    for result in results:
+        if result["error"] is not None:
+            continue
+        values = {
+            "ttft": result["ttft"],
+            "tpot": time_per_output_token(result["ttft"], result["e2e_latency"], result["eval_count"]),
+            "e2e_latency": result["e2e_latency"]
+        }
+        if all(limit is None or (values[key] is not None and values[key] <= limit) for key, limit in limits.items()):
+            good += 1
+    return good / elapsed_time if elapsed_time > 0 else 0
+
+
+def search_max_load(measure, slo, start=1, max_load=1024, integer=False, precision=0.1, max_trials=12):
+    """
+    Finds the highest load (request rate or concurrency) that still satisfies the SLO.
+    The load is doubled from `start` until the SLO is violated, then the bracket [last ok, first violation]
+    is bisected until it is narrower than `precision` (relative) or the trial budget is exhausted.
+
+    Args:
+        measure (function): measure(load) runs a load test and returns (load_stats, goodput).
+        slo (dict): SLO limits (see meets_slo).
+        start (float): First load to test.
+        max_load (float): Upper bound of the search.
+        integer (bool): True if the load must be an integer (e.g. concurrency).
+        precision (float): Relative width of the bracket to stop the bisection.
+        max_trials (int): Maximum number of load tests.
+    Returns:
+        tuple: max sustainable load (None if even `start` violates the SLO), its (load_stats, goodput),
+            list of (load, ok, load_stats, goodput) for every trial
+    """
+    trials = []
+
+    def trial(load):
+        load_stats, load_goodput = measure(load)
+        ok = meets_slo(load_stats, slo)
+        trials.append((load, ok, load_stats, load_goodput))
+        print(f"load={load}\tSLO {'ok' if ok else 'violated'}\tgoodput={load_goodput:.3f} req/s")
+        return ok
+
+    best = None
+    violated = None
+    load = start
+
+    # Bracketing: duplicamos la carga hasta violar el SLO
+    while len(trials) < max_trials:
+        if trial(load):
+            best = load
+            if load >= max_load:
+                break
+            load = min(load * 2, max_load)
+        else:
+            violated = load
+            break
+
+    # Biseccion entre la ultima carga valida y la primera que viola el SLO
+    while best is not None and violated is not None and len(trials) < max_trials:
+        if integer and violated - best <= 1:
+            break
+        if not integer and (violated - best) / best <= precision:
+            break
+        mid = (best + violated) // 2 if integer else (best + violated) / 2
+        if trial(mid):
+            best = mid
+        else:
+            violated = mid
+
+    if best is None:
+        return None, None, trials
+    best_trial = next(t for t in trials if t[0] == best and t[1])
+    return best, (best_trial[2], best_trial[3]), trials
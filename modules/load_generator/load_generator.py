@@ -0,0 +1,183 @@
+import asyncio, time, random
+import aiohttp
+from modules.metrics.latency_stats import percentile, time_per_output_token
+
+def _send(query, session, prompt):
+    """Sends a prompt of the list, the requests of a workload (dicts) also set their output length"""
+    if isinstance(prompt, dict):
+        return query(session, prompt["prompt"], max_tokens=prompt["output_len"])
+    return query(session, prompt)
+
+
+async def _closed_loop(query, prompts, concurrency, num_requests):
+    """
+    Keeps `concurrency` requests in flight until `num_requests` requests have been completed.
+    Each worker sends a new request as soon as its previous one finishes.
+    """
+    results = []
+    next_request = 0
+
+    # The connector limits the pool to the concurrency level, so every worker reuses its connection
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=None)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def worker():
+            nonlocal next_request
+            while next_request < num_requests:
+                idx = next_request
+                next_request += 1
+                result = await _send(query, session, prompts[idx % len(prompts)])
+                result["request_idx"] = idx
+                results.append(result)
+
+        init = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed_time = time.perf_counter() - init
+
+    return results, elapsed_time
+
+
+def run_concurrent_load(query, prompts, concurrency=1, num_requests=None):
+    """
+    Runs a closed-loop load test with `concurrency` requests in flight at any time.
+
+    Args:
+        query (coroutine function): Called as query(session, prompt), must return a dict with at least
+            the keys eval_count, eval_duration, e2e_latency, ttft, itl and error (see async_query_ollama).
+        prompts (list[str] | list[dict]): Prompts to send, they are reused in round robin if num_requests > len(prompts).
+            The requests of a workload (see build_workload) are sent with their output_len as max_tokens.
+        concurrency (int): Number of in-flight requests.
+        num_requests (int): Total number of requests to send (default, concurrency * len(prompts)).
+    Returns:
+        tuple: list with the result of every request, elapsed wall time in seconds
+    """
+    if num_requests is None or num_requests <= 0:
+        num_requests = concurrency * len(prompts)
+    return asyncio.run(_closed_loop(query, prompts, concurrency, num_requests))
+
+
+def arrival_schedule(rate, num_requests, arrival="poisson", seed=0):
+    """
+    Generates the send offsets (in seconds from the start of the test) of an open-loop load.
+
+    Args:
+        rate (float): Target arrival rate in requests per second.
+        num_requests (int): Number of requests to schedule.
+        arrival (str): 'poisson' (exponential inter-arrival times) or 'fixed' (constant interval).
+        seed (int): Seed of the random generator, so every run uses the same arrivals.
+    Returns:
+        list[float]: Send offset of each request.
+    """
+    if arrival not in ("poisson", "fixed"):
+        raise ValueError(f"Unknown arrival process: {arrival}")
+    rng = random.Random(seed)
+    schedule = []
+    offset = 0
+    for _ in range(num_requests):
+        schedule.append(offset)
+        offset += rng.expovariate(rate) if arrival == "poisson" else 1 / rate
+    return schedule
+
+
+async def _open_loop(query, prompts, schedule):
+    """
+    Sends each request at its scheduled offset, without waiting for the previous ones to complete.
+    """
+    # Sin limite de conexiones: en lazo abierto las llegadas no dependen de las respuestas
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def send(idx, scheduled):
+            send_lag = time.perf_counter() - scheduled
+            result = await _send(query, session, prompts[idx % len(prompts)])
+            result["request_idx"] = idx
+            result["send_lag"] = send_lag
+            return result
+
+        tasks = []
+        init = time.perf_counter()
+        for idx, offset in enumerate(schedule):
+            delay = init + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(idx, init + offset)))
+        send_window = time.perf_counter() - init
+        results = await asyncio.gather(*tasks)
+        elapsed_time = time.perf_counter() - init
+
+    return list(results), elapsed_time, send_window
+
+
+def run_open_loop_load(query, prompts, rate, num_requests, arrival="poisson", seed=0):
+    """
+    Runs an open-loop load test: requests arrive at the target rate independently of the completions,
+    so queueing in the server shows up in the latencies instead of slowing down the client.
+
+    Args:
+        query (coroutine function): Called as query(session, prompt), see run_concurrent_load.
+        prompts (list[str] | list[dict]): Prompts or workload requests to send, reused in round robin.
+        rate (float): Target arrival rate in requests per second.
+        num_requests (int): Total number of requests to send.
+        arrival (str): 'poisson' or 'fixed' (default, 'poisson').
+        seed (int): Seed for the arrival process (default, 0).
+    Returns:
+        tuple: list with the result of every request, elapsed wall time in seconds, achieved arrival rate
+    """
+    schedule = arrival_schedule(rate, num_requests, arrival, seed)
+    results, elapsed_time, send_window = asyncio.run(_open_loop(query, prompts, schedule))
+    achieved_rate = (len(schedule) - 1) / send_window if send_window > 0 else None
+    return results, elapsed_time, achieved_rate
+
+
+def summarize_load(results, elapsed_time):
+    """
+    Aggregates the per-request results of a load test.
+
+    Args:
+        results (list[dict]): Results returned by run_concurrent_load.
+        elapsed_time (float): Wall time of the whole load test in seconds.
+    Returns:
+        dict: Aggregated throughput and latency metrics for the load level.
+    """
+    ok = [result for result in results if result["error"] is None]
+    latencies = [result["e2e_latency"] for result in ok]
+    ttfts = [result["ttft"] for result in ok if result["ttft"] is not None]
+    itls = [itl for result in ok for itl in result["itl"]]
+    tpots = [time_per_output_token(result["ttft"], result["e2e_latency"], result["eval_count"]) for result in ok]
+    tpots = [tpot for tpot in tpots if tpot is not None]
+    total_tokens = sum(result["eval_count"] for result in ok)
+    # Tokens/s visto por cada request individual segun la duracion reportada por el servidor
+    per_request_tps = [result["eval_count"] / (result["eval_duration"] / 1e9) for result in ok if result["eval_duration"]]
+    # Duraciones del servidor (solo Ollama): un load_duration alto indica que el modelo se cargo durante la medicion
+    load_durations = [result["load_duration"] for result in ok if result.get("load_duration") is not None]
+    prompt_eval_durations = [result["prompt_eval_duration"] for result in ok if result.get("prompt_eval_duration") is not None]
+
+    return {
+        "num_requests": len(results),
+        "num_errors": len(results) - len(ok),
+        "elapsed_time": elapsed_time,
+        "total_tokens": total_tokens,
+        "tokens_per_second": total_tokens / elapsed_time if elapsed_time > 0 else 0,
+        "requests_per_second": len(ok) / elapsed_time if elapsed_time > 0 else 0,
+        "latency_avg": sum(latencies) / len(latencies) if latencies else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p90": percentile(latencies, 90),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies) if latencies else None,
+        "ttft_avg": sum(ttfts) / len(ttfts) if ttfts else None,
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p90": percentile(ttfts, 90),
+        "ttft_p99": percentile(ttfts, 99),
+        "itl_p50": percentile(itls, 50),
+        "itl_p99": percentile(itls, 99),
+        "tpot_p50": percentile(tpots, 50),
+        "tpot_p90": percentile(tpots, 90),
+        "tpot_p99": percentile(tpots, 99),
+        "per_request_tokens_per_second_avg": sum(per_request_tps) / len(per_request_tps) if per_request_tps else None,
+        "load_duration_max": max(load_durations) if load_durations else None,
+        "prompt_eval_duration_avg": sum(prompt_eval_durations) / len(prompt_eval_durations) if prompt_eval_durations else None
+    }
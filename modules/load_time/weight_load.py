@@ -0,0 +1,132 @@
+import os, time, mmap, shutil, tempfile
+
+# Size of the reads (and of the copies from the mmap'd files)
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Weight formats of a checkpoint, the rest of its files (config.json, tokenizer, ...) are copied by copy_checkpoint_files
+WEIGHT_EXTENSIONS = (".safetensors", ".bin", ".pt", ".pth", ".h5", ".msgpack", ".ckpt")
+
+
+def model_weight_files_hf(model_name):
+    """
+    Weight files of a model in the Hugging Face cache (HF_HOME) or in a local directory.
+
+    Args:
+        model_name (str): Hugging Face Hub model id or local directory.
+    Returns:
+        list[str]: Paths of the .safetensors files (the .bin files if there are no safetensors)
+    """
+    if os.path.isdir(model_name):
+        model_path = model_name
+    else:
+        from huggingface_hub import snapshot_download
+        model_path = snapshot_download(model_name, local_files_only=True)
+    names = sorted(os.listdir(model_path))
+    weights = [name for name in names if name.endswith(".safetensors")] or [name for name in names if name.endswith(".bin")]
+    return [os.path.join(model_path, name) for name in weights]
+
+
+def drop_page_cache(paths):
+    """
+    Evicts the pages of the files from the page cache (posix_fadvise DONTNEED), so the next read comes
+    from the storage. Pages mapped by a running process (e.g. a loaded model) are not evicted.
+
+    Args:
+        paths (list[str]): Files to evict.
+    """
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # Dirty pages are not evicted, they are written first
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def read_files(paths, use_mmap=False):
+    """
+    Reads the files completely, as a model loader does, and measures the throughput.
+
+    Args:
+        paths (list[str]): Files to read.
+        use_mmap (bool): Map the files and copy them from the mapping (the safetensors loading path)
+            instead of reading them with read() (default, False).
+    Returns:
+        dict: bytes, seconds and gb_per_second
+    """
+    buffer = bytearray(READ_BLOCK_SIZE)
+    view = memoryview(buffer)
+    total = 0
+    init = time.perf_counter()
+    for path in paths:
+        with open(path, "rb", buffering=0) as weight_file:
+            if use_mmap:
+                size = os.fstat(weight_file.fileno()).st_size
+                if size == 0:
+                    continue
+                with mmap.mmap(weight_file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    for offset in range(0, size, READ_BLOCK_SIZE):
+                        chunk = mapping[offset:offset + READ_BLOCK_SIZE]
+                        total += len(chunk)
+            else:
+                while True:
+                    read = weight_file.readinto(view)
+                    if not read:
+                        break
+                    total += read
+    seconds = time.perf_counter() - init
+    return {"bytes": total, "seconds": seconds, "gb_per_second": total / seconds / 1e9 if seconds > 0 else None}
+
+
+def stage_files(paths, stage_root, keep_names=False):
+    """
+    Copies the files to a new directory in node-local storage.
+
+    Args:
+        paths (list[str]): Files to copy.
+        stage_root (str): Node-local directory (e.g. the NVMe scratch of the node).
+        keep_names (bool): Keep the names of the files, e.g. the shards of a checkpoint that an engine loads
+            from the copy (default, False: prefixed with their index).
+    Returns:
+        tuple: directory of the copies (remove it with shutil.rmtree), paths of the copies,
+            dict with bytes, seconds and gb_per_second of the copy
+    """
+    os.makedirs(stage_root, exist_ok=True)
+    stage_dir = tempfile.mkdtemp(prefix="nlhpc_stage_", dir=stage_root)
+    staged = []
+    total = 0
+    init = time.perf_counter()
+    for idx, path in enumerate(paths):
+        # The index keeps apart files with the same name (e.g. the blobs of different models)
+        staged_path = os.path.join(stage_dir, os.path.basename(path) if keep_names else f"{idx}_{os.path.basename(path)}")
+        shutil.copyfile(path, staged_path)
+        total += os.path.getsize(staged_path)
+        staged.append(staged_path)
+    # The copy is not finished until it is on the local disk
+    for staged_path in staged:
+        fd = os.open(staged_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    seconds = time.perf_counter() - init
+    return stage_dir, staged, {"bytes": total, "seconds": seconds, "gb_per_second": total / seconds / 1e9 if seconds > 0 else None}
+
+
+def copy_checkpoint_files(model_path, stage_dir):
+    """
+    Copies the files of a checkpoint other than its weights (config.json, tokenizer, ...) next to the weights
+    staged with stage_files(keep_names=True), so an engine can load the model from the copy.
+
+    Args:
+        model_path (str): Directory of the checkpoint (e.g. its snapshot in HF_HOME).
+        stage_dir (str): Directory of the staged weights.
+    """
+    for name in os.listdir(model_path):
+        path = os.path.join(model_path, name)
+        if os.path.isfile(path) and not name.endswith(WEIGHT_EXTENSIONS):
+            shutil.copyfile(path, os.path.join(stage_dir, name))
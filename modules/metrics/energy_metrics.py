@@ -0,0 +1,31 @@
+def integrate_power(timestamps, power):
+    """
+    Energy consumed between the first and last sample using the trapezoidal rule.
+
+    Args:
+        timestamps (list[float]): Sample times in seconds.
+        power (list[float]): Power of each sample in W.
+    Returns:
+        float: Energy in joules.
+    """
+    energy_j = 0.0
+    for i in range(1, len(timestamps)):
+        energy_j += (power[i - 1] + power[i]) / 2 * (timestamps[i] - timestamps[i - 1])
+    return energy_j
+
+
+def energy_efficiency(energy_j, tokens):
+    """
+    Energy efficiency of a measurement.
+
+    Args:
+        energy_j (float): Total energy of all the gpus in joules.
+        tokens (int): Output tokens generated during the measurement.
+    Returns:
+        dict: energy_j, joules_per_token and tokens_per_joule (None if they cannot be computed)
+    """
+    return {
+        "energy_j": energy_j,
+        "joules_per_token": energy_j / tokens if energy_j is not None and tokens else None,
+        "tokens_per_joule": tokens / energy_j if energy_j and tokens is not None else None
+    }
@@ -0,0 +1,60 @@
+import math
+
+def percentile(values, q):
+    """
+    Computes the q-th percentile of a list of values using linear interpolation between closest ranks.
+
+    Args:
+        values (list[float]): Values to evaluate.
+        q (float): Percentile to compute, between 0 and 100.
+    Returns:
+        float: The percentile value, None if the list is empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def token_latency_metrics(init, token_times, end):
+    """
+    Computes the client side latencies of a single streamed request.
+
+    Args:
+        init (float): perf_counter() value when the request was sent.
+        token_times (list[float]): perf_counter() value when each token chunk was received.
+        end (float): perf_counter() value when the response was completed.
+    Returns:
+        dict: ttft, inter-token latencies (raw list and avg, p50, p90, p99, max) and e2e latency, all in seconds.
+            The token metrics are None if no token was received (e.g. non streaming requests).
+    """
+    itl = [token_times[i] - token_times[i - 1] for i in range(1, len(token_times))]
+    return {
+        "ttft": token_times[0] - init if token_times else None,
+        "itl": itl,
+        "itl_avg": sum(itl) / len(itl) if itl else None,
+        "itl_p50": percentile(itl, 50),
+        "itl_p90": percentile(itl, 90),
+        "itl_p99": percentile(itl, 99),
+        "itl_max": max(itl) if itl else None,
+        "e2e_latency": end - init
+    }
+
+
+def time_per_output_token(ttft, e2e_latency, num_tokens):
+    """
+    Average time between output tokens of a request, excluding the first one.
+
+    Args:
+        ttft (float): Time to first token in seconds.
+        e2e_latency (float): End to end latency in seconds.
+        num_tokens (int): Number of generated tokens.
+    Returns:
+        float: TPOT in seconds, None if it cannot be computed.
+    """
+    if ttft is None or num_tokens is None or num_tokens < 2:
+        return None
+    return (e2e_latency - ttft) / (num_tokens - 1)
@@ -0,0 +1,187 @@
+import math
+import random
+from modules.metrics.latency_stats import percentile
+
+def bootstrap_ci(values, confidence=0.95, resamples=2000, seed=0):
+    """
+    Percentile bootstrap confidence interval of the mean.
+
+    Args:
+        values (list[float]): Repetitions of a metric.
+        confidence (float): Confidence level of the interval.
+        resamples (int): Number of bootstrap resamples.
+        seed (int): Seed of the resampling, so the same values always give the same interval.
+    Returns:
+        tuple: (low, high), (None, None) with less than 2 values.
+    """
+    if len(values) < 2:
+        return None, None
+    rng = random.Random(seed)
+    n = len(values)
+    means = [sum(rng.choices(values, k=n)) / n for _ in range(resamples)]
+    alpha = (1 - confidence) / 2 * 100
+    return percentile(means, alpha), percentile(means, 100 - alpha)
+
+
+def permutation_test(a, b, resamples=10000, seed=0):
+    """
+    Two-sided permutation test of the difference of the means of two samples (e.g. the repetitions of a
+    cell in two runs). It does not assume normal data, which matters with few repetitions.
+
+    Args:
+        a (list[float]): First sample.
+        b (list[float]): Second sample.
+        resamples (int): Number of random permutations.
+        seed (int): Seed of the permutations.
+    Returns:
+        float: p-value, None if a sample is empty
+    """
+    if not a or not b:
+        return None
+    rng = random.Random(seed)
+    observed = abs(sum(a) / len(a) - sum(b) / len(b))
+    pooled = list(a) + list(b)
+    extreme = 0
+    for _ in range(resamples):
+        rng.shuffle(pooled)
+        left, right = pooled[:len(a)], pooled[len(a):]
+        if abs(sum(left) / len(left) - sum(right) / len(right)) >= observed - 1e-12:
+            extreme += 1
+    return (extreme + 1) / (resamples + 1)
+
+def min_p_value(n_a, n_b):
+    """
+    Smallest p-value the permutation test can give for samples of n_a and n_b values: only the observed
+    split of the pooled values (and its mirror when both samples have the same size) is as extreme as the
+    observed one. E.g. 1 vs 1 values gives 1, 5 vs 1 gives 1/6 and 3 vs 3 gives 1/10.
+    """
+    return min(1.0, (2 if n_a == n_b else 1) / math.comb(n_a + n_b, n_a))
+
+def reject_outliers(values, threshold=3.5):
+    """
+    Splits the values with the modified z-score (median and median absolute deviation), which unlike
+    the mean and std is not dragged by the outliers themselves (e.g. a first run with cold caches).
+
+    Args:
+        values (list[float]): Repetitions of a metric.
+        threshold (float): Values whose modified z-score is above this are outliers.
+    Returns:
+        tuple: (kept values, rejected values)
+    """
+    if len(values) < 3:
+        return list(values), []
+    median = percentile(values, 50)
+    mad = percentile([abs(value - median) for value in values], 50)
+    if mad == 0:
+        return list(values), []
+    kept, rejected = [], []
+    for value in values:
+        (rejected if 0.6745 * abs(value - median) / mad > threshold else kept).append(value)
+    return kept, rejected
+
+
+def repetition_summary(values, confidence=0.95, outlier_threshold=3.5, resamples=2000):
+    """
+    Summary of the repetitions of a metric after rejecting the outliers.
+
+    Args:
+        values (list[float]): Repetitions of a metric (None values are ignored).
+        confidence (float): Confidence level of the bootstrap interval.
+        outlier_threshold (float): Modified z-score threshold (None to keep every value).
+        resamples (int): Number of bootstrap resamples.
+    Returns:
+        dict: n, n_rejected, mean, std, median, ci_low, ci_high, ci_rel_width (CI width / mean) and cv (std / mean)
+    """
+    values = [value for value in values if value is not None]
+    if outlier_threshold is None:
+        kept, rejected = values, []
+    else:
+        kept, rejected = reject_outliers(values, outlier_threshold)
+    n = len(kept)
+    mean = sum(kept) / n if n else None
+    std = math.sqrt(sum((value - mean) ** 2 for value in kept) / (n - 1)) if n > 1 else None
+    ci_low, ci_high = bootstrap_ci(kept, confidence, resamples)
+    return {
+        "n": n,
+        "n_rejected": len(rejected),
+        "mean": mean,
+        "std": std,
+        "median": percentile(kept, 50),
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+        "ci_rel_width": (ci_high - ci_low) / abs(mean) if ci_low is not None and mean else None,
+        "cv": std / abs(mean) if std is not None and mean else None
+    }
+
+
+class RepetitionController():
+    """
+    Decides how many repetitions each cell (e.g. a model with a concurrency level) gets. With a fixed
+    count every cell is repeated `repetitions` times. In adaptive mode (target_ci) a cell is repeated at
+    least `repetitions` times and then until the bootstrap confidence interval of `metric` is narrower
+    than target_ci (relative to the mean) or max_repetitions is reached, so stable cells stop early and
+    noisy ones get more samples.
+    """
+
+    def __init__(self, repetitions, target_ci=None, max_repetitions=10, metric="tokens_per_second", confidence=0.95):
+        """
+        Args:
+            repetitions (int): Fixed number of repetitions, or minimum number of repetitions in adaptive mode (at least 3).
+            target_ci (float): Target relative width of the confidence interval (None, fixed repetitions).
+            max_repetitions (int): Maximum repetitions of a cell in adaptive mode.
+            metric (str | tuple[str]): Metric whose convergence is evaluated, or several metrics of which each
+                measurement uses the first one it has (e.g. the scenarios of the load_time mode).
+            confidence (float): Confidence level of the interval.
+        """
+        self.target_ci = target_ci
+        # The bootstrap of less than 3 values gives overly optimistic intervals
+        self.min_repetitions = max(repetitions, 3) if target_ci else repetitions
+        self.max_repetitions = max(max_repetitions, self.min_repetitions) if target_ci else repetitions
+        self.metric = metric
+        self.confidence = confidence
+        self.counts = {}
+        self.values = {}
+
+    def repetitions(self):
+        """Repetition numbers, until every cell visited is done or the maximum is reached"""
+        repetition = 0
+        while repetition < self.max_repetitions:
+            if repetition > 0 and all(self.done(cell) for cell in self.counts):
+                return
+            yield repetition
+            repetition += 1
+
+    def done(self, cell):
+        """True if the cell does not need more repetitions"""
+        count = self.counts.setdefault(cell, 0)
+        if count >= self.max_repetitions:
+            return True
+        if self.target_ci is None or count < self.min_repetitions:
+            return False
+        ci_rel_width = self.ci_rel_width(cell)
+        return ci_rel_width is not None and ci_rel_width <= self.target_ci
+
+    def ci_rel_width(self, cell):
+        """Relative width of the confidence interval of the cell, None with less than 2 values"""
+        return repetition_summary(self.values.get(cell, []), self.confidence)["ci_rel_width"]
+
+    def add(self, cell, metrics):
+        """
+        Registers a repetition of a cell.
+
+        Args:
+            cell (tuple): Cell of the measurement.
+            metrics (dict): Metrics of the measurement (the metric may be None, or the dict empty, e.g. failed requests).
+        """
+        names = (self.metric,) if isinstance(self.metric, str) else tuple(self.metric)
+        # A measurement without the metric would never converge and silently run to max_repetitions
+        if self.target_ci is not None and metrics and not any(name in metrics for name in names):
+            raise ValueError(f"The measurements of {cell} have no {' or '.join(names)}, choose another convergence metric")
+        self.counts[cell] = self.counts.get(cell, 0) + 1
+        value = next((metrics[name] for name in names if metrics.get(name) is not None), None)
+        if value is not None:
+            self.values.setdefault(cell, []).append(value)
+        if self.target_ci is not None and self.done(cell):
+            ci_rel_width = self.ci_rel_width(cell)
+            reason = "max repetitions reached" if ci_rel_width is None or ci_rel_width > self.target_ci else f"CI width {ci_rel_width:.2%}"
+            print(f"{cell} done after {self.counts[cell]} repetitions ({reason})")
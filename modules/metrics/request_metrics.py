@@ -0,0 +1,105 @@
+from modules.metrics.latency_stats import percentile
+
+# Per request metrics summarized by request_metrics_summary (avg, p50, p90 and p99 of each)
+REQUEST_DISTRIBUTIONS = ("queue_time", "ttft", "tpot", "e2e_latency", "request_tokens_per_second",
+                         "prefill_tokens_per_second", "decode_tokens_per_second")
+
+
+def _field(metrics, *names):
+    """First of the attributes present (and not None) in the metrics of a request"""
+    for name in names:
+        value = getattr(metrics, name, None)
+        if value is not None:
+            return value
+    return None
+
+
+def request_timings(output):
+    """
+    Engine side timings of a request of vLLM offline inference, from the metrics of its RequestOutput.
+
+    Two layouts are read: RequestMetrics of the V0 engine (arrival_time, first_scheduled_time, first_token_time,
+    time_in_queue, finished_time, last_token_time) and RequestStateStats of the V1 engine (queued_ts, scheduled_ts,
+    first_token_ts, last_token_ts and first_token_latency).
+
+    Args:
+        output (RequestOutput): Output of a request returned by LLM.generate.
+    Returns:
+        dict: prompt_tokens, output_tokens, queue_time, ttft, prefill_time, decode_time, e2e_latency, tpot,
+            request_tokens_per_second, prefill_tokens_per_second and decode_tokens_per_second (seconds and tokens/s,
+            None when they cannot be computed). None if the engine did not record the metrics of the request.
+    """
+    metrics = getattr(output, "metrics", None)
+    if metrics is None:
+        return None
+    prompt_tokens = len(output.prompt_token_ids or [])
+    output_tokens = len(output.outputs[0].token_ids)
+
+    first_token = _field(metrics, "first_token_time")
+    if first_token is not None:
+        # V0: wall clock timestamps of the engine
+        arrival = _field(metrics, "arrival_time")
+        scheduled = _field(metrics, "first_scheduled_time")
+        finished = _field(metrics, "finished_time", "last_token_time")
+        if arrival is None or finished is None:
+            return None
+        queue_time = _field(metrics, "time_in_queue")
+        if queue_time is None and scheduled is not None:
+            queue_time = scheduled - arrival
+        ttft = first_token - arrival
+        e2e_latency = finished - arrival
+    else:
+        # V1: monotonic timestamps, not comparable with arrival_time (wall clock)
+        queued = _field(metrics, "queued_ts")
+        scheduled = _field(metrics, "scheduled_ts")
+        first_token = _field(metrics, "first_token_ts")
+        finished = _field(metrics, "last_token_ts")
+        ttft = _field(metrics, "first_token_latency")
+        if first_token is None or finished is None or ttft is None:
+            return None
+        queue_time = scheduled - queued if scheduled is not None and queued is not None else None
+        e2e_latency = ttft + finished - first_token
+
+    # Prefill: from the first schedule to the first token. Decode: the rest of the tokens
+    prefill_time = first_token - scheduled if scheduled is not None else None
+    decode_time = finished - first_token
+    return {
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "queue_time": queue_time,
+        "ttft": ttft,
+        "prefill_time": prefill_time,
+        "decode_time": decode_time,
+        "e2e_latency": e2e_latency,
+        "tpot": decode_time / (output_tokens - 1) if output_tokens > 1 else None,
+        "request_tokens_per_second": output_tokens / e2e_latency if e2e_latency > 0 else None,
+        "prefill_tokens_per_second": prompt_tokens / prefill_time if prefill_time else None,
+        "decode_tokens_per_second": (output_tokens - 1) / decode_time if output_tokens > 1 and decode_time > 0 else None
+    }
+
+
+def request_metrics_summary(outputs):
+    """
+    Distributions of the per request timings of a batch of vLLM offline inference (see request_timings).
+
+    The prefill_time_fraction is the share of the service time (prefill + decode) of the requests spent in
+    the prefill: above 0.5 the configuration is prefill bound, below it is decode bound.
+
+    Args:
+        outputs (list[RequestOutput]): Outputs returned by LLM.generate.
+    Returns:
+        dict: requests_with_metrics, avg, p50, p90 and p99 of each of REQUEST_DISTRIBUTIONS (e.g. ttft_p99)
+            and prefill_time_fraction. The values are None if the engine did not record the metrics.
+    """
+    timings = [timing for timing in map(request_timings, outputs) if timing is not None]
+    summary = {"requests_with_metrics": len(timings)}
+    for metric in REQUEST_DISTRIBUTIONS:
+        values = [timing[metric] for timing in timings if timing[metric] is not None]
+        summary[f"{metric}_avg"] = sum(values) / len(values) if values else None
+        for q in (50, 90, 99):
+            summary[f"{metric}_p{q}"] = percentile(values, q)
+
+    prefill_time = sum(timing["prefill_time"] for timing in timings if timing["prefill_time"] is not None)
+    decode_time = sum(timing["decode_time"] for timing in timings if timing["prefill_time"] is not None)
+    summary["prefill_time_fraction"] = prefill_time / (prefill_time + decode_time) if prefill_time + decode_time > 0 else None
+    return summary
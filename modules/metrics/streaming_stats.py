@@ -0,0 +1,89 @@
+import math
+
+class QuantileSketch():
+    """
+    Logarithmic bucket sketch (DDSketch-like) to estimate percentiles of a stream with bounded memory.
+    Every estimated quantile is within `relative_accuracy` of the true value, and the number of buckets
+    only grows with the logarithm of the range of the values, not with the number of samples.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        # Los valores no positivos (GPU sin carga, VRAM vacia) se cuentan aparte
+        if value <= 0:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def quantile(self, q):
+        """
+        Estimates the q-th percentile (0-100) of the values added so far, None if empty.
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100 * (self.count - 1)
+        running = self.zero_count
+        if rank < running:
+            return 0.0
+        for key in sorted(self.buckets):
+            running += self.buckets[key]
+            if running > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class StreamingStats():
+    """
+    Online aggregates of a stream of values: count, mean and variance (Welford), min, max and
+    percentiles through a QuantileSketch. Adding a value and querying the stats are O(1) in the
+    number of samples.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count > 1 else None
+
+    def summary(self):
+        """
+        Returns:
+            dict: count, avg, std, min, max, p50, p90 and p99 (None if no value was added)
+        """
+        return {
+            "count": self.count,
+            "avg": self.mean if self.count else None,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.sketch.quantile(50),
+            "p90": self.sketch.quantile(90),
+            "p99": self.sketch.quantile(99)
+        }
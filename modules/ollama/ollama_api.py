@@ -1,6 +1,9 @@
-import requests, re
+import requests, re, json, time, sys, os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from modules.metrics.latency_stats import token_latency_metrics
 
-def query_ollama(prompt, model="llama2", port="127.0.0.1:11434"):
+def query_ollama(prompt, model="llama2", port="127.0.0.1:11434", stream=False):
     """
     Sends a direct query to the Ollama API and returns the token(s) along with the prompt.
 
@@ -8,8 +11,12 @@ def query_ollama(prompt, model="llama2", port="127.0.0.1:11434"):
         prompt (str): The query you wish to send to the model.
         model (str): The model to use (default, 'llama2'). 
         port (str): The port where the Ollama service runs (default, 127.0.0.1:11434).
+        stream (bool): Consume the response as a NDJSON stream to measure the client side
+            time to first token and inter-token latencies (default, False).
     Returns:
-        tuple: prompt eval duration, prompt eval count (or an error message if something goes wrong)
+        tuple: prompt eval duration, prompt eval count, response, latency metrics (see token_latency_metrics,
+            plus the server side load_duration, prompt_eval_duration and total_duration in seconds and
+            prompt_eval_count) (or an error message if something goes wrong)
     """
     # Definimos la url a consultar y los headers de la consulta
     url = f"http://{port}/api/generate"
@@ -21,29 +28,233 @@ def query_ollama(prompt, model="llama2", port="127.0.0.1:11434"):
     payload = {
         "model": model,
         "prompt": prompt,
-        "stream": False
+        "stream": stream
     }
 
     try:
+        init = time.perf_counter()
         # Realizamos la consulta a la API. Importante considerar que se nos devuelve un stream de Jsons no uno unico
-        response = requests.post(url, json=payload, headers=headers)
-        # Terminamos de monitorear la gpu una vez esta lista la respuesta
+        response = requests.post(url, json=payload, headers=headers, stream=stream)
 
         response.raise_for_status()  # Lanza una excepción para errores HTTP
 
-        # Cargamos los datos del JSON de respuesta
-        data = response.json()
+        token_times = []
+        data = {}
+        if stream:
+            # Leemos cada chunk apenas llega, registrando el instante en que se recibe cada token
+            chunks = []
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    break
+                if data.get("response"):
+                    token_times.append(time.perf_counter())
+                    chunks.append(data["response"])
+                if data.get("done"):
+                    break
+            # El ultimo chunk trae las estadisticas de la generacion
+            data["response"] = "".join(chunks)
+        else:
+            # Cargamos los datos del JSON de respuesta
+            data = response.json()
+        # Errores informados por el servidor a mitad del stream, o un stream sin el mensaje final
+        if data.get("error"):
+            raise ValueError(data["error"])
+        if stream and not data.get("done"):
+            raise ValueError("el stream termino antes del mensaje final")
+        # Terminamos de medir la latencia una vez esta lista la respuesta
+        latency = token_latency_metrics(init, token_times, time.perf_counter())
+        latency.update(ollama_durations(data))
 
         # Extraer la duración de la evaluación y la cantidad de evaluaciones
         prompt_eval_duration = data.get("eval_duration", 0)  # En Nanosegundos
         prompt_eval_count = data.get("eval_count", 0) 
         response = data["response"]
-        return prompt_eval_duration, prompt_eval_count, response
+        return prompt_eval_duration, prompt_eval_count, response, latency
 
     except requests.exceptions.RequestException as e:
         print(f"Error al hacer la solicitud: {e}")
-        print("Respuesta completa:", response.text)
-        return f"Error: {e}", f"Error: {e}", f"Error:{e}"
+        if e.response is not None:
+            print("Respuesta completa:", e.response.text)
+        return f"Error: {e}", f"Error: {e}", f"Error:{e}", f"Error:{e}"
+    except ValueError as e:
+        # JSON mal formado (json.JSONDecodeError), stream vacio o error del servidor
+        print(f"Error en la respuesta: {e}")
+        return f"Error: {e}", f"Error: {e}", f"Error:{e}", f"Error:{e}"
+
+
+def ollama_durations(data):
+    """
+    Server side durations of an Ollama response. load_duration is the time spent loading the model
+    (close to 0 if it was already in VRAM), so it separates cold and warm requests.
+
+    Args:
+        data (dict): Final JSON of /api/generate.
+    Returns:
+        dict: load_duration, prompt_eval_duration and total_duration in seconds, and prompt_eval_count
+            (None if the server did not report them)
+    """
+    return {
+        "load_duration": data["load_duration"] / 1e9 if data.get("load_duration") is not None else None,
+        "prompt_eval_duration": data["prompt_eval_duration"] / 1e9 if data.get("prompt_eval_duration") is not None else None,
+        "prompt_eval_count": data.get("prompt_eval_count"),
+        "total_duration": data["total_duration"] / 1e9 if data.get("total_duration") is not None else None
+    }
+
+
+def unload_model_ollama(model="llama2", port="127.0.0.1:11434"):
+    """
+    Unloads a model from VRAM (a generate request with keep_alive=0), so the next request loads it again.
+
+    Args:
+        model (str): the model to unload (by default: 'llama2')
+        port (str): The port where the Ollama service runs (by default, 127.0.0.1:11434).
+    Return:
+        bool: True if the model was unloaded
+    """
+    try:
+        response = requests.post(f"http://{port}/api/generate", json={"model": model, "keep_alive": 0}, timeout=60)
+        response.raise_for_status()
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"Error al descargar de memoria el modelo {model}: {e}")
+        return False
+
+
+def list_models_ollama(port="127.0.0.1:11434"):
+    """
+    Obtains the models already downloaded in the Ollama service (/api/tags).
+
+    Args:
+        port (str): The port where the Ollama service runs (by default, 127.0.0.1:11434).
+    Return:
+        set: names of the local models with their tag (e.g. 'llama2:latest')
+    """
+    try:
+        response = requests.get(f"http://{port}/api/tags", timeout=30)
+        response.raise_for_status()
+        return {model["name"] for model in response.json().get("models", [])}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error al obtener los modelos locales de ollama: {e}")
+        return set()
+
+
+def _model_tag(model):
+    """Nombre del modelo con su tag, los modelos sin tag usan 'latest'"""
+    return model if ":" in model.split("/")[-1] else f"{model}:latest"
+
+
+def pull_model_ollama(model="llama2", port="127.0.0.1:11434", retries=3, progress_interval=10):
+    """
+    Downloads a model streaming the progress of the pull. A failed pull is retried and Ollama resumes
+    the layers that were partially downloaded.
+
+    Args:
+        model (str): The model to download (default, 'llama2').
+        port (str): The port where the Ollama service runs (default, 127.0.0.1:11434).
+        retries (int): Attempts before giving up (default, 3).
+        progress_interval (float): Seconds between the progress messages (default, 10).
+    Return:
+        bool: True if the download was successful, false if not
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            response = requests.post(f"http://{port}/api/pull", json={"model": model, "stream": True}, stream=True, timeout=(30, 600))
+            response.raise_for_status()
+            last_print = 0
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise requests.exceptions.RequestException(data["error"])
+                if data.get("status") == "success":
+                    print(f"{model}: descarga completa")
+                    return True
+                # Progreso de la capa que se esta descargando
+                if data.get("total") and time.monotonic() - last_print >= progress_interval:
+                    last_print = time.monotonic()
+                    print(f"{model}: {data['status']} {data.get('completed', 0) / 1e9:.2f}/{data['total'] / 1e9:.2f} GB")
+                    sys.stdout.flush()
+            raise requests.exceptions.RequestException("the pull ended without success")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error al descargar {model} (intento {attempt}/{retries}): {e}")
+            if attempt < retries:
+                time.sleep(min(2 ** attempt, 30))
+    return False
+
+
+def prepull_models_ollama(models, port="127.0.0.1:11434", parallel=4, retries=3):
+    """
+    Downloads concurrently the models that are not in the local inventory of the Ollama service.
+    Models that are already present are not pulled again, so it can be called at the start of every job.
+
+    Args:
+        models (list[str]): Models of the test.
+        port (str): The port where the Ollama service runs (default, 127.0.0.1:11434).
+        parallel (int): Maximum number of simultaneous pulls (default, 4).
+        retries (int): Attempts of each pull (default, 3).
+    Return:
+        dict: model -> True if it is available in the service
+    """
+    local_models = list_models_ollama(port)
+    available = {model: _model_tag(model) in local_models for model in models}
+    missing = [model for model in models if not available[model]]
+    if not missing:
+        return available
+
+    print(f"Descargando {len(missing)} modelo(s) de ollama: {', '.join(missing)}")
+    sys.stdout.flush()
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+        for model, pulled in zip(missing, executor.map(partial(pull_model_ollama, port=port, retries=retries), missing)):
+            available[model] = pulled
+    return available
+
+
+def load_model_ollama(model="llama2", port="127.0.0.1:11434"):
+    """
+    Loads a model in VRAM without generating (a generate request without prompt) and measures the time
+    until it is ready.
+
+    Args:
+        model (str): the model to load (by default: 'llama2')
+        port (str): The port where the Ollama service runs (by default, 127.0.0.1:11434).
+    Return:
+        dict: time_to_ready (client side, in seconds) and the server durations of ollama_durations
+            (None if the request failed)
+    """
+    try:
+        init = time.perf_counter()
+        response = requests.post(f"http://{port}/api/generate", json={"model": model, "stream": False})
+        response.raise_for_status()
+        data = response.json()
+        return {"time_to_ready": time.perf_counter() - init, **ollama_durations(data)}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error al cargar el modelo {model}: {e}")
+        return None
+
+
+def model_blob_paths_ollama(model="llama2", port="127.0.0.1:11434"):
+    """
+    Paths of the GGUF blobs of a model in OLLAMA_MODELS, from the FROM lines of its modelfile.
+
+    Args:
+        model (str): the model to use (by default: 'llama2')
+        port (str): The port where the Ollama service runs (by default, 127.0.0.1:11434).
+    Return:
+        list[str]: paths of the blobs that exist in this node
+    """
+    try:
+        response = requests.post(f"http://{port}/api/show", json={"model": model})
+        response.raise_for_status()
+        modelfile = response.json().get("modelfile", "")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error al obtener el modelfile de {model}: {e}")
+        return []
+    paths = [line[len("FROM "):].strip() for line in modelfile.splitlines() if line.startswith("FROM ")]
+    return [path for path in paths if os.path.isfile(path)]
 
 
 def download_model_ollama(model="llama2", port="127.0.0.1:11434"):
@@ -115,6 +326,42 @@ def obtain_model_data_ollama(model="llama2", port="127.0.0.1:11434"):
         print(f"Error al obtener los datos del modelo {model}")
         return f"Error {e}", f"Error {e}"
 
+def obtain_model_geometry_ollama(model="llama2", port="127.0.0.1:11434"):
+    """
+    Obtains the layer geometry of the model from the GGUF metadata returned by /api/show.
+
+    Args:
+        model (str): the model to use (by default: 'llama2')
+        port (str): The port where the Ollama service runs (by default, 127.0.0.1:11434).
+    Return:
+        dict: num_hidden_layers, hidden_size, intermediate_size, num_attention_heads, num_key_value_heads,
+            head_dim, vocab_size and max_position_embeddings (empty if the service does not report them)
+    """
+    try:
+        response = requests.post(f"http://{port}/api/show", json={"model": model})
+        response.raise_for_status()
+        model_info = response.json().get("model_info") or {}
+    except (requests.exceptions.RequestException, ValueError):
+        print(f"Error al obtener la geometria del modelo {model}")
+        return {}
+
+    # Las llaves del GGUF tienen como prefijo la arquitectura, e.g. llama.block_count
+    arch = model_info.get("general.architecture")
+    if arch is None:
+        return {}
+    geometry = {
+        "num_hidden_layers": model_info.get(f"{arch}.block_count"),
+        "hidden_size": model_info.get(f"{arch}.embedding_length"),
+        "intermediate_size": model_info.get(f"{arch}.feed_forward_length"),
+        "num_attention_heads": model_info.get(f"{arch}.attention.head_count"),
+        "num_key_value_heads": model_info.get(f"{arch}.attention.head_count_kv"),
+        "head_dim": model_info.get(f"{arch}.attention.key_length"),
+        "vocab_size": model_info.get(f"{arch}.vocab_size"),
+        "max_position_embeddings": model_info.get(f"{arch}.context_length")
+    }
+    # Algunas arquitecturas guardan un valor por capa (e.g. el numero de kv heads), se usa el mayor
+    return {key: max(value) if isinstance(value, list) else value for key, value in geometry.items()}
+
 def calculate_theorical_weight(parameters, quantization):
     """
     Calculates the theoretical weight of a model based on the number of parameters and quantization.    
@@ -145,4 +392,20 @@ def calculate_theorical_weight(parameters, quantization):
     size_in_bytes = num_parameters * parameter_size
     size_in_gb = size_in_bytes / (1e9)  # Convertir bytes a GB
 
-    return size_in_gb
\ No newline at end of file
+    return size_in_gb
+
+def get_ollama_version(port="127.0.0.1:11434"):
+    """
+    Obtains the version of the Ollama service.
+
+    Args:
+        port (str): The port where the Ollama service runs (by default, 127.0.0.1:11434).
+    Return:
+        str: version of the service, None if it could not be obtained
+    """
+    try:
+        response = requests.get(f"http://{port}/api/version", timeout=10)
+        response.raise_for_status()
+        return response.json().get("version")
+    except (requests.exceptions.RequestException, ValueError):
+        return None
@@ -0,0 +1,75 @@
+import time, asyncio, json
+import aiohttp
+from modules.metrics.latency_stats import token_latency_metrics
+from modules.ollama.ollama_api import ollama_durations
+
+async def async_query_ollama(session, prompt, model="llama2", port="127.0.0.1:11434", stream=False, max_tokens=None):
+    """
+    Asynchronous version of query_ollama, meant to be used by the load generator with a shared
+    (pooled) aiohttp session, so several requests can be in flight against the same Ollama server.
+
+    Args:
+        session (aiohttp.ClientSession): Session whose connector holds the pooled connections.
+        prompt (str): The query you wish to send to the model.
+        model (str): The model to use (default, 'llama2').
+        port (str): The port where the Ollama service runs (default, 127.0.0.1:11434).
+        stream (bool): Consume the NDJSON stream to measure ttft and inter-token latencies (default, False).
+        max_tokens (int): Maximum number of tokens to generate, num_predict (default, None: model default).
+    Returns:
+        dict: eval_duration (ns), eval_count, response, the latency metrics of token_latency_metrics,
+            the server durations of ollama_durations and error (None if the request succeeded)
+    """
+    url = f"http://{port}/api/generate"
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream
+    }
+    if max_tokens is not None:
+        payload["options"] = {"num_predict": max_tokens}
+
+    result = {
+        "eval_duration": 0,
+        "eval_count": 0,
+        "response": "",
+        "error": None
+    }
+    result.update(ollama_durations({}))
+
+    token_times = []
+    init = time.perf_counter()
+    try:
+        async with session.post(url, json=payload) as response:
+            response.raise_for_status()
+            data = {}
+            if stream:
+                chunks = []
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        break
+                    if data.get("response"):
+                        token_times.append(time.perf_counter())
+                        chunks.append(data["response"])
+                    if data.get("done"):
+                        break
+                data["response"] = "".join(chunks)
+            else:
+                data = await response.json()
+        if data.get("error"):
+            # Error reported by the server in the middle of the stream (e.g. the model ran out of memory)
+            raise ValueError(data["error"])
+        if stream and not data.get("done"):
+            raise ValueError("the stream ended before the final message")
+        result["eval_duration"] = data.get("eval_duration", 0)  # En Nanosegundos
+        result["eval_count"] = data.get("eval_count", 0)
+        result["response"] = data.get("response", "")
+        result.update(ollama_durations(data))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        # ValueError: malformed JSON line (json.JSONDecodeError), empty stream or error message of the server
+        result["error"] = f"Error: {e}"
+
+    result.update(token_latency_metrics(init, token_times, time.perf_counter()))
+    return result
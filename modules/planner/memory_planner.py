@@ -0,0 +1,247 @@
+import math
+
+GB = 1e9
+
+# Memory outside the tensors of the model: CUDA/HIP context, allocator fragmentation and library workspaces
+BASE_OVERHEAD_GB = 1.0
+# Communication buffers of NCCL/RCCL in each rank when the model is sharded
+TP_OVERHEAD_GB = 0.5
+# Memory kept by the captured CUDA graphs (not used with --enforce-eager)
+CUDA_GRAPH_OVERHEAD_GB = 0.5
+
+# Bytes per element of the KV cache dtypes (vLLM --kv-cache-dtype and OLLAMA_KV_CACHE_TYPE)
+KV_CACHE_DTYPE_BYTES = {
+    "auto": None,
+    "float32": 4,
+    "float16": 2,
+    "f16": 2,
+    "bfloat16": 2,
+    "fp8": 1,
+    "fp8_e4m3": 1,
+    "fp8_e5m2": 1,
+    "q8_0": 1,
+    "q4_0": 0.5
+}
+
+
+def engine_config(config):
+    """
+    Normalizes the configuration of an engine, either a list of CLI arguments (vllm_config_benchmark.json)
+    or a dict (vllm_config_inference.json), to a dict with the option names in snake case.
+
+    Args:
+        config (list[str] | dict): Engine arguments.
+    Returns:
+        dict: e.g. {"max_num_seqs": "1024", "enforce_eager": True, ...}
+    """
+    if isinstance(config, dict):
+        return {key.lstrip("-").replace("-", "_"): value for key, value in config.items()}
+    normalized = {}
+    for idx, arg in enumerate(config):
+        if not arg.startswith("--"):
+            continue
+        has_value = idx + 1 < len(config) and not config[idx + 1].startswith("--")
+        normalized[arg.lstrip("-").replace("-", "_")] = config[idx + 1] if has_value else True
+    return normalized
+
+
+def _head_dim(geometry):
+    return geometry.get("head_dim") or geometry["hidden_size"] // geometry["num_attention_heads"]
+
+
+def kv_cache_bytes_per_token(geometry, kv_dtype_bytes=2, tp=1):
+    """
+    KV cache of one token in each rank: keys and values of every layer. The kv heads are sharded between
+    the tensor parallel ranks, and replicated when there are fewer kv heads than ranks.
+
+    Args:
+        geometry (dict): Layer geometry of the model (see resolve_model_metadata).
+        kv_dtype_bytes (float): Bytes per element of the cache.
+        tp (int): Tensor parallel size.
+    Returns:
+        float: Bytes per token and rank
+    """
+    kv_heads = geometry.get("num_key_value_heads") or geometry["num_attention_heads"]
+    kv_heads_per_rank = math.ceil(kv_heads / tp)
+    return 2 * geometry["num_hidden_layers"] * kv_heads_per_rank * _head_dim(geometry) * kv_dtype_bytes
+
+
+def activation_bytes(geometry, num_batched_tokens, num_seqs, dtype_bytes=2, tp=1):
+    """
+    Peak activation memory of a forward pass in each rank: the largest intermediate tensor of a layer
+    (qkv projection or gated MLP) plus the residual stream, and the float32 logits of the sampled sequences.
+
+    Args:
+        geometry (dict): Layer geometry of the model.
+        num_batched_tokens (int): Tokens processed in one forward pass (max_num_batched_tokens).
+        num_seqs (int): Sequences sampled in one step (max_num_seqs).
+        dtype_bytes (float): Bytes per element of the activations.
+        tp (int): Tensor parallel size.
+    Returns:
+        float: Bytes per rank
+    """
+    hidden = geometry["hidden_size"]
+    intermediate = geometry.get("intermediate_size") or 4 * hidden
+    kv_heads = geometry.get("num_key_value_heads") or geometry["num_attention_heads"]
+    qkv = (geometry["num_attention_heads"] + 2 * kv_heads) * _head_dim(geometry) / tp
+    mlp = 2 * intermediate / tp
+    layer_peak = num_batched_tokens * (max(qkv, mlp) + 2 * hidden) * dtype_bytes
+    logits = num_seqs * (geometry.get("vocab_size") or 0) * 4
+    return layer_peak + logits
+
+
+def plan_memory(weight_bytes, geometry, tp=1, gpu_memory_gb=64, gpu_memory_utilization=0.9, max_model_len=None,
+                max_num_seqs=256, max_num_batched_tokens=None, seq_len=None, dtype_bytes=2, kv_dtype_bytes=None,
+                enforce_eager=False):
+    """
+    Estimates the memory of each gpu when a model is served with tensor parallel size `tp`, and whether
+    the engine can start: the weights, activations, runtime overhead and the KV cache of at least one
+    sequence of max_model_len tokens must fit in gpu_memory_utilization of the gpu.
+
+    Args:
+        weight_bytes (float): Bytes of the weights of the whole model.
+        geometry (dict): Layer geometry of the model (num_hidden_layers, hidden_size, num_attention_heads, ...).
+        tp (int): Tensor parallel size (number of gpus).
+        gpu_memory_gb (float): Memory of each gpu in GB.
+        gpu_memory_utilization (float): Fraction of the gpu memory the engine may use.
+        max_model_len (int): Context length (default, max_position_embeddings of the model).
+        max_num_seqs (int): Maximum number of sequences in a batch.
+        max_num_batched_tokens (int): Tokens per forward pass (default, max(max_model_len, 2048) as vLLM).
+        seq_len (int): Tokens of a sequence of the workload (prompt + output) to estimate the concurrency
+            the KV cache allows (default, max_model_len).
+        dtype_bytes (float): Bytes per element of the activations.
+        kv_dtype_bytes (float): Bytes per element of the KV cache (default, dtype_bytes).
+        enforce_eager (bool): CUDA graphs are not captured.
+    Returns:
+        dict: tp, weights_gb, activations_gb, overhead_gb, kv_cache_min_gb, required_gb, budget_gb,
+            kv_cache_gb (left for the cache), max_concurrent_seqs, fits and reason (why it does not fit)
+    """
+    # Without the layer geometry (e.g. a config.json of an unknown architecture) only the weights and overhead are checked
+    known_geometry = all(geometry.get(field) for field in ("num_hidden_layers", "hidden_size", "num_attention_heads"))
+    max_model_len = max_model_len or geometry.get("max_position_embeddings") or 4096
+    max_num_batched_tokens = max_num_batched_tokens or max(max_model_len, 2048)
+    kv_dtype_bytes = kv_dtype_bytes or dtype_bytes
+    seq_len = min(seq_len or max_model_len, max_model_len)
+
+    weights = weight_bytes / tp
+    activations = activation_bytes(geometry, max_num_batched_tokens, max_num_seqs, dtype_bytes, tp) if known_geometry else 0
+    overhead = (BASE_OVERHEAD_GB + (TP_OVERHEAD_GB if tp > 1 else 0) + (0 if enforce_eager else CUDA_GRAPH_OVERHEAD_GB)) * GB
+    kv_per_token = kv_cache_bytes_per_token(geometry, kv_dtype_bytes, tp) if known_geometry else 0
+    kv_cache_min = kv_per_token * max_model_len
+    required = weights + activations + overhead + kv_cache_min
+    budget = gpu_memory_gb * GB * gpu_memory_utilization
+    kv_cache = max(budget - weights - activations - overhead, 0)
+
+    reason = None
+    if known_geometry and geometry["num_attention_heads"] % tp != 0:
+        reason = f"{geometry['num_attention_heads']} attention heads are not divisible by tensor parallel size {tp}"
+    elif weights + activations + overhead > budget:
+        reason = "the weights and activations do not fit"
+    elif kv_cache < kv_cache_min:
+        reason = f"the KV cache does not fit a sequence of {max_model_len} tokens"
+
+    return {
+        "tp": tp,
+        "weights_gb": weights / GB,
+        "activations_gb": activations / GB,
+        "overhead_gb": overhead / GB,
+        "kv_cache_min_gb": kv_cache_min / GB,
+        "required_gb": required / GB,
+        "budget_gb": budget / GB,
+        "kv_cache_gb": kv_cache / GB,
+        "max_concurrent_seqs": min(int(kv_cache // (kv_per_token * seq_len)), max_num_seqs) if known_geometry else None,
+        "fits": reason is None,
+        "reason": reason
+    }
+
+
+def plan_vllm(weight_bytes, geometry, config, tp=1, gpu_memory_gb=64):
+    """
+    plan_memory with the options of a vLLM configuration (see engine_config).
+
+    Args:
+        weight_bytes (float): Bytes of the weights of the whole model.
+        geometry (dict): Layer geometry of the model.
+        config (list[str] | dict): vLLM arguments (vllm_config_benchmark.json or vllm_config_inference.json format).
+        tp (int): Tensor parallel size.
+        gpu_memory_gb (float): Memory of each gpu in GB.
+    Returns:
+        dict: See plan_memory
+    """
+    config = engine_config(config)
+    dtype_bytes = 4 if str(config.get("dtype")) in ("float32", "float") else 2
+    input_len = int(config.get("input_len", 0))
+    output_len = int(config.get("output_len", 0))
+    return plan_memory(
+        weight_bytes, geometry, tp=tp, gpu_memory_gb=gpu_memory_gb,
+        gpu_memory_utilization=float(config.get("gpu_memory_utilization", 0.9)),
+        max_model_len=int(config["max_model_len"]) if "max_model_len" in config else None,
+        max_num_seqs=int(config.get("max_num_seqs", 256)),
+        max_num_batched_tokens=int(config["max_num_batched_tokens"]) if "max_num_batched_tokens" in config else None,
+        seq_len=input_len + output_len or None,
+        dtype_bytes=dtype_bytes,
+        kv_dtype_bytes=KV_CACHE_DTYPE_BYTES.get(str(config.get("kv_cache_dtype", "auto"))),
+        enforce_eager=config.get("enforce_eager") in (True, "true", "True")
+    )
+
+
+def plan_ollama(weight_bytes, geometry, num_gpus=1, gpu_memory_gb=64, num_ctx=2048, num_parallel=1, kv_cache_type="f16"):
+    """
+    Estimates the memory of each gpu when Ollama loads a model. Ollama splits the layers (weights and KV cache)
+    between the gpus, allocates the cache of num_parallel sequences of num_ctx tokens and a compute graph for
+    a batch of 512 tokens in every gpu. A model that does not fit is partly offloaded to the cpu.
+
+    Args:
+        weight_bytes (float): Bytes of the weights of the whole model.
+        geometry (dict): Layer geometry of the model (see obtain_model_geometry_ollama).
+        num_gpus (int): Number of gpus.
+        gpu_memory_gb (float): Memory of each gpu in GB.
+        num_ctx (int): Context length of each sequence (OLLAMA_CONTEXT_LENGTH).
+        num_parallel (int): Parallel sequences of the model (OLLAMA_NUM_PARALLEL).
+        kv_cache_type (str): OLLAMA_KV_CACHE_TYPE (f16, q8_0 or q4_0).
+    Returns:
+        dict: See plan_memory
+    """
+    known_geometry = all(geometry.get(field) for field in ("num_hidden_layers", "hidden_size", "num_attention_heads"))
+    kv_dtype_bytes = KV_CACHE_DTYPE_BYTES.get(kv_cache_type) or 2
+    kv_cache_min = kv_cache_bytes_per_token(geometry, kv_dtype_bytes) * num_ctx * num_parallel if known_geometry else 0
+    weights = weight_bytes / num_gpus
+    activations = activation_bytes(geometry, 512, num_parallel) if known_geometry else 0
+    overhead = (BASE_OVERHEAD_GB + (TP_OVERHEAD_GB if num_gpus > 1 else 0)) * GB
+    budget = gpu_memory_gb * GB
+    required = weights + activations + overhead + kv_cache_min / num_gpus
+    kv_cache = max(budget - weights - activations - overhead, 0)
+
+    return {
+        "tp": num_gpus,
+        "weights_gb": weights / GB,
+        "activations_gb": activations / GB,
+        "overhead_gb": overhead / GB,
+        "kv_cache_min_gb": kv_cache_min / num_gpus / GB,
+        "required_gb": required / GB,
+        "budget_gb": budget / GB,
+        "kv_cache_gb": kv_cache / GB,
+        "max_concurrent_seqs": None,
+        "fits": required <= budget,
+        "reason": None if required <= budget else "the model would be partly offloaded to the cpu"
+    }
+
+
+def min_viable_gpus(plan, max_gpus):
+    """
+    Smallest power of two number of gpus (the tensor parallel sizes tested by the benchmark) whose plan fits.
+
+    Args:
+        plan (callable): Called as plan(tp), returns the dict of plan_memory.
+        max_gpus (int): Number of gpus available.
+    Returns:
+        tuple: number of gpus (None if no size fits), plan of that size (or of max_gpus if none fits)
+    """
+    tp = 1
+    last_plan = None
+    while tp <= max_gpus:
+        last_plan = plan(tp)
+        if last_plan["fits"]:
+            return tp, last_plan
+        tp = tp << 1
+    return None, last_plan
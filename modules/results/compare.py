@@ -0,0 +1,76 @@
+from modules.metrics.repetition_stats import permutation_test, min_p_value, reject_outliers
+from modules.results.report import group_cells, REPORT_METRICS, CELL_FIELDS
+
+# Direction of each metric, the rest are not classified as regressions or improvements
+HIGHER_IS_BETTER = {"tokens_per_second", "requests_per_second", "tokens_per_joule", "goodput", "max_load",
+                    "per_request_tokens_per_second_avg", "gb_per_second", "request_tokens_per_second_p50",
+                    "prefill_tokens_per_second_p50", "decode_tokens_per_second_p50", "tokenizer_tokens_per_second"}
+LOWER_IS_BETTER = {"latency_avg", "latency_p50", "latency_p90", "latency_p99", "ttft_avg", "ttft_p50", "ttft_p90",
+                   "ttft_p99", "tpot_p50", "tpot_p90", "tpot_p99", "itl_p50", "itl_p99", "e2e_latency", "energy_j",
+                   "joules_per_token", "ttft", "load_duration", "prompt_eval_duration", "total_duration", "time_to_ready",
+                   "queue_time_p50", "queue_time_p99"}
+
+
+def compare_measurements(baseline, candidate, metrics=None, alpha=0.05, min_change=0.02, outlier_threshold=3.5, resamples=10000):
+    """
+    Compares the cells measured in a baseline and a candidate run with a permutation test.
+
+    A difference is a regression (or improvement) when it is statistically significant (p-value below alpha),
+    goes in the bad (or good) direction of the metric and is larger than min_change relative to the baseline,
+    so tiny but significant changes of very stable cells are not reported. When the samples are too small
+    for the test to ever reach alpha (e.g. one repetition per run), the cell is reported as having
+    insufficient repetitions instead of unchanged.
+
+    Args:
+        baseline (list[dict]): Measurements of the baseline (ResultsStore.query of one or several runs).
+        candidate (list[dict]): Measurements of the candidate run.
+        metrics (list[str]): Metrics to compare (default, REPORT_METRICS).
+        alpha (float): Significance level.
+        min_change (float): Minimum relative change to report.
+        outlier_threshold (float): Modified z-score used to reject outliers of both samples (None to keep all).
+        resamples (int): Permutations of the test.
+    Returns:
+        list[dict]: One row per cell and metric present in both runs with the CELL_FIELDS, metric, n_baseline,
+            n_candidate, baseline_mean, candidate_mean, change (relative), p_value and status
+            (regression, improvement, changed, unchanged or insufficient repetitions)
+    """
+    baseline_cells = group_cells(baseline)
+    rows = []
+    for cell, candidate_measurements in group_cells(candidate).items():
+        if cell not in baseline_cells:
+            continue
+        for metric in metrics or REPORT_METRICS:
+            baseline_values = [m.get(metric) for m in baseline_cells[cell] if m.get(metric) is not None]
+            candidate_values = [m.get(metric) for m in candidate_measurements if m.get(metric) is not None]
+            if outlier_threshold is not None:
+                baseline_values = reject_outliers(baseline_values, outlier_threshold)[0]
+                candidate_values = reject_outliers(candidate_values, outlier_threshold)[0]
+            if not baseline_values or not candidate_values:
+                continue
+            baseline_mean = sum(baseline_values) / len(baseline_values)
+            candidate_mean = sum(candidate_values) / len(candidate_values)
+            change = (candidate_mean - baseline_mean) / abs(baseline_mean) if baseline_mean else None
+            p_value = permutation_test(baseline_values, candidate_values, resamples)
+            status = "unchanged"
+            if min_p_value(len(baseline_values), len(candidate_values)) >= alpha:
+                status = "insufficient repetitions"
+            elif change is not None and p_value < alpha and abs(change) >= min_change:
+                if metric in HIGHER_IS_BETTER:
+                    status = "improvement" if change > 0 else "regression"
+                elif metric in LOWER_IS_BETTER:
+                    status = "improvement" if change < 0 else "regression"
+                else:
+                    status = "changed"
+            row = dict(zip(CELL_FIELDS, cell))
+            row.update({
+                "metric": metric,
+                "n_baseline": len(baseline_values),
+                "n_candidate": len(candidate_values),
+                "baseline_mean": baseline_mean,
+                "candidate_mean": candidate_mean,
+                "change": change,
+                "p_value": p_value,
+                "status": status
+            })
+            rows.append(row)
+    return rows
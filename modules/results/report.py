@@ -0,0 +1,74 @@
+from modules.metrics.repetition_stats import repetition_summary
+
+# Metrics reported by default (the ones present in each measurement are used)
+REPORT_METRICS = [
+    "tokens_per_second",
+    "tokenizer_tokens_per_second",
+    "requests_per_second",
+    "latency_p50",
+    "latency_p99",
+    "ttft_p99",
+    "tpot_p99",
+    "e2e_latency",
+    "ttft",
+    "load_duration",
+    "gb_per_second",
+    "time_to_ready",
+    "energy_j",
+    "joules_per_token",
+    "tokens_per_joule",
+    "goodput",
+    "max_load",
+    "vram_peak"
+]
+
+# A cell groups the repetitions of the same configuration
+CELL_FIELDS = ("test_app", "load_mode", "model", "quantization", "num_gpus", "workload")
+
+
+def group_cells(measurements, skip_first=False):
+    """
+    Groups the measurements of a results store by cell (CELL_FIELDS).
+
+    Args:
+        measurements (list[dict]): Rows of ResultsStore.query.
+        skip_first (bool): Drop the first repetition (repetition 0) of every cell, e.g. to discard cold runs.
+    Returns:
+        dict: {cell (tuple of CELL_FIELDS values): [measurements]}
+    """
+    cells = {}
+    for measurement in measurements:
+        if skip_first and measurement.get("repetition") in (0, "0"):
+            continue
+        cell = tuple(measurement.get(field) for field in CELL_FIELDS)
+        cells.setdefault(cell, []).append(measurement)
+    return cells
+
+
+def summarize_cells(measurements, metrics=None, confidence=0.95, outlier_threshold=3.5, noisy_cv=0.05, skip_first=False):
+    """
+    Statistical summary of the repetitions of every cell and metric.
+
+    Args:
+        measurements (list[dict]): Rows of ResultsStore.query.
+        metrics (list[str]): Metrics to summarize (default, REPORT_METRICS).
+        confidence (float): Confidence level of the bootstrap intervals.
+        outlier_threshold (float): Modified z-score above which a repetition is rejected (None to keep all).
+        noisy_cv (float): Cells whose coefficient of variation is above this are flagged as noisy.
+        skip_first (bool): Drop the first repetition of every cell.
+    Returns:
+        list[dict]: One row per cell and metric with the CELL_FIELDS, metric, noisy and the fields of repetition_summary
+    """
+    rows = []
+    for cell, cell_measurements in group_cells(measurements, skip_first).items():
+        for metric in metrics or REPORT_METRICS:
+            values = [measurement.get(metric) for measurement in cell_measurements]
+            if all(value is None for value in values):
+                continue
+            summary = repetition_summary(values, confidence, outlier_threshold)
+            row = dict(zip(CELL_FIELDS, cell))
+            row["metric"] = metric
+            row.update(summary)
+            row["noisy"] = summary["cv"] is not None and summary["cv"] > noisy_cv
+            rows.append(row)
+    return rows
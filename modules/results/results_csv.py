@@ -0,0 +1,28 @@
+import os, csv
+
+
+def results_csv_path(path, header):
+    """
+    CSV file where the rows of a header are appended. The result files are appended by every job, so when
+    an existing file has another header (columns added by a newer version of the benchmark, or another
+    number of gpus) the rows go to a versioned file (name_v2.csv, name_v3.csv, ...) instead of mixing
+    two column layouts in the same file.
+
+    Args:
+        path (str): Path of the results file.
+        header (list[str]): Columns of the rows to write.
+    Returns:
+        str: path of the file whose header matches, or that does not exist yet
+    """
+    root, ext = os.path.splitext(path)
+    version = 1
+    candidate = path
+    while os.path.isfile(candidate):
+        with open(candidate, "r", newline="", encoding="utf-8") as csvfile:
+            if next(csv.reader(csvfile), None) in (None, list(header)):
+                break
+        version += 1
+        candidate = f"{root}_v{version}{ext}"
+    if candidate != path:
+        print(f"{path} has another column layout, the results are saved in {candidate}")
+    return candidate
@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import time
+import zlib
+import socket
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    hostname TEXT,
+    job_id TEXT,
+    git_sha TEXT,
+    git_dirty INTEGER,
+    container_image TEXT,
+    vllm_version TEXT,
+    ollama_version TEXT,
+    driver_version TEXT,
+    gpu_backend TEXT,
+    python_version TEXT,
+    config_hash TEXT,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER REFERENCES runs(id),
+    created_at REAL NOT NULL,
+    job_id TEXT,
+    hostname TEXT,
+    test_app TEXT NOT NULL,
+    load_mode TEXT,
+    model TEXT NOT NULL,
+    params TEXT,
+    quantization TEXT,
+    num_gpus INTEGER,
+    repetition INTEGER,
+    workload TEXT,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    measurement_id INTEGER NOT NULL REFERENCES measurements(id),
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (measurement_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS gpu_metrics (
+    measurement_id INTEGER NOT NULL REFERENCES measurements(id),
+    gpu INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (measurement_id, gpu, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS gpu_samples (
+    measurement_id INTEGER NOT NULL REFERENCES measurements(id),
+    timestamp REAL NOT NULL,
+    gpu INTEGER NOT NULL,
+    power REAL,
+    vram REAL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    measurement_id INTEGER PRIMARY KEY REFERENCES measurements(id),
+    prompt BLOB,
+    response BLOB
+);
+CREATE INDEX IF NOT EXISTS runs_by_config ON runs (config_hash, id);
+CREATE INDEX IF NOT EXISTS measurements_lookup ON measurements (test_app, model, num_gpus);
+CREATE INDEX IF NOT EXISTS metrics_by_name ON metrics (name, measurement_id);
+CREATE INDEX IF NOT EXISTS gpu_samples_by_measurement ON gpu_samples (measurement_id);
+"""
+
+MEASUREMENT_FIELDS = ("test_app", "load_mode", "model", "params", "quantization", "num_gpus", "repetition", "workload", "run_id")
+
+COLUMN_TYPES = {"num_gpus": "INTEGER", "repetition": "INTEGER", "run_id": "INTEGER"}
+
+RUN_FIELDS = ("hostname", "job_id", "git_sha", "git_dirty", "container_image", "vllm_version", "ollama_version",
+              "driver_version", "gpu_backend", "python_version", "config_hash", "config")
+
+GPU_KEY = re.compile(r"gpu_(\d+)_(.+)")
+
+def _compress(text):
+    return zlib.compress(text.encode("utf-8")) if text is not None else None
+
+def _decompress(blob):
+    return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class ResultsStore():
+    def __init__(self, db_path, timeout=120):
+        """
+        Base de datos de resultados en SQLite: una fila por medicion en measurements, sus metricas en
+        formato largo (metrics), las metricas y muestras de cada GPU en formato largo (gpu_metrics,
+        gpu_samples), por lo que sirve para cualquier cantidad de GPU's, y las respuestas de los modelos
+        aparte y comprimidas con zlib (responses).
+
+        Varios jobs de SLURM pueden escribir en la misma base a la vez: cada medicion se inserta en una
+        unica transaccion (BEGIN IMMEDIATE) y los escritores esperan el lock hasta timeout segundos. Se usa
+        el journal de rollback (no WAL) porque WAL necesita memoria compartida entre los procesos.
+        Compartir la base entre nodos depende de los locks POSIX (fcntl) del sistema de archivos: sobre NFS
+        no son confiables y escrituras concurrentes de varios nodos pueden corromper la base. En ese caso
+        conviene usar una base por job (RESULTS_DB) o un sistema de archivos con locks coherentes.
+
+        Args:
+            db_path (str): Archivo de la base de datos
+            timeout (float): Segundos que un escritor espera a que se libere el lock
+        """
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        # CREATE ... IF NOT EXISTS, varios jobs pueden crear la base a la vez
+        self.connection.executescript(SCHEMA)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self):
+        # Bases creadas por versiones anteriores del benchmark
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(measurements)")]
+        for field in MEASUREMENT_FIELDS:
+            if field not in columns:
+                try:
+                    self.connection.execute(f"ALTER TABLE measurements ADD COLUMN {field} {COLUMN_TYPES.get(field, 'TEXT')}")
+                except sqlite3.OperationalError:
+                    # Otro job agrego la columna al mismo tiempo
+                    pass
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+    def start_run(self, run_metadata):
+        """
+        Registra una ejecucion del benchmark, las mediciones que se guarden con su run_id quedan asociadas a ella.
+
+        Args:
+            run_metadata (dict): Metadatos de la ejecucion (ver run_metadata.collect_run_metadata)
+        Returns:
+            int: id de la ejecucion
+        """
+        values = [run_metadata.get(field) for field in RUN_FIELDS]
+        values[RUN_FIELDS.index("config")] = json.dumps(run_metadata.get("config"), sort_keys=True, default=str)
+        with self._transaction():
+            cursor = self.connection.execute(
+                f"INSERT INTO runs (started_at, {', '.join(RUN_FIELDS)}) VALUES (?, {', '.join('?' * len(RUN_FIELDS))})",
+                [time.time()] + values
+            )
+        return cursor.lastrowid
+
+    def get_runs(self, config_hash=None, before=None, limit=None):
+        """
+        Ejecuciones registradas, de la mas reciente a la mas antigua.
+
+        Args:
+            config_hash (str): Solo las ejecuciones con esta configuracion
+            before (int): Solo las ejecuciones anteriores a este id
+            limit (int): Cantidad maxima de ejecuciones
+        Returns:
+            list[dict]: Campos de cada ejecucion
+        """
+        conditions, values = [], []
+        if config_hash is not None:
+            conditions.append("config_hash = ?")
+            values.append(config_hash)
+        if before is not None:
+            conditions.append("id < ?")
+            values.append(before)
+        where = " AND ".join(conditions) or "1"
+        query = f"SELECT * FROM runs WHERE {where} ORDER BY id DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        cursor = self.connection.execute(query, values)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def add_measurement(self, test_app, model, metrics, gpu_stats=None, gpu_samples=None, prompt=None,
+                        response=None, config=None, **fields):
+        """
+        Guarda una medicion de forma atomica.
+
+        Args:
+            test_app (str): Aplicacion medida (ollama, vLLM-bench, vLLM-serve, ...)
+            model (str): Nombre del modelo
+            metrics (dict): Metricas numericas de la medicion (los valores None o no numericos se omiten)
+            gpu_stats (dict): Metricas gpu_{idx}_{nombre} de la ventana del muestreador
+            gpu_samples (list): Filas crudas del muestreador [timestamp, vram de cada GPU..., potencia de cada GPU...]
+            prompt (str): Prompt enviado (se guarda comprimido)
+            response (str): Respuesta del modelo (se guarda comprimida)
+            config (dict): Parametros no numericos de la medicion (arrival, search_param, ...), se guardan como JSON
+            **fields: run_id (ver start_run), load_mode, params, quantization, num_gpus, repetition y workload (carga medida, por ejemplo
+                concurrency=8; las repeticiones de una misma celda comparten model, quantization, num_gpus y workload)
+        Returns:
+            int: id de la medicion
+        """
+        values = {field: fields.get(field) for field in MEASUREMENT_FIELDS}
+        values.update(test_app=test_app, model=model)
+        with self._transaction():
+            cursor = self.connection.execute(
+                "INSERT INTO measurements (run_id, created_at, job_id, hostname, test_app, load_mode, model, params, "
+                "quantization, num_gpus, repetition, workload, config) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (values["run_id"], time.time(), os.getenv('SLURM_JOB_ID'), socket.gethostname(), values["test_app"],
+                 values["load_mode"], values["model"], values["params"], values["quantization"],
+                 values["num_gpus"], values["repetition"], values["workload"],
+                 json.dumps(config, sort_keys=True) if config else None)
+            )
+            measurement_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO metrics (measurement_id, name, value) VALUES (?, ?, ?)",
+                [(measurement_id, name, value) for name, value in metrics.items() if _numeric(value)]
+            )
+            if gpu_stats:
+                rows = []
+                for key, value in gpu_stats.items():
+                    match = GPU_KEY.fullmatch(key)
+                    if match and _numeric(value):
+                        rows.append((measurement_id, int(match.group(1)), match.group(2), value))
+                self.connection.executemany(
+                    "INSERT INTO gpu_metrics (measurement_id, gpu, name, value) VALUES (?, ?, ?, ?)", rows)
+            if gpu_samples:
+                num_gpus = (len(gpu_samples[0]) - 1) // 2
+                self.connection.executemany(
+                    "INSERT INTO gpu_samples (measurement_id, timestamp, gpu, power, vram) VALUES (?, ?, ?, ?, ?)",
+                    [(measurement_id, row[0], idx, row[1 + num_gpus + idx], row[1 + idx])
+                     for row in gpu_samples for idx in range(num_gpus)]
+                )
+            if prompt is not None or response is not None:
+                self.connection.execute(
+                    "INSERT INTO responses (measurement_id, prompt, response) VALUES (?, ?, ?)",
+                    (measurement_id, _compress(prompt), _compress(response))
+                )
+        return measurement_id
+
+    def query(self, metrics=None, **filters):
+        """
+        Mediciones que cumplen los filtros, con sus metricas.
+
+        Args:
+            metrics (list[str]): Metricas a incluir (por defecto, todas)
+            **filters: Igualdad sobre los campos de measurements (test_app, model, num_gpus, ...)
+        Returns:
+            list[dict]: Campos de la medicion y sus metricas
+        """
+        unknown = set(filters) - set(MEASUREMENT_FIELDS) - {"id", "job_id", "hostname"}
+        if unknown:
+            raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        where = " AND ".join(f"{field} = ?" for field in filters) or "1"
+        cursor = self.connection.execute(f"SELECT * FROM measurements WHERE {where} ORDER BY id", list(filters.values()))
+        columns = [description[0] for description in cursor.description]
+        measurements = {row[0]: dict(zip(columns, row)) for row in cursor}
+        if not measurements:
+            return []
+        metric_filter = f" AND name IN ({', '.join('?' * len(metrics))})" if metrics else ""
+        cursor = self.connection.execute(
+            f"SELECT measurement_id, name, value FROM metrics WHERE measurement_id IN "
+            f"(SELECT id FROM measurements WHERE {where}){metric_filter}",
+            list(filters.values()) + list(metrics or [])
+        )
+        for measurement_id, name, value in cursor:
+            measurements[measurement_id][name] = value
+        return list(measurements.values())
+
+    def get_gpu_metrics(self, measurement_id):
+        """
+        Returns:
+            dict: Metricas de cada GPU de la medicion, {gpu: {nombre: valor}}
+        """
+        gpu_metrics = {}
+        cursor = self.connection.execute(
+            "SELECT gpu, name, value FROM gpu_metrics WHERE measurement_id = ? ORDER BY gpu", (measurement_id,))
+        for gpu, name, value in cursor:
+            gpu_metrics.setdefault(gpu, {})[name] = value
+        return gpu_metrics
+
+    def get_response(self, measurement_id):
+        """
+        Returns:
+            tuple: (prompt, respuesta) descomprimidos, o (None, None) si la medicion no los guardo
+        """
+        row = self.connection.execute(
+            "SELECT prompt, response FROM responses WHERE measurement_id = ?", (measurement_id,)).fetchone()
+        if row is None:
+            return None, None
+        return _decompress(row[0]), _decompress(row[1])
+
+    def close(self):
+        self.connection.close()
+
+
+class _Transaction():
+    """Transaccion de escritura que toma el lock al empezar, para no fallar a mitad de una medicion"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.execute("COMMIT")
+        else:
+            self.connection.execute("ROLLBACK")
+        return False
+
+
+def open_results_store(result_path):
+    """
+    Abre la base de resultados configurada en RESULTS_DB (por defecto results.db en result_path).
+    RESULTS_DB=none desactiva la base y solo se escriben los CSV.
+
+    Returns:
+        ResultsStore: Base de resultados, None si esta desactivada
+    """
+    db_path = os.getenv('RESULTS_DB') or os.path.join(result_path, "results.db")
+    if db_path.lower() == "none":
+        return None
+    return ResultsStore(db_path)
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import socket
+import hashlib
+import subprocess
+from importlib import metadata
+
+def git_revision(repo_path):
+    """
+    Commit of the benchmark repository.
+
+    Returns:
+        tuple: (sha, dirty) where dirty is True if there are uncommitted changes, (None, None) outside a git checkout
+    """
+    try:
+        sha = subprocess.run(["git", "-C", repo_path, "rev-parse", "HEAD"],
+                             capture_output=True, text=True, check=True, timeout=10).stdout.strip()
+        status = subprocess.run(["git", "-C", repo_path, "status", "--porcelain", "--untracked-files=no"],
+                                capture_output=True, text=True, check=True, timeout=10).stdout.strip()
+        return sha, bool(status)
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+
+
+def package_version(package):
+    """Installed version of a python package, None if it is not installed"""
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def config_hash(config):
+    """
+    Hash of the benchmark configuration (arguments, prompts, engine configuration, ...). Runs with the same
+    hash measured the same thing, so they can be compared across software versions and nodes.
+
+    Args:
+        config (dict): JSON serializable configuration.
+    Returns:
+        str: First 16 hex digits of the sha256 of the canonical JSON
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def collect_run_metadata(config, gpu_backend=None, driver_version=None, ollama_version=None):
+    """
+    Metadata of a benchmark run, saved in the runs table of the results store.
+
+    Args:
+        config (dict): Benchmark configuration (see config_hash).
+        gpu_backend (str): gpu backend used by the sampler.
+        driver_version (str): Version of the gpu driver (GpuSampler.get_driver_version).
+        ollama_version (str): Version of the Ollama service, if it is tested.
+    Returns:
+        dict: hostname, job_id, git_sha, git_dirty, container_image, vllm_version, ollama_version, driver_version,
+            gpu_backend, python_version, config_hash and config
+    """
+    git_sha, git_dirty = git_revision(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    return {
+        "hostname": socket.gethostname(),
+        "job_id": os.getenv('SLURM_JOB_ID'),
+        "git_sha": git_sha,
+        "git_dirty": git_dirty,
+        # Exported by the sbatch scripts, or set by Apptainer/Singularity inside a container
+        "container_image": os.getenv('CONTAINER_IMAGE') or os.getenv('APPTAINER_NAME') or os.getenv('SINGULARITY_NAME'),
+        "vllm_version": package_version("vllm"),
+        "ollama_version": ollama_version,
+        "driver_version": driver_version,
+        "gpu_backend": gpu_backend,
+        "python_version": sys.version.split()[0],
+        "config_hash": config_hash(config),
+        "config": config
+    }
@@ -55,8 +55,16 @@ export OLLAMA_HOST=$OLLAMA_HOST
 export OLLAMA_MODELS=$OLLAMA_MODELS
 export TEST_DATA=$TEST_DATA
 export RESULT_PATH=$RESULT_PATH
+export RESULTS_DB=$RESULTS_DB
+export RESULTS_DB_GPU_SAMPLES=$RESULTS_DB_GPU_SAMPLES
+export CONTAINER_IMAGE=$CONTAINER_IMAGE
 export GPU_MIN_W_USAGE=$GPU_MIN_W_USAGE
+export GPU_SAMPLING_INTERVAL=$GPU_SAMPLING_INTERVAL
+export GPU_VRAM_SAMPLING_INTERVAL=$GPU_VRAM_SAMPLING_INTERVAL
+export GPU_SAMPLER_PROCESS=$GPU_SAMPLER_PROCESS
 export MAX_VRAM=$MAX_VRAM
+export LOCAL_STAGE_DIR=$LOCAL_STAGE_DIR
+export OLLAMA_NUM_PARALLEL=$OLLAMA_NUM_PARALLEL
 export OLLAMA_KEEP_ALIVE="4m0s"
 export OLLAMA_MAX_LOADED_MODELS=1
 export OLLAMA_SCHED_SPREAD=true
@@ -80,7 +88,7 @@ for ((i=0; i < ${gpus}; i++)); do
     OLLAMA_PID=$!
 
     # Run the inference script
-    python inference.py -g $((i + 1)) -r ${repetitions} --test_app=${test_app} --gpu_backend=${gpu_backend} &> "logs/nlhpc_bench_logs.out.err"
+    python inference.py -g $((i + 1)) -r ${repetitions} --test_app=${test_app} --gpu_backend=${gpu_backend} ${INFERENCE_EXTRA_ARGS} &> "logs/nlhpc_bench_logs.out.err"
 
     # Wait for ollama serve to finish
     kill ${OLLAMA_PID}
@@ -21,6 +21,8 @@ repetitions=1
 gpu_backend="cuda"
 mem=250000
 job_id=-1
+# Imagen de vLLM, se registra en la historia de resultados para comparar ejecuciones entre versiones
+container_image="${CONTAINER_IMAGE:-rocm/vllm:rocm6.3.2_mi210_ubuntu22.04_py3.12_vllm_0.7.1.dev103_ib}"
 
 # Parsear los argumentos
 while [[ "$#" -gt 0 ]]; do
@@ -72,12 +74,19 @@ export OLLAMA_SCHED_SPREAD=true
 
 export TEST_DATA="$TEST_DATA"
 export RESULT_PATH="$RESULT_PATH"
+export RESULTS_DB="$RESULTS_DB"
+export RESULTS_DB_GPU_SAMPLES="$RESULTS_DB_GPU_SAMPLES"
+export CONTAINER_IMAGE="${container_image}"
 export GPU_MIN_W_USAGE="$GPU_MIN_W_USAGE"
+export GPU_SAMPLING_INTERVAL="$GPU_SAMPLING_INTERVAL"
+export GPU_VRAM_SAMPLING_INTERVAL="$GPU_VRAM_SAMPLING_INTERVAL"
+export GPU_SAMPLER_PROCESS="$GPU_SAMPLER_PROCESS"
 export MAX_VRAM="$MAX_VRAM"
+export LOCAL_STAGE_DIR="$LOCAL_STAGE_DIR"
 
 # ---------------- Comandos --------------------
 
-docker run -v /home/ai_inference_db:/home/ai_inference_db -v /home/intern02:/home/intern02 -it --rm --device=/dev/kfd --device=/dev/dri --ipc=host --network=host --cap-add=SYS_PTRACE --security-opt seccomp=unconfined --device=/dev/infiniband --ulimit memlock=-1:-1 --shm-size 256g --cap-add=IPC_LOCK rocm/vllm:rocm6.3.2_mi210_ubuntu22.04_py3.12_vllm_0.7.1.dev103_ib /bin/bash -c "
+docker run -v /home/ai_inference_db:/home/ai_inference_db -v /home/intern02:/home/intern02 -it --rm --device=/dev/kfd --device=/dev/dri --ipc=host --network=host --cap-add=SYS_PTRACE --security-opt seccomp=unconfined --device=/dev/infiniband --ulimit memlock=-1:-1 --shm-size 256g --cap-add=IPC_LOCK -e CONTAINER_IMAGE=${container_image} ${container_image} /bin/bash -c "
 
 export HF_HOME=/home/ai_inference_db/models/
 export HF_DATASETS_CACHE=/home/ai_inference_db/data/
@@ -109,7 +118,7 @@ export TORCH_COMPILE_MAX_AUTOTUNE=1
 source nlhpc_benchmark/bin/activate
 
 # Ejecutar la inferencia
-python inference.py -g ${gpus} -r ${repetitions} --test_app=${test_app} --gpu_backend=${gpu_backend}
+python inference.py -g ${gpus} -r ${repetitions} --test_app=${test_app} --gpu_backend=${gpu_backend} ${INFERENCE_EXTRA_ARGS}
 "
 EOF
 
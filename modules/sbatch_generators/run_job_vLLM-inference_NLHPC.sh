@@ -75,8 +75,15 @@ ml ai-inference
 
 export TEST_DATA="$TEST_DATA"
 export RESULT_PATH="$RESULT_PATH"
+export RESULTS_DB="$RESULTS_DB"
+export RESULTS_DB_GPU_SAMPLES="$RESULTS_DB_GPU_SAMPLES"
+export CONTAINER_IMAGE="$CONTAINER_IMAGE"
 export GPU_MIN_W_USAGE="$GPU_MIN_W_USAGE"
+export GPU_SAMPLING_INTERVAL="$GPU_SAMPLING_INTERVAL"
+export GPU_VRAM_SAMPLING_INTERVAL="$GPU_VRAM_SAMPLING_INTERVAL"
+export GPU_SAMPLER_PROCESS="$GPU_SAMPLER_PROCESS"
 export MAX_VRAM="$MAX_VRAM"
+export LOCAL_STAGE_DIR="$LOCAL_STAGE_DIR"
 
 # ---------------- Comandos --------------------
 
@@ -84,7 +91,7 @@ export MAX_VRAM="$MAX_VRAM"
 source nlhpc_benchmark/bin/activate
 
 # Ejecutar la inferencia
-python inference.py -g ${gpus} -r ${repetitions} --test_app=${test_app} --gpu_backend=${gpu_backend}
+python inference.py -g ${gpus} -r ${repetitions} --test_app=${test_app} --gpu_backend=${gpu_backend} ${INFERENCE_EXTRA_ARGS}
 EOF
 
 # Enviar el script a la cola de trabajos
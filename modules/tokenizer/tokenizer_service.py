@@ -0,0 +1,199 @@
+import os, json, array, hashlib, sqlite3
+
+tokenizer_cache_path = os.getenv('TOKENIZER_CACHE') or os.path.join(os.path.expanduser("~"), ".cache", "nlhpc_benchmark", "tokenizer_cache.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS encodings (
+    tokenizer_hash TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    num_tokens INTEGER NOT NULL,
+    token_ids BLOB,
+    PRIMARY KEY (tokenizer_hash, text_hash)
+) WITHOUT ROWID;
+"""
+
+# Texts looked up in the memo per query (below the SQLite limit of variables per statement)
+LOOKUP_BATCH = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def tokenizer_hash(tokenizer):
+    """
+    Hash of the tokenization rules of a tokenizer: the serialized fast tokenizer (vocabulary, merges, normalizer
+    and pre-tokenizer), or the vocabulary of the slow tokenizers. Two models with the same tokenizer share
+    their memoized encodings, a tokenizer update gets new ones.
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        serialized = backend.to_str()
+    else:
+        serialized = json.dumps(sorted(tokenizer.get_vocab().items()))
+    return hashlib.sha256(f"{type(tokenizer).__name__}:{serialized}".encode("utf-8")).hexdigest()[:32]
+
+
+class TokenizerService():
+    """
+    Tokenizers shared by every backend, so the input and output tokens of ollama, vLLM and the OpenAI server
+    are counted on the same basis. Each tokenizer is loaded once, and the encodings of the prompts are memoized
+    on disk (TOKENIZER_CACHE) keyed by (tokenizer hash, text hash), so the prompts of a workload are only
+    tokenized the first time. The texts missing in the memo are encoded in a single batch. The generated
+    responses, which are never repeated, are counted without being memoized.
+
+    Without a Hugging Face tokenizer (transformers not installed, or an ollama model without an entry in the
+    tokenizers of data.json) the texts are counted in words, and the counts are flagged as not exact.
+    """
+
+    def __init__(self, tokenizers=None, model_tokenizers=True, cache_path=None, timeout=120):
+        """
+        Args:
+            tokenizers (dict): model -> Hugging Face tokenizer (e.g. {"llama3.1:8b": "meta-llama/Llama-3.1-8B-Instruct"}).
+            model_tokenizers (bool): The models without an entry use the tokenizer of their own name (Hugging Face
+                models). False for the ollama models, which only have the tokenizers given.
+            cache_path (str): SQLite file of the memo (default, TOKENIZER_CACHE).
+            timeout (float): Seconds a writer waits for the lock of the memo (several jobs can share it).
+        """
+        self.tokenizers = dict(tokenizers or {})
+        self.model_tokenizers = model_tokenizers
+        self.loaded = {}
+        self.hashes = {}
+        self.connection = None
+        try:
+            cache_path = cache_path or tokenizer_cache_path
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self.connection = sqlite3.connect(cache_path, timeout=timeout, isolation_level=None)
+            # Rollback journal instead of WAL, which does not work over NFS. The locks of SQLite are still not
+            # reliable over NFS (see results_store), there use a TOKENIZER_CACHE per node or per job
+            self.connection.execute("PRAGMA journal_mode=DELETE")
+            self.connection.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            print(f"Tokenizer cache not available ({cache_path}), the encodings are not memoized: {e}")
+            self.connection = None
+
+    def add_tokenizer(self, model, name=None):
+        """Sets the Hugging Face tokenizer of a model (default, the tokenizer of its own name)"""
+        self.tokenizers[model] = name or model
+
+    def tokenizer_name(self, model):
+        """Hugging Face tokenizer of a model, None if it has none"""
+        if model in self.tokenizers:
+            return self.tokenizers[model]
+        return model if self.model_tokenizers else None
+
+    def get_tokenizer(self, model):
+        """
+        Tokenizer of a model, loaded once. None if it cannot be loaded (the texts are then counted in words).
+        """
+        name = self.tokenizer_name(model)
+        if name is None:
+            return None
+        if name not in self.loaded:
+            try:
+                from transformers import AutoTokenizer
+                self.loaded[name] = AutoTokenizer.from_pretrained(name)
+                self.hashes[name] = tokenizer_hash(self.loaded[name])
+            except Exception as e:
+                print(f"Could not load the tokenizer of {model} ({name}), the tokens are counted in words: {e}")
+                self.loaded[name] = None
+        return self.loaded[name]
+
+    def get_hash(self, model):
+        """Hash of the tokenizer of a model (see tokenizer_hash), None if it has no tokenizer"""
+        if self.get_tokenizer(model) is None:
+            return None
+        return self.hashes[self.tokenizer_name(model)]
+
+    def exact(self, model):
+        """True if the counts of the model come from its tokenizer (False: word counts)"""
+        return self.get_tokenizer(model) is not None
+
+    def _lookup(self, tokenizer_key, hashes):
+        if self.connection is None:
+            return {}
+        found = {}
+        for start in range(0, len(hashes), LOOKUP_BATCH):
+            batch = hashes[start:start + LOOKUP_BATCH]
+            rows = self.connection.execute(
+                f"SELECT text_hash, num_tokens, token_ids FROM encodings WHERE tokenizer_hash = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                [tokenizer_key, *batch])
+            for digest, num_tokens, token_ids in rows:
+                found[digest] = (num_tokens, token_ids)
+        return found
+
+    def _store(self, tokenizer_key, rows):
+        if self.connection is None or not rows:
+            return
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany("INSERT OR IGNORE INTO encodings VALUES (?, ?, ?, ?)",
+                                        [(tokenizer_key, *row) for row in rows])
+            self.connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            if self.connection.in_transaction:
+                self.connection.execute("ROLLBACK")
+            print(f"Could not save the encodings in the tokenizer cache: {e}")
+
+    def encode_batch(self, model, texts):
+        """
+        Token ids of the texts with the tokenizer of the model (without special tokens).
+
+        Args:
+            model (str): Model whose tokenizer is used.
+            texts (list[str]): Texts to encode.
+        Returns:
+            list[list[int]]: token ids of each text (None for every text if the model has no tokenizer)
+        """
+        tokenizer = self.get_tokenizer(model)
+        if tokenizer is None:
+            return [None] * len(texts)
+        tokenizer_key = self.hashes[self.tokenizer_name(model)]
+        hashes = [text_hash(text) for text in texts]
+        found = self._lookup(tokenizer_key, list(set(hashes)))
+
+        # Only the texts missing in the memo are encoded, all of them in one call (batched by the fast tokenizers)
+        missing = {digest: text for digest, text in zip(hashes, texts) if digest not in found}
+        if missing:
+            encoded = tokenizer(list(missing.values()), add_special_tokens=False)["input_ids"]
+            rows = []
+            for digest, token_ids in zip(missing, encoded):
+                blob = array.array("I", token_ids).tobytes()
+                found[digest] = (len(token_ids), blob)
+                rows.append((digest, len(token_ids), blob))
+            self._store(tokenizer_key, rows)
+        return [array.array("I", found[digest][1]).tolist() for digest in hashes]
+
+    def count_batch(self, model, texts):
+        """
+        Number of tokens of each text with the tokenizer of the model, words if the model has no tokenizer.
+        The texts in the memo (the workload prompts) are looked up, the others are encoded but not memoized.
+
+        Args:
+            model (str): Model whose tokenizer is used.
+            texts (list[str]): Texts to count (None counts 0).
+        Returns:
+            list[int]: tokens of each text
+        """
+        texts = [text or "" for text in texts]
+        tokenizer = self.get_tokenizer(model)
+        if tokenizer is None:
+            return [len(text.split()) for text in texts]
+        tokenizer_key = self.hashes[self.tokenizer_name(model)]
+        hashes = [text_hash(text) for text in texts]
+        found = self._lookup(tokenizer_key, list(set(hashes)))
+        missing = {digest: text for digest, text in zip(hashes, texts) if digest not in found}
+        if missing:
+            encoded = tokenizer(list(missing.values()), add_special_tokens=False)["input_ids"]
+            for digest, token_ids in zip(missing, encoded):
+                found[digest] = (len(token_ids), None)
+        return [found[digest][0] for digest in hashes]
+
+    def count(self, model, text):
+        """Number of tokens of a text (see count_batch)"""
+        return self.count_batch(model, [text])[0]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
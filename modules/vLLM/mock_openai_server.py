@@ -0,0 +1,175 @@
+import json, time, argparse, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Stand-in for `vllm serve`: OpenAI-compatible completions with a configurable time to first token and
+# token rate, and the Prometheus metrics of vLLM, to validate the serving client pipeline without gpus.
+# Only the standard library is used, so it runs on any login or compute node.
+
+
+class MockEngine():
+    """
+    Timing model of the mock server: at most max_num_seqs requests are generated at the same time (the
+    rest wait in the queue), the first token takes ttft seconds and the next ones 1/tokens_per_second.
+    """
+
+    def __init__(self, model, ttft=0.05, tokens_per_second=50.0, max_num_seqs=64):
+        self.model = model
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.slots = threading.BoundedSemaphore(max_num_seqs)
+        self.lock = threading.Lock()
+        self.counters = {
+            "vllm:prompt_tokens_total": 0,
+            "vllm:generation_tokens_total": 0,
+            "vllm:request_success_total": 0,
+            "vllm:num_preemptions_total": 0,
+            "vllm:time_to_first_token_seconds_sum": 0.0,
+            "vllm:time_to_first_token_seconds_count": 0,
+            "vllm:e2e_request_latency_seconds_sum": 0.0,
+            "vllm:e2e_request_latency_seconds_count": 0,
+            "vllm:request_queue_time_seconds_sum": 0.0,
+            "vllm:request_queue_time_seconds_count": 0
+        }
+        self.running = 0
+        self.waiting = 0
+
+    def _add(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                self.counters[f"vllm:{name}"] += value
+
+    def generate(self, prompt, max_tokens):
+        """
+        Generates max_tokens tokens for the prompt, yielding each one when the timing model produces it.
+        """
+        arrival = time.perf_counter()
+        with self.lock:
+            self.waiting += 1
+        self.slots.acquire()
+        scheduled = time.perf_counter()
+        with self.lock:
+            self.waiting -= 1
+            self.running += 1
+        try:
+            time.sleep(self.ttft)
+            self._add(time_to_first_token_seconds_sum=time.perf_counter() - arrival, time_to_first_token_seconds_count=1)
+            for idx in range(max_tokens):
+                if idx > 0:
+                    time.sleep(1 / self.tokens_per_second)
+                self._add(generation_tokens_total=1)
+                yield f" tok{idx}"
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.slots.release()
+        self._add(prompt_tokens_total=len(prompt.split()), request_success_total=1,
+                  e2e_request_latency_seconds_sum=time.perf_counter() - arrival, e2e_request_latency_seconds_count=1,
+                  request_queue_time_seconds_sum=scheduled - arrival, request_queue_time_seconds_count=1)
+
+    def metrics(self):
+        """Prometheus text exposition of the counters, with the model_name label of vLLM"""
+        label = f'{{model_name="{self.model}"}}'
+        with self.lock:
+            lines = [f"{name}{label} {value}" for name, value in self.counters.items()]
+            lines.append(f"vllm:num_requests_running{label} {self.running}")
+            lines.append(f"vllm:num_requests_waiting{label} {self.waiting}")
+        return "\n".join(lines) + "\n"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    engine = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, "", "text/plain")
+        elif self.path == "/v1/models":
+            self._send(200, {"object": "list", "data": [{"id": self.engine.model, "object": "model"}]})
+        elif self.path == "/metrics":
+            self._send(200, self.engine.metrics(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/v1/completions":
+            self._send(404, {"error": "not found"})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if request.get("model") != self.engine.model:
+            self._send(404, {"error": f"The model `{request.get('model')}` does not exist."})
+            return
+        prompt = request.get("prompt", "")
+        prompt = " ".join(prompt) if isinstance(prompt, list) else prompt
+        max_tokens = int(request.get("max_tokens") or 16)
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": max_tokens,
+                 "total_tokens": len(prompt.split()) + max_tokens}
+
+        if not request.get("stream"):
+            text = "".join(self.engine.generate(prompt, max_tokens))
+            self._send(200, {"id": "cmpl-mock", "object": "text_completion", "model": self.engine.model,
+                             "choices": [{"index": 0, "text": text, "finish_reason": "length"}], "usage": usage})
+            return
+
+        # Server-sent events, one chunk per token as vllm serve
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for token in self.engine.generate(prompt, max_tokens):
+                chunk = {"id": "cmpl-mock", "object": "text_completion", "model": self.engine.model,
+                         "choices": [{"index": 0, "text": token, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            if (request.get("stream_options") or {}).get("include_usage"):
+                chunk = {"id": "cmpl-mock", "object": "text_completion", "model": self.engine.model, "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def run_mock_server(model, host="127.0.0.1", port=8000, ttft=0.05, tokens_per_second=50.0, max_num_seqs=64):
+    """
+    Serves the mock OpenAI-compatible endpoint until the process is stopped.
+
+    Args:
+        model (str): Served model name (requests for other models get a 404, as vllm serve).
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        ttft (float): Seconds until the first token of a request once it is scheduled.
+        tokens_per_second (float): Decode rate of each request.
+        max_num_seqs (int): Requests generated at the same time, the rest are queued.
+    """
+    MockHandler.engine = MockEngine(model, ttft, tokens_per_second, max_num_seqs)
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server for the NLHPC AI BENCHMARK vLLM-serve test")
+    parser.add_argument("--model", type=str, required=True, help="Served model name", dest="model")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on", dest="host")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on", dest="port")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds to the first token of a scheduled request", dest="ttft")
+    parser.add_argument("--tokens_per_second", type=float, default=50.0, help="Decode tokens/s of each request", dest="tokens_per_second")
+    parser.add_argument("--max_num_seqs", type=int, default=64, help="Requests generated at the same time", dest="max_num_seqs")
+    args = parser.parse_args()
+    run_mock_server(args.model, args.host, args.port, args.ttft, args.tokens_per_second, args.max_num_seqs)
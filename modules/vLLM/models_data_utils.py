@@ -1,35 +1,294 @@
-from transformers import AutoModelForCausalLM
-import torch
+import os, json, struct, hashlib
+
+# Bytes per element of the safetensors dtypes
+SAFETENSORS_DTYPE_BYTES = {
+    "F64": 8, "I64": 8, "U64": 8,
+    "F32": 4, "I32": 4, "U32": 4,
+    "F16": 2, "BF16": 2, "I16": 2, "U16": 2,
+    "F8_E4M3": 1, "F8_E5M2": 1, "I8": 1, "U8": 1, "BOOL": 1
+}
+
+SAFETENSORS_DTYPE_NAMES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "F8_E4M3": "float8_e4m3fn", "F8_E5M2": "float8_e5m2", "I8": "int8", "U8": "uint8", "I32": "int32"
+}
+
+# Bits per parameter of the dtypes accepted by --dtype
+DTYPE_BITS = {
+    "float64": 64,
+    "float32": 32,
+    "float": 32,
+    "float16": 16,
+    "half": 16,
+    "bfloat16": 16,
+    "float8_e4m3fn": 8,
+    "float8_e5m2": 8,
+    "fp8": 8,
+    "int8": 8,
+    "uint8": 8,
+    "int4": 4
+}
+
+# Layer geometry copied from config.json (used by the memory planning of the engines)
+GEOMETRY_FIELDS = ("model_type", "num_hidden_layers", "hidden_size", "intermediate_size", "num_attention_heads",
+                   "num_key_value_heads", "head_dim", "vocab_size", "max_position_embeddings", "tie_word_embeddings")
+
+# Quantization metadata stored next to the packed weights (qweight) of the GPTQ/AWQ checkpoints
+PACKED_METADATA = ("qzeros", "scales", "g_idx")
+
+# Version of the metadata entries, a new version invalidates the entries cached by the previous ones
+METADATA_VERSION = 2
+
+metadata_cache_dir = os.getenv('MODEL_METADATA_CACHE') or os.path.join(os.path.expanduser("~"), ".cache", "nlhpc_benchmark", "model_metadata")
+
+_metadata_memo = {}
+
+
+def read_safetensors_header(path):
+    """
+    Reads the header of a safetensors file (8 bytes with the header length followed by a JSON),
+    without reading the tensors.
+
+    Args:
+        path (str): Path of the .safetensors file.
+    Returns:
+        dict: tensor name -> {"dtype", "shape", "data_offsets"} (plus the optional __metadata__ entry)
+    """
+    with open(path, "rb") as safetensors_file:
+        header_length = struct.unpack("<Q", safetensors_file.read(8))[0]
+        return json.loads(safetensors_file.read(header_length))
+
+
+def count_parameters(headers, bits=None):
+    """
+    Counts the parameters of a model from the headers of its safetensors shards. The packed weights of the
+    GPTQ/AWQ checkpoints (qweight, several parameters per integer) are unpacked with the bits of the
+    quantization, and their quantization metadata (qzeros, scales, g_idx) is not counted as parameters.
+
+    Args:
+        headers (list[dict]): Headers returned by read_safetensors_header.
+        bits (int): Bits per parameter of the packed weights (quantization_config of config.json).
+    Returns:
+        tuple: number of parameters, bytes of the weights, dict dtype -> number of parameters and True if
+            there are packed weights that could not be unpacked (unknown bits)
+    """
+    num_params = 0
+    weight_bytes = 0
+    params_per_dtype = {}
+    packed = False
+    for header in headers:
+        for name, tensor in header.items():
+            if name == "__metadata__":
+                continue
+            numel = 1
+            for dim in tensor["shape"]:
+                numel *= dim
+            weight_bytes += numel * SAFETENSORS_DTYPE_BYTES.get(tensor["dtype"], 4)
+            module, _, kind = name.rpartition(".")
+            if kind in PACKED_METADATA and f"{module}.qweight" in header:
+                continue
+            if kind == "qweight" and tensor["dtype"] in ("I32", "U32"):
+                if bits:
+                    numel = numel * 32 // bits
+                else:
+                    packed = True
+            num_params += numel
+            params_per_dtype[tensor["dtype"]] = params_per_dtype.get(tensor["dtype"], 0) + numel
+    return num_params, weight_bytes, params_per_dtype, packed
+
+
+def estimate_parameters(config):
+    """
+    Estimates the parameters of a decoder-only transformer from its config.json, for checkpoints
+    without safetensors files (e.g. only pytorch .bin files).
+
+    Args:
+        config (dict): config.json of the model.
+    Returns:
+        int: Approximate number of parameters (None if the config does not describe the layers)
+    """
+    try:
+        hidden = config["hidden_size"]
+        layers = config["num_hidden_layers"]
+        heads = config["num_attention_heads"]
+        vocab = config["vocab_size"]
+    except KeyError:
+        return None
+    head_dim = config.get("head_dim") or hidden // heads
+    kv_heads = config.get("num_key_value_heads") or heads
+    intermediate = config.get("intermediate_size") or 4 * hidden
+    attention = hidden * heads * head_dim * 2 + hidden * kv_heads * head_dim * 2
+    # Gated MLP (gate, up and down projections) and two norms per layer
+    mlp = 3 * hidden * intermediate
+    embeddings = vocab * hidden * (1 if config.get("tie_word_embeddings", False) else 2)
+    return embeddings + layers * (attention + mlp + 2 * hidden) + hidden
+
+
+def _local_revision(model_path, files):
+    """Revision of a local checkpoint: hash of the name, size and modification time of its files"""
+    revision = hashlib.sha256()
+    for name in sorted(files):
+        stat = os.stat(os.path.join(model_path, name))
+        revision.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return revision.hexdigest()[:16]
+
+
+def _resolve_local(model_path):
+    """config.json and safetensors headers of a checkpoint in a local directory"""
+    files = os.listdir(model_path)
+    with open(os.path.join(model_path, "config.json"), "r") as config_file:
+        config = json.load(config_file)
+    # The index lists the shards, otherwise every .safetensors file of the directory is a shard
+    index_path = os.path.join(model_path, "model.safetensors.index.json")
+    if os.path.isfile(index_path):
+        with open(index_path, "r") as index_file:
+            shards = sorted(set(json.load(index_file)["weight_map"].values()))
+    else:
+        shards = sorted(name for name in files if name.endswith(".safetensors"))
+    headers = [read_safetensors_header(os.path.join(model_path, shard)) for shard in shards]
+    return _local_revision(model_path, files), config, headers
+
+
+def _resolve_hub(model_name, revision):
+    """config.json and safetensors headers of a Hugging Face Hub model, downloading only the headers"""
+    from huggingface_hub import HfApi, hf_hub_download, get_safetensors_metadata, snapshot_download
+
+    try:
+        # The commit sha pins the cache entry, a new revision of the model gets a new entry
+        sha = HfApi().model_info(model_name, revision=revision).sha
+    except Exception:
+        # Without access to the Hub (e.g. offline compute nodes) the snapshot already downloaded in HF_HOME is used
+        # (the directory of the snapshot is named after its commit sha)
+        snapshot_path = snapshot_download(model_name, revision=revision, local_files_only=True)
+        sha = os.path.basename(os.path.normpath(snapshot_path))
+        _, config, headers = _resolve_local(snapshot_path)
+        return sha, config, headers, _read_cache(model_name, sha)
+    cached = _read_cache(model_name, sha)
+    if cached is not None:
+        return sha, None, None, cached
+
+    with open(hf_hub_download(model_name, "config.json", revision=sha), "r") as config_file:
+        config = json.load(config_file)
+    try:
+        # Range requests over the headers of the shards, the weights are not downloaded
+        safetensors_metadata = get_safetensors_metadata(model_name, revision=sha)
+        headers = [{name: {"dtype": tensor.dtype, "shape": tensor.shape} for name, tensor in file_metadata.tensors.items()}
+                   for file_metadata in safetensors_metadata.files_metadata.values()]
+    except Exception:
+        headers = []
+    return sha, config, headers, None
+
+
+def _cache_path(model_name, revision):
+    key = hashlib.sha256(f"{model_name}@{revision}:v{METADATA_VERSION}".encode()).hexdigest()[:32]
+    return os.path.join(metadata_cache_dir, f"{key}.json")
+
+
+def _read_cache(model_name, revision):
+    try:
+        with open(_cache_path(model_name, revision), "r") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(metadata):
+    try:
+        os.makedirs(metadata_cache_dir, exist_ok=True)
+        path = _cache_path(metadata["model"], metadata["revision"])
+        # Written to a temporary file and renamed, so concurrent jobs never read a partial entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump(metadata, cache_file)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not save the metadata of {metadata['model']} in the cache: {e}")
+
+
+def resolve_model_metadata(model_name, revision=None):
+    """
+    Resolves the parameter count, dtype and layer geometry of a model from its config.json and the
+    headers of its safetensors files, without loading the weights. The result is cached on disk
+    (MODEL_METADATA_CACHE) keyed by the model revision.
+
+    Args:
+        model_name (str): Hugging Face Hub model id or local directory of the checkpoint.
+        revision (str): Branch, tag or commit of a Hub model (default, main).
+    Returns:
+        dict: model, revision, num_params, weight_bytes, dtype, params_per_dtype, exact (False if the
+            parameters were estimated from config.json), quantization (quantization method, if any)
+            and geometry (GEOMETRY_FIELDS of config.json). num_params and weight_bytes are None if
+            they cannot be resolved (no safetensors and a config.json without the layers).
+    """
+    memo_key = (model_name, revision)
+    if memo_key in _metadata_memo:
+        return _metadata_memo[memo_key]
+
+    if os.path.isdir(model_name):
+        revision, config, headers = _resolve_local(model_name)
+        cached = _read_cache(model_name, revision)
+    else:
+        revision, config, headers, cached = _resolve_hub(model_name, revision)
+
+    if cached is not None:
+        _metadata_memo[memo_key] = cached
+        return cached
+
+    quantization_config = config.get("quantization_config") or {}
+    num_params, weight_bytes, params_per_dtype, packed = count_parameters(headers, quantization_config.get("bits") or quantization_config.get("w_bit"))
+    exact = num_params > 0 and not packed
+    if not exact:
+        # Without safetensors, or with packed weights of unknown bits, the parameters are estimated from config.json
+        num_params = estimate_parameters(config) or num_params or None
+    # Dtype of the checkpoint: the one declared in config.json, otherwise the most common dtype of the tensors
+    dtype = config.get("torch_dtype")
+    if dtype is None and params_per_dtype:
+        dtype = SAFETENSORS_DTYPE_NAMES.get(max(params_per_dtype, key=params_per_dtype.get))
+    if not params_per_dtype:
+        weight_bytes = num_params * DTYPE_BITS.get(str(dtype), 32) // 8 if num_params is not None else None
+
+    metadata = {
+        "model": model_name,
+        "revision": revision,
+        "num_params": num_params,
+        "weight_bytes": weight_bytes,
+        "dtype": dtype,
+        "params_per_dtype": params_per_dtype,
+        "exact": exact,
+        "quantization": quantization_config.get("quant_method"),
+        "geometry": {field: config.get(field) for field in GEOMETRY_FIELDS}
+    }
+    _write_cache(metadata)
+    _metadata_memo[memo_key] = metadata
+    return metadata
+
 
 def get_model_info(model_name: str, dtype=None):
     """
     Calculates the approximate size of a GB model based on its parameters and accuracy.
+    The parameters are read from the safetensors headers (see resolve_model_metadata), the weights are never loaded.
+
+    Args:
+        model_name (str): Hugging Face Hub model id or local directory of the checkpoint.
+        dtype (str): dtype used to serve the model (default, the dtype of the checkpoint).
+    Returns:
+        tuple: number of parameters (e.g. '6.738B'), dtype, size in GB (ValueError if the size cannot be resolved)
     """
-    # Cargar el modelo
-    model = AutoModelForCausalLM.from_pretrained(model_name)
-
-    # Obtener el número total de parámetros
-    num_params = sum(p.numel() for p in model.parameters()) 
-
-    # Obtener la precisión (dtype)
-    if dtype == None:
-        dtype = next(model.parameters()).dtype 
-
-    dtype_size = {
-        "float32": 32, 
-        "float16": 16,
-        "bfloat16": 16, 
-        "int8": 8,
-        "int4": 4,
-        "torch.float32": 32,
-        "torch.float16": 16,
-        "torch.bfloat16": 16,
-        "torch.int8": 8,
-        "torch.int4": 4
-    }.get(str(dtype), 32)  # Si no está en la lista, asumir float32
-
-    # Calcular el tamaño en GB
-    model_size_gb = (num_params * dtype_size) / (8*10**9)  # Convertir de bytes a GB
+    metadata = resolve_model_metadata(model_name)
+    if metadata["num_params"] is None or metadata["weight_bytes"] is None:
+        raise ValueError(f"The size of {model_name} could not be resolved: it has no safetensors files and its "
+                         "config.json does not describe the layers (hidden_size, num_hidden_layers, ...)")
+    num_params = metadata["num_params"]
+
+    if dtype is None or str(dtype) == "auto":
+        dtype = metadata["dtype"]
+    if str(dtype) == str(metadata["dtype"]) or metadata["quantization"] is not None:
+        # Checkpoint size, exact for safetensors checkpoints (also for quantized ones)
+        model_size_gb = metadata["weight_bytes"] / 1e9
+    else:
+        dtype_size = DTYPE_BITS.get(str(dtype).replace("torch.", ""), 32)  # Si no está en la lista, asumir float32
+        model_size_gb = (num_params * dtype_size) / (8*10**9)  # Convertir de bytes a GB
+
     num_params = num_params / 1e9
     num_params = f"{num_params:.3f}B"
-    return num_params, dtype, model_size_gb 
+    return num_params, dtype, model_size_gb
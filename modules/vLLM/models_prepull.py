@@ -0,0 +1,127 @@
+import os, re, sys, json, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Files needed to serve a model (the pytorch .bin weights are only downloaded when there are no safetensors,
+# see allow_patterns_hf)
+HF_ALLOW_PATTERNS = ["*.json", "*.safetensors", "*.model", "*.txt", "*.tiktoken", "*.py"]
+
+
+def allow_patterns_hf(model_name):
+    """
+    Files of a model to download: HF_ALLOW_PATTERNS, plus the pytorch .bin weights when the repository
+    has no safetensors (older checkpoints).
+
+    Args:
+        model_name (str): Hugging Face Hub model id.
+    Returns:
+        list[str]: allow_patterns of snapshot_download
+    """
+    from huggingface_hub import HfApi
+    files = HfApi().list_repo_files(model_name)
+    if any(name.endswith(".safetensors") for name in files):
+        return HF_ALLOW_PATTERNS
+    return HF_ALLOW_PATTERNS + ["*.bin"]
+
+
+# Index of the shards of a sharded checkpoint (weight_map: tensor -> shard)
+WEIGHT_INDEX_FILES = ("model.safetensors.index.json", "pytorch_model.bin.index.json")
+# Name of the shards, e.g. model-00001-of-00004.safetensors
+SHARD_NAME = re.compile(r"-(\d+)-of-(\d+)\.(safetensors|bin)$")
+
+
+def weights_complete(path):
+    """
+    Checks if the weights of a checkpoint directory are complete: every shard of its index, or of the
+    numbered shards when the index is missing, so an interrupted multi-shard download is not taken as present.
+
+    Args:
+        path (str): Directory of the checkpoint (e.g. a snapshot of the Hugging Face cache).
+    Returns:
+        bool: True if every shard of the weights is in the directory
+    """
+    files = set(os.listdir(path))
+    for index_name in WEIGHT_INDEX_FILES:
+        if index_name in files:
+            with open(os.path.join(path, index_name), "r") as index_file:
+                shards = set(json.load(index_file)["weight_map"].values())
+            return all(os.path.isfile(os.path.join(path, shard)) for shard in shards)
+    weights = [name for name in files if name.endswith(".safetensors") or name.endswith(".bin")]
+    for name in weights:
+        match = SHARD_NAME.search(name)
+        if match:
+            total, extension = int(match.group(2)), match.group(3)
+            prefix = name[:match.start()]
+            return all(f"{prefix}-{idx:0{len(match.group(1))}d}-of-{match.group(2)}.{extension}" in files
+                       for idx in range(1, total + 1))
+    return bool(weights)
+
+
+def model_in_cache_hf(model_name):
+    """
+    Checks if the snapshot of a model is already in the Hugging Face cache (HF_HOME), without network access.
+
+    Args:
+        model_name (str): Hugging Face Hub model id or local directory.
+    Returns:
+        bool: True if the model can be loaded offline (with all the shards of its weights)
+    """
+    if os.path.isdir(model_name):
+        return True
+    from huggingface_hub import snapshot_download
+    try:
+        snapshot_path = snapshot_download(model_name, local_files_only=True)
+    except Exception:
+        return False
+    # An interrupted download leaves part of the shards in the snapshot, it is pulled (and resumed) again
+    return weights_complete(snapshot_path)
+
+
+def pull_model_hf(model_name, retries=3, max_workers=8):
+    """
+    Downloads the snapshot of a model into the Hugging Face cache (HF_HOME). The files that are already
+    in the cache are skipped and the interrupted downloads are resumed, so a failed pull is retried.
+
+    Args:
+        model_name (str): Hugging Face Hub model id.
+        retries (int): Attempts before giving up (default, 3).
+        max_workers (int): Files downloaded in parallel (default, 8).
+    Returns:
+        bool: True if the download was successful, false if not
+    """
+    from huggingface_hub import snapshot_download
+    for attempt in range(1, retries + 1):
+        try:
+            snapshot_download(model_name, allow_patterns=allow_patterns_hf(model_name), max_workers=max_workers)
+            print(f"{model_name}: download completed")
+            return True
+        except Exception as e:
+            print(f"Error downloading {model_name} (attempt {attempt}/{retries}): {e}")
+            if attempt < retries:
+                time.sleep(min(2 ** attempt, 30))
+    return False
+
+
+def prepull_models_hf(models, parallel=4, retries=3):
+    """
+    Downloads concurrently the models that are not in the Hugging Face cache yet. Models that are already
+    present are not checked against the Hub, so it can be called at the start of every job.
+
+    Args:
+        models (list[str]): Hugging Face Hub model ids (or local directories, which are skipped).
+        parallel (int): Maximum number of models downloaded at the same time (default, 4).
+        retries (int): Attempts of each download (default, 3).
+    Returns:
+        dict: model -> True if it is available in the cache
+    """
+    available = {model: model_in_cache_hf(model) for model in models}
+    missing = [model for model in models if not available[model]]
+    if not missing:
+        return available
+
+    print(f"Downloading {len(missing)} model(s) into {os.getenv('HF_HOME') or '~/.cache/huggingface'}: {', '.join(missing)}")
+    sys.stdout.flush()
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+        for model, pulled in zip(missing, executor.map(partial(pull_model_hf, retries=retries), missing)):
+            available[model] = pulled
+    return available
@@ -0,0 +1,80 @@
+import time, asyncio, json
+import aiohttp
+from modules.metrics.latency_stats import token_latency_metrics
+
+async def async_query_openai(session, prompt, model, host="127.0.0.1:8000", max_tokens=128, stream=True):
+    """
+    Sends a completion request to an OpenAI-compatible server (e.g. `vllm serve`) and measures the
+    client side latencies. The returned dict has the same keys as async_query_ollama so both can be
+    used by the load generator.
+
+    Args:
+        session (aiohttp.ClientSession): Session whose connector holds the pooled connections.
+        prompt (str): The query you wish to send to the model.
+        model (str): Served model name.
+        host (str): ip:port where the server runs (default, 127.0.0.1:8000).
+        max_tokens (int): Maximum number of tokens to generate (default, 128).
+        stream (bool): Consume the SSE stream to measure ttft and inter-token latencies (default, True).
+    Returns:
+        dict: eval_duration (ns, measured client side), eval_count, response, the latency metrics of
+            token_latency_metrics and error (None if the request succeeded)
+    """
+    url = f"http://{host}/v1/completions"
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        "stream": stream
+    }
+    if stream:
+        # Pedimos que el ultimo chunk incluya la cantidad de tokens generados
+        payload["stream_options"] = {"include_usage": True}
+
+    result = {
+        "eval_duration": 0,
+        "eval_count": 0,
+        "response": "",
+        "error": None
+    }
+
+    token_times = []
+    usage = {}
+    init = time.perf_counter()
+    try:
+        async with session.post(url, json=payload) as response:
+            response.raise_for_status()
+            if stream:
+                chunks = []
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("error"):
+                        # Error reported by the server in the middle of the stream
+                        raise ValueError(chunk["error"])
+                    usage = chunk.get("usage") or usage
+                    choices = chunk.get("choices") or []
+                    if choices and choices[0].get("text"):
+                        token_times.append(time.perf_counter())
+                        chunks.append(choices[0]["text"])
+                text = "".join(chunks)
+            else:
+                data = await response.json()
+                usage = data.get("usage", {})
+                text = data["choices"][0]["text"]
+        end = time.perf_counter()
+        result["response"] = text
+        # Si el servidor no informa el uso, cada chunk recibido corresponde a un token
+        result["eval_count"] = usage.get("completion_tokens", len(token_times))
+        if token_times:
+            result["eval_duration"] = (end - token_times[0]) * 1e9
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, IndexError) as e:
+        # ValueError: malformed chunk (json.JSONDecodeError) or error of the server, KeyError/IndexError: response without choices
+        result["error"] = f"Error: {e}"
+
+    result.update(token_latency_metrics(init, token_times, time.perf_counter()))
+    return result
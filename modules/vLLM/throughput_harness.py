@@ -0,0 +1,202 @@
+import gc, time, random, dataclasses
+import torch
+from vllm import LLM, SamplingParams, EngineArgs
+
+from modules.planner.memory_planner import engine_config
+from modules.metrics.request_metrics import request_metrics_summary
+
+
+def parse_workloads(value):
+    """
+    Parses the --bench_workloads flag.
+
+    Args:
+        value (str): Comma separated input_len x output_len x num_prompts shapes (e.g. '128x128x1000,1024x128x200').
+    Returns:
+        list[dict]: input_len, output_len and num_prompts of each workload
+    """
+    workloads = []
+    for shape in value.split(","):
+        input_len, output_len, num_prompts = map(int, shape.lower().split("x"))
+        workloads.append({"input_len": input_len, "output_len": output_len, "num_prompts": num_prompts})
+    return workloads
+
+
+def bench_workloads(config, workloads=None):
+    """
+    Workloads of a model: the ones given with --bench_workloads, or the --input-len, --output-len and
+    --num-prompts of its configuration (benchmark_throughput.py defaults: 128, 128 and 1000).
+
+    Args:
+        config (list[str] | dict): vLLM arguments of the model.
+        workloads (list[dict]): Workloads returned by parse_workloads (default, None).
+    Returns:
+        list[dict]: input_len, output_len and num_prompts of each workload
+    """
+    if workloads:
+        return workloads
+    config = engine_config(config)
+    return [{"input_len": int(config.get("input_len", 128)),
+             "output_len": int(config.get("output_len", 128)),
+             "num_prompts": int(config.get("num_prompts", 1000))}]
+
+
+def workload_name(workload):
+    """Label of a workload in the results (input_len x output_len x num_prompts, or the name of a data.json workload)"""
+    return workload.get("name") or f"{workload['input_len']}x{workload['output_len']}x{workload['num_prompts']}"
+
+
+def _parse_value(value):
+    """Converts the string values of the CLI arguments to bool, int or float"""
+    if not isinstance(value, str):
+        return value
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def engine_kwargs(config, tensor_parallel_size=1):
+    """
+    Arguments of the LLM engine from a vLLM configuration. Only the options of EngineArgs are kept, so the
+    benchmark options (--input-len, --num-prompts, ...) of vllm_config_benchmark.json can be passed as is.
+
+    Args:
+        config (list[str] | dict): vLLM arguments of the model.
+        tensor_parallel_size (int): Number of gpus.
+    Returns:
+        dict: keyword arguments of vllm.LLM
+    """
+    engine_args = {field.name for field in dataclasses.fields(EngineArgs)}
+    kwargs = {key: _parse_value(value) for key, value in engine_config(config).items()
+              if key in engine_args and key not in ("model", "tensor_parallel_size")}
+    kwargs["tensor_parallel_size"] = tensor_parallel_size
+    # The V1 engine only records the per request metrics (RequestOutput.metrics) with the stats enabled
+    kwargs.setdefault("disable_log_stats", False)
+    return kwargs
+
+
+class ThroughputHarness():
+    """
+    Offline throughput benchmark that keeps the engine loaded, so several workload shapes and repetitions
+    are measured with a single model load (benchmark_throughput.py loads the model on every launch).
+    """
+
+    def __init__(self, model, config, tensor_parallel_size=1):
+        """
+        Args:
+            model (str): Model to load.
+            config (list[str] | dict): vLLM arguments of the model.
+            tensor_parallel_size (int): Number of gpus.
+        """
+        self.model = model
+        init = time.perf_counter()
+        self.llm = LLM(model=model, **engine_kwargs(config, tensor_parallel_size))
+        # Time since the engine was created until it accepts requests (weights, profiling, KV cache, graphs)
+        self.load_time = time.perf_counter() - init
+        self.vocab_size = self.llm.get_tokenizer().vocab_size
+
+    def synthetic_prompts(self, input_len, num_prompts, seed=0):
+        """
+        Prompts of exactly input_len random tokens, as benchmark_throughput.py (the tokenizer is not involved).
+
+        Returns:
+            list[dict]: prompts with their prompt_token_ids
+        """
+        rng = random.Random(seed)
+        return [{"prompt_token_ids": [rng.randrange(self.vocab_size) for _ in range(input_len)]} for _ in range(num_prompts)]
+
+    def warmup(self, num_requests=1):
+        """Short generation before the measurements, so the first one does not pay the first-iteration costs"""
+        if num_requests > 0:
+            self.llm.generate(self.synthetic_prompts(16, num_requests), SamplingParams(max_tokens=16, ignore_eos=True), use_tqdm=False)
+
+    def run(self, input_len=128, output_len=128, num_prompts=1000, seed=0, requests=None):
+        """
+        Generates output_len tokens (ignoring the end of sequence) for num_prompts prompts of input_len tokens.
+
+        Args:
+            input_len (int): Tokens of each prompt.
+            output_len (int): Tokens generated for each prompt.
+            num_prompts (int): Number of requests.
+            seed (int): Seed of the synthetic prompts.
+            requests (list[dict]): Requests of a workload (see build_workload) used instead of the synthetic prompts,
+                each one generates its own output_len tokens (default, None).
+        Returns:
+            dict: num_requests, input_tokens, output_tokens, elapsed_time, requests_per_second, tokens_per_second
+                (output tokens), total_tokens_per_second (input + output), the per request distributions of
+                request_metrics_summary (ttft_p99, tpot_p50, queue_time_p50, ...) and outputs (the RequestOutput of each request)
+        """
+        if requests:
+            prompts = [{"prompt_token_ids": request["prompt_token_ids"]} if request.get("prompt_token_ids") else request["prompt"]
+                       for request in requests]
+            sampling_params = [SamplingParams(n=1, temperature=1.0, top_p=1.0, ignore_eos=True, max_tokens=request["output_len"])
+                               for request in requests]
+        else:
+            prompts = self.synthetic_prompts(input_len, num_prompts, seed)
+            sampling_params = SamplingParams(n=1, temperature=1.0, top_p=1.0, ignore_eos=True, max_tokens=output_len)
+
+        init = time.perf_counter()
+        outputs = self.llm.generate(prompts, sampling_params, use_tqdm=False)
+        elapsed_time = time.perf_counter() - init
+
+        input_tokens = sum(len(output.prompt_token_ids) for output in outputs)
+        output_tokens = sum(len(output.outputs[0].token_ids) for output in outputs)
+        return {
+            "num_requests": len(outputs),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "elapsed_time": elapsed_time,
+            "requests_per_second": len(outputs) / elapsed_time,
+            "tokens_per_second": output_tokens / elapsed_time,
+            "total_tokens_per_second": (input_tokens + output_tokens) / elapsed_time,
+            **request_metrics_summary(outputs),
+            "outputs": outputs
+        }
+
+    def set_max_num_seqs(self, max_num_seqs):
+        """
+        Changes the maximum number of sequences scheduled per step of the loaded engine, without reloading it.
+        Only possible when the scheduler runs in this process: V0 engine, or V1 engine without multiprocessing
+        (VLLM_ENABLE_V1_MULTIPROCESSING=0). It should not be raised above the value the engine was loaded with,
+        the CUDA graphs are only captured up to it.
+
+        Args:
+            max_num_seqs (int): New limit.
+        Returns:
+            bool: False if the scheduler of the engine cannot be reached
+        """
+        engine = getattr(self.llm, "llm_engine", None)
+        schedulers = []
+        # V0: one scheduler per virtual engine (pipeline parallel stage)
+        if isinstance(getattr(engine, "scheduler", None), list):
+            schedulers = engine.scheduler
+        # V1 in-process client: the engine core and its scheduler live in this process
+        engine_core = getattr(getattr(engine, "engine_core", None), "engine_core", None)
+        if engine_core is not None:
+            schedulers = [engine_core.scheduler]
+        if not schedulers:
+            return False
+        for scheduler in schedulers:
+            scheduler.scheduler_config.max_num_seqs = max_num_seqs
+            # The V1 scheduler keeps its own copy of the limit
+            if hasattr(scheduler, "max_num_running_reqs"):
+                scheduler.max_num_running_reqs = max_num_seqs
+        return True
+
+    def close(self):
+        """Releases the engine and the gpu memory, so another model (or tensor parallel size) can be loaded"""
+        try:
+            from vllm.distributed.parallel_state import destroy_model_parallel, destroy_distributed_environment
+            destroy_model_parallel()
+            destroy_distributed_environment()
+        except (ImportError, AssertionError, RuntimeError):
+            pass
+        del self.llm
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
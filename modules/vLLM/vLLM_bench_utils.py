@@ -1,53 +1,90 @@
-import sys, io, os, time, subprocess, re, torch, signal
+import sys, io, os, time, subprocess, re, torch, signal, json, tempfile
 from vllm import LLM, SamplingParams
+from modules.metrics.request_metrics import request_metrics_summary
 # from vllm import LLM, SamplingParams
 
-def run_vllm_bench(model_name:str, config, num_gpus=1):
+# benchmark_throughput.py of the vLLM sources, used by --bench_harness=script
+VLLM_BENCH_SCRIPT = os.getenv('VLLM_BENCH_SCRIPT') or "/home/intern02/vLLM/vllm/benchmarks/benchmark_throughput.py"
+
+def _set_arg(config, flag, value):
+    """Sets the value of a CLI argument, appending it if it is not in the list"""
+    if flag in config:
+        config[config.index(flag) + 1] = str(value)
+    else:
+        config += [flag, str(value)]
+
+def run_vllm_bench(model_name:str, config, num_gpus=1, workload=None):
     """
-    
+    Runs benchmark_throughput.py (VLLM_BENCH_SCRIPT) in a subprocess and reads its JSON output.
+    The model is loaded on every call, ThroughputHarness keeps it loaded between measurements.
+
+    Args:
+        model_name (str): Model to benchmark.
+        config (list[str]): Arguments of the benchmark (same format as vllm_config_benchmark.json).
+        num_gpus (int): Tensor parallel size.
+        workload (dict): input_len, output_len and num_prompts (default, the ones of the configuration).
+    Returns:
+        dict: num_requests, input_tokens, output_tokens, elapsed_time, requests_per_second, tokens_per_second
+            (output tokens) and total_tokens_per_second, None if the benchmark failed
     """
-
-    # Prepare the arguments for the bench
-    try:
-        cant_gpu_config_index = config.index("--tensor-parallel-size")
-        config[cant_gpu_config_index+1] = str(num_gpus)
-    except ValueError:
-        config.append("--tensor-parallel-size")
-        config.append(str(num_gpus))
-
-    print("Running bench...")
-    sys.stdout.flush()
-    # Execute the benchmark
-    result = subprocess.run(
-        ["python", 
-        "/home/intern02/vLLM/vllm/benchmarks/benchmark_throughput.py"]
-        + config,
-        capture_output=True,
-        text=True,
-        timeout=1000
-    )
-    
-    if (result.returncode != 0):
-        print("Benchmark Error\n\n", result.stdout, result.stderr, "\nBenchmark Execution failed")
+    # Prepare the arguments for the bench (a copy, the configuration of the model is reused)
+    config = list(config)
+    _set_arg(config, "--tensor-parallel-size", num_gpus)
+    if workload is not None:
+        _set_arg(config, "--input-len", workload["input_len"])
+        _set_arg(config, "--output-len", workload["output_len"])
+        _set_arg(config, "--num-prompts", workload["num_prompts"])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_json = os.path.join(tmp_dir, "throughput.json")
+        _set_arg(config, "--output-json", output_json)
+
+        print("Running bench...")
         sys.stdout.flush()
-        return -1, -1
-        # raise RuntimeError("Benchmark execution failed")
-    
-    # Obtain result line:
-    output = result.stdout
-    match_tokens_per_second = re.search(r"([\d\.]+) output tokens/s", output)
-    match_requests_per_second = re.search(r"([\d\.]+) requests/s", output)
+        # Execute the benchmark
+        result = subprocess.run(
+            [sys.executable, VLLM_BENCH_SCRIPT] + config,
+            capture_output=True,
+            text=True,
+            timeout=1000
+        )
+
+        if (result.returncode != 0 or not os.path.isfile(output_json)):
+            print("Benchmark Error\n\n", result.stdout, result.stderr, "\nBenchmark Execution failed")
+            sys.stdout.flush()
+            return None
+
+        with open(output_json, "r") as output_file:
+            output = json.load(output_file)
 
     print("Done!")
 
-    if match_tokens_per_second:
-        return float(match_tokens_per_second.group(1)), float(match_requests_per_second.group(1))
-    else:
-        raise RuntimeError("Tokens_per_second output not found in", result.stdout)
+    # The JSON has the total tokens (prompt + output), the output tokens are num_requests * output_len
+    output_len = int(config[config.index("--output-len") + 1]) if "--output-len" in config else 128
+    output_tokens = output["num_requests"] * output_len
+    elapsed_time = output["elapsed_time"]
+    return {
+        "num_requests": output["num_requests"],
+        "input_tokens": output["total_num_tokens"] - output_tokens,
+        "output_tokens": output_tokens,
+        "elapsed_time": elapsed_time,
+        "requests_per_second": output["requests_per_second"],
+        "tokens_per_second": output_tokens / elapsed_time,
+        "total_tokens_per_second": output["tokens_per_second"]
+    }
 
 def run_inference_vllm(model, prompts:list[str], num_gpus=1, config={}):
     """
-    
+    Generates the responses of the prompts with vLLM offline inference.
+
+    Args:
+        model (str): Model to load.
+        prompts (list[str]): Prompts to generate.
+        num_gpus (int): Number of gpus (tensor parallel size).
+        config (dict): vLLM arguments of the model.
+    Returns:
+        tuple: output tokens per second of the batch and the per request metrics of request_metrics_summary
+            (-1 if the model could not be loaded)
     """
 
     try:
@@ -61,7 +98,8 @@ def run_inference_vllm(model, prompts:list[str], num_gpus=1, config={}):
             gpu_memory_utilization=config.get("gpu_memory_utilization", 0.9),
             enforce_eager=config.get("enforce-eager", False),
             dtype=config.get("dtype", "float16"),
-            tensor_parallel_size=num_gpus
+            tensor_parallel_size=num_gpus,
+            disable_log_stats=False
         )
 
     except torch.OutOfMemoryError as oom_error:
@@ -86,12 +124,7 @@ def run_inference_vllm(model, prompts:list[str], num_gpus=1, config={}):
     outputs = llm.generate(prompts, sampling_params)
     elapsed_time = time.time() - init
 
-    total_tokens_per_sec = 0
-
-    for output in outputs:
-        response_tokens = len(output.outputs[0].token_ids)
-
-        total_tokens_per_sec += response_tokens / elapsed_time if elapsed_time > 0 else 0
-
+    total_tokens = sum(len(output.outputs[0].token_ids) for output in outputs)
+    total_tokens_per_sec = total_tokens / elapsed_time if elapsed_time > 0 else 0
 
-    return total_tokens_per_sec
+    return total_tokens_per_sec, request_metrics_summary(outputs)
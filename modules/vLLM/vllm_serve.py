@@ -1,9 +1,16 @@
 import os, csv, json, argparse, time, sys
+import torch
 from models_data_utils import *
 from vllm import LLM, SamplingParams
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
+from modules.metrics.energy_metrics import energy_efficiency
+from modules.metrics.request_metrics import request_metrics_summary
+from modules.results.results_store import open_results_store
+from modules.results.results_csv import results_csv_path
+from modules.planner.memory_planner import plan_vllm
+
 
 # ------ Parser config -------
 
@@ -28,19 +35,19 @@ parser.add_argument(
 parser.add_argument(
     "--gpu_backend",
     type=str,
-    help="gpu backend to be used in the test.",
+    help="gpu backend to be used in the test. Options: cuda-rocm-sim-auto",
     required=False,
     default="cuda",
+    choices=["cuda", "rocm", "sim", "auto"],
     dest="gpu_backend"
 )
 
 args = parser.parse_args()
 model = args.model_name
 
-if args.gpu_backend == 'rocm':
-    from modules.gpu_monitor.gpu_monitor_rocm import GpuMonitor
-else:
-    from modules.gpu_monitor.gpu_monitor_cuda import GpuMonitor
+from modules.gpu_monitor.gpu_backends import load_gpu_sampler
+from modules.gpu_monitor.gpu_sampler import sort_gpu_stats
+GpuSampler = load_gpu_sampler(args.gpu_backend)
 
 # ------ Load necessary data ------
 
@@ -53,6 +60,15 @@ try:
 except:
     max_vram = 64
 
+# Same sampling grid as inference.py
+try:
+    gpu_sampling_interval = float(os.getenv('GPU_SAMPLING_INTERVAL') or "0.1")
+    gpu_vram_sampling_interval = float(os.getenv('GPU_VRAM_SAMPLING_INTERVAL') or gpu_sampling_interval)
+except:
+    gpu_sampling_interval = gpu_vram_sampling_interval = 0.1
+
+gpu_sampler_process = os.getenv('GPU_SAMPLER_PROCESS') == "1"
+
 with open(vllm_bench_args_path, 'r') as vllm_bench_args_file:
     vllm_bench_args = json.load(vllm_bench_args_file)
 
@@ -61,9 +77,6 @@ with open(test_data_json, 'r') as test_data_json_file:
 
 prompts = test_data.get('prompts', [])
 
-output_file = os.path.join(result_path, "vllm_inference_benchmark_results.csv")
-file_exists = os.path.isfile(output_file)
-
 # ----- Open the results file and save the results --------
 
 
@@ -72,10 +85,7 @@ try:
 except:
     raise RuntimeError(f"{model} configuration not found")
 
-try:
-    dtype_config = vllm_bench_args[model]["dtype"]
-except ValueError:
-    dtype_config = None
+dtype_config = config.get("dtype")
 
 # --------- Load Model -----------
 
@@ -83,9 +93,19 @@ print(f"Loading {model} config...")
 model_data = get_model_info(model_name=model, dtype=dtype_config)
 print("Done!")
 
-if model_data[2] > max_vram*args.num_gpus:
-    print(f"The model {model} weight exceds avaible VRAM")
-    raise RuntimeError(f"model config\nParams: {model_data[0]}\tQuantization: {model_data[1]}\t Weight: {model_data[2]}GB")
+# The engine is not launched if the weights, activations, overhead and KV cache of each rank do not fit
+memory_plan = plan_vllm(model_data[2] * 1e9, resolve_model_metadata(model)["geometry"], config, tp=args.num_gpus, gpu_memory_gb=max_vram)
+if not memory_plan["fits"]:
+    print(f"The model {model} does not fit in {args.num_gpus} gpus: {memory_plan['reason']}")
+    raise RuntimeError(f"model config\nParams: {model_data[0]}\tQuantization: {model_data[1]}\t Weight: {model_data[2]}GB\t Needed: {memory_plan['required_gb']:.1f} GB per gpu of {memory_plan['budget_gb']:.1f} GB")
+
+# The sampler process is forked before the engine initializes CUDA in this process
+if gpu_sampler_process:
+    from modules.gpu_monitor.gpu_sampler_process import GpuSamplerProcess
+    gpu_sampler = GpuSamplerProcess(GpuSampler, gpu_sampling_interval, vram_interval=gpu_vram_sampling_interval)
+else:
+    gpu_sampler = GpuSampler(gpu_sampling_interval, vram_interval=gpu_vram_sampling_interval)
+gpu_sampler.start()
 
 try:
     llm = LLM(
@@ -98,14 +118,18 @@ try:
         gpu_memory_utilization=config.get("gpu_memory_utilization", 0.97),
         enforce_eager=config.get("enforce-eager", False),
         dtype=config.get("dtype", "float16"),
-        tensor_parallel_size=2
+        tensor_parallel_size=args.num_gpus,
+        # The V1 engine only records the per request metrics (RequestOutput.metrics) with the stats enabled
+        disable_log_stats=False
     )
 
 except torch.OutOfMemoryError as oom_error:
     print(f"Out of memory error: {oom_error}")
+    gpu_sampler.stop()
     raise RuntimeError("Error loading the model, insufficient VRAM")
 
 except RuntimeError:
+    gpu_sampler.stop()
     raise RuntimeError(f"Error executing the service")
 
 sampling_params = SamplingParams(
@@ -114,57 +138,59 @@ sampling_params = SamplingParams(
     max_tokens=config.get("output_len", 128)
 )
 
-gpu_monitor = GpuMonitor(0.1)
-gpu_monitor.start()
+gpu_sampler.open_window("generate")
 init = time.time()
 outputs = llm.generate(prompts, sampling_params)
 elapsed_time = time.time() - init
-gpu_monitor.stop()
+gpu_stats = gpu_sampler.close_window("generate")
+gpu_energy = gpu_sampler.get_window_energy("generate")
+gpu_metrics = gpu_sampler.get_window_summary("generate")
+gpu_metrics.update(gpu_energy)
+gpu_sampler.stop()
 
-gpu_stats = gpu_monitor.get_stats()
-sorted_gpu_stats = {key: gpu_stats[key] for key in sorted(gpu_stats.keys())}
+sorted_gpu_stats = sort_gpu_stats(gpu_stats)
 
-total_tokens_per_sec = 0
+total_tokens = sum(len(output.outputs[0].token_ids) for output in outputs)
+prompt_tokens = sum(len(output.prompt_token_ids or []) for output in outputs)
+total_tokens_per_sec = total_tokens / elapsed_time if elapsed_time > 0 else 0
+# TTFT, TPOT, queue time and prefill/decode throughput of each request, from the engine timestamps
+request_metrics = request_metrics_summary(outputs)
 
-for output in outputs:
-    response_tokens = len(output.outputs[0].token_ids)
-    total_tokens_per_sec += response_tokens / elapsed_time if elapsed_time > 0 else 0
+energy = energy_efficiency(gpu_energy["energy_j"], total_tokens)
 
 # -------- Save the result -------
 
+# The columns added after the first versions go at the end, after the gpu columns
+header = (["Model"
+          , "Params"
+          , "Quantization"
+          , "Tokens/s"
+          , "Theorical_size"
+          , "Num_Gpus"]
+          + [f"GPU_{idx}_{metric}" for idx in range(len(gpu_sampler.get_devices())) for metric in ("Power_avg", "Power_max", "VRAM_usage_avg", "VRAM_usage_max")]
+          + ["Energy_J"
+          , "J/token"
+          , "Tokens/J"
+          , "Prompt_tokens"
+          , "Output_tokens"
+          , "Elapsed_time"
+          , "TTFT_p50"
+          , "TTFT_p99"
+          , "TPOT_p50"
+          , "TPOT_p99"
+          , "Queue_time_p50"
+          , "Queue_time_p99"
+          , "Request_tokens/s_p50"
+          , "Prefill_tokens/s_p50"
+          , "Decode_tokens/s_p50"
+          , "Prefill_time_fraction"])
+output_file = results_csv_path(os.path.join(result_path, "vllm_inference_benchmark_results.csv"), header)
+file_exists = os.path.isfile(output_file)
+
 with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
     writer = csv.writer(csvfile)
     if not file_exists:
-        writer.writerow(["Model"
-                        , "Params"
-                        , "Quantization"
-                        , "Tokens/s"
-                        , "Theorical_size"
-                        , "Num_Gpus"
-                        , "GPU_0_Power_avg"
-                        , "GPU_0_Power_max"
-                        , "GPU_0_VRAM_usage_avg"
-                        , "GPU_0_VRAM_usage_max"
-                        , "GPU_1_Power_avg"
-                        , "GPU_1_Power_max"
-                        , "GPU_1_VRAM_usage_avg"
-                        , "GPU_1_VRAM_usage_max"
-                        , "GPU_2_Power_avg"
-                        , "GPU_2_Power_max"
-                        , "GPU_2_VRAM_usage_avg"
-                        , "GPU_2_VRAM_usage_max"
-                        , "GPU_3_Power_avg"
-                        , "GPU_3_Power_max"
-                        , "GPU_3_VRAM_usage_avg"
-                        , "GPU_3_VRAM_usage_max"
-                        , "GPU_4_Power_avg"
-                        , "GPU_4_Power_max"
-                        , "GPU_4_VRAM_usage_avg"
-                        , "GPU_4_VRAM_usage_max"
-                        , "GPU_5_Power_avg"
-                        , "GPU_5_Power_max"
-                        , "GPU_5_VRAM_usage_avg"
-                        , "GPU_5_VRAM_usage_max"])
+        writer.writerow(header)
     #Save the data
     writer.writerow([model,
                 model_data[0],
@@ -173,4 +199,30 @@ with open(output_file, mode='a', newline='', encoding='utf-8') as csvfile:
                 model_data[2],
                 args.num_gpus
                 ]
-                + list(sorted_gpu_stats.values()))
+                + list(sorted_gpu_stats.values())
+                + [energy["energy_j"],
+                energy["joules_per_token"],
+                energy["tokens_per_joule"],
+                prompt_tokens,
+                total_tokens,
+                elapsed_time,
+                request_metrics["ttft_p50"],
+                request_metrics["ttft_p99"],
+                request_metrics["tpot_p50"],
+                request_metrics["tpot_p99"],
+                request_metrics["queue_time_p50"],
+                request_metrics["queue_time_p99"],
+                request_metrics["request_tokens_per_second_p50"],
+                request_metrics["prefill_tokens_per_second_p50"],
+                request_metrics["decode_tokens_per_second_p50"],
+                request_metrics["prefill_time_fraction"]])
+
+results_store = open_results_store(result_path)
+if results_store is not None:
+    results_store.add_measurement("vLLM-inference", model,
+                                  {"tokens_per_second": total_tokens_per_sec, "total_tokens": total_tokens, "prompt_tokens": prompt_tokens,
+                                   "input_tokens": prompt_tokens, "output_tokens": total_tokens, "tokenizer_tokens_per_second": total_tokens_per_sec,
+                                   "elapsed_time": elapsed_time, "theorical_size": model_data[2], **request_metrics, **energy},
+                                  gpu_stats=gpu_metrics, params=model_data[0], quantization=model_data[1],
+                                  num_gpus=args.num_gpus, run_id=os.getenv('BENCHMARK_RUN_ID') or None, workload=f"generate={len(prompts)}x{config.get('output_len', 128)}")
+    results_store.close()
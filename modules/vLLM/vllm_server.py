@@ -0,0 +1,154 @@
+import os, sys, time, subprocess, signal
+import requests
+
+from modules.planner.memory_planner import engine_config
+
+# Options of the benchmark configurations that are not arguments of `vllm serve` (the model is positional)
+BENCHMARK_ONLY_OPTIONS = ("model", "input_len", "output_len", "num_prompts", "dataset", "dataset_path", "backend", "n")
+
+# Histograms whose average over the measurement is reported (sum and count)
+SERVER_HISTOGRAMS = {"vllm:time_to_first_token_seconds": "server_ttft_avg",
+                     "vllm:e2e_request_latency_seconds": "server_e2e_latency_avg",
+                     "vllm:request_queue_time_seconds": "server_queue_time_avg"}
+
+MOCK_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_openai_server.py")
+
+
+def serve_command(model, config=None, num_gpus=1, port=8000):
+    """
+    Command line of `vllm serve` for a model. The configuration of the model (vllm_config_inference.json or
+    vllm_config_benchmark.json) is converted to CLI options; options set to false are left to the vLLM default.
+
+    Args:
+        model (str): Model to serve.
+        config (list[str] | dict): vLLM arguments of the model (default, None).
+        num_gpus (int): Tensor parallel size.
+        port (int): Port of the OpenAI-compatible server.
+    Returns:
+        list[str]: command to launch
+    """
+    command = ["vllm", "serve", model, "--port", str(port), "--tensor-parallel-size", str(num_gpus)]
+    for key, value in engine_config(config or {}).items():
+        if key in BENCHMARK_ONLY_OPTIONS or key == "tensor_parallel_size":
+            continue
+        flag = "--" + key.replace("_", "-")
+        if value is True or str(value).lower() == "true":
+            command.append(flag)
+        elif value is False or str(value).lower() == "false":
+            continue
+        else:
+            command += [flag, str(value)]
+    return command
+
+
+def mock_command(model, port=8000, ttft=0.05, tokens_per_second=50.0, max_num_seqs=64):
+    """Command line of the mock OpenAI-compatible server (mock_openai_server.py) for a model"""
+    return [sys.executable, MOCK_SERVER_PATH, "--model", model, "--port", str(port), "--ttft", str(ttft),
+            "--tokens_per_second", str(tokens_per_second), "--max_num_seqs", str(max_num_seqs)]
+
+
+def launch_server(command, host="127.0.0.1:8000", timeout=900, log_path=None):
+    """
+    Launches an OpenAI-compatible server and waits until its /health endpoint answers.
+
+    Args:
+        command (list[str]): Command of the server (serve_command or mock_command).
+        host (str): ip:port where the server listens.
+        timeout (float): Seconds to wait for the server (the model load included).
+        log_path (str): File where the output of the server is written (default, None: discarded).
+    Returns:
+        tuple: the subprocess.Popen of the server and the seconds until it was ready
+    """
+    log_file = open(log_path, "a") if log_path else subprocess.DEVNULL
+    init = time.perf_counter()
+    # The server runs in its own process group, so stopping it also stops its workers (tensor parallel ranks)
+    process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True)
+    if log_path:
+        log_file.close()
+    while time.perf_counter() - init < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode} before being ready")
+        try:
+            if requests.get(f"http://{host}/health", timeout=5).status_code == 200:
+                return process, time.perf_counter() - init
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(1)
+    stop_server(process)
+    raise RuntimeError(f"The server was not ready after {timeout} s")
+
+
+def stop_server(process, timeout=60):
+    """
+    Stops a server launched with launch_server (SIGTERM to its process group, SIGKILL after timeout seconds).
+    """
+    if process is None or process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def scrape_server_metrics(host="127.0.0.1:8000"):
+    """
+    Reads the Prometheus endpoint (/metrics) of the server. The samples of a metric with different labels
+    (e.g. one per model or finish reason) are added.
+
+    Args:
+        host (str): ip:port of the server.
+    Returns:
+        dict: metric name -> value (empty if the server does not expose the metrics)
+    """
+    try:
+        response = requests.get(f"http://{host}/metrics", timeout=10)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return {}
+    metrics = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        try:
+            name_labels, value = line.rsplit(" ", 1)
+            value = float(value)
+        except ValueError:
+            continue
+        name = name_labels.split("{", 1)[0]
+        metrics[name] = metrics.get(name, 0.0) + value
+    return metrics
+
+
+def server_metrics_delta(before, after, elapsed_time):
+    """
+    Server side metrics of a measurement from the scrapes taken before and after it.
+
+    Args:
+        before (dict): scrape_server_metrics before the measurement.
+        after (dict): scrape_server_metrics after the measurement.
+        elapsed_time (float): Seconds between both scrapes.
+    Returns:
+        dict: server_prompt_tokens_per_second, server_generation_tokens_per_second, server_requests,
+            server_preemptions and the averages of SERVER_HISTOGRAMS (None when the server does not report them)
+    """
+    def delta(name):
+        if name not in after:
+            return None
+        return after[name] - before.get(name, 0.0)
+
+    prompt_tokens = delta("vllm:prompt_tokens_total")
+    generation_tokens = delta("vllm:generation_tokens_total")
+    metrics = {
+        "server_prompt_tokens_per_second": prompt_tokens / elapsed_time if prompt_tokens is not None and elapsed_time > 0 else None,
+        "server_generation_tokens_per_second": generation_tokens / elapsed_time if generation_tokens is not None and elapsed_time > 0 else None,
+        "server_requests": delta("vllm:request_success_total"),
+        "server_preemptions": delta("vllm:num_preemptions_total")
+    }
+    for histogram, key in SERVER_HISTOGRAMS.items():
+        total, count = delta(f"{histogram}_sum"), delta(f"{histogram}_count")
+        metrics[key] = total / count if total is not None and count else None
+    return metrics
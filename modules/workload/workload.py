@@ -0,0 +1,293 @@
+import os, csv, json, math, random, hashlib
+
+from modules.tokenizer.tokenizer_service import TokenizerService
+
+workload_cache_dir = os.getenv('WORKLOAD_CACHE') or os.path.join(os.path.expanduser("~"), ".cache", "nlhpc_benchmark", "workloads")
+
+# Words of the synthetic prompts when the model has no tokenizer available (the lengths are then in words)
+FALLBACK_WORDS = ("compute", "node", "cluster", "memory", "kernel", "tensor", "model", "scheduler", "network",
+                  "storage", "energy", "parallel", "vector", "matrix", "cache", "latency", "throughput", "token")
+
+# Dataset records tokenized per batch (the dataset is streamed, only the batches needed are read)
+DATASET_BATCH = 256
+
+# Keys of the prompt and the reference completion in the JSONL datasets
+PROMPT_KEYS = ("prompt", "input", "instruction", "question", "text")
+OUTPUT_KEYS = ("output", "completion", "response", "answer")
+
+
+def parse_length_spec(spec):
+    """
+    Parses a token length distribution.
+
+    Args:
+        spec (str | int): 'fixed:128' (or 128), 'uniform:64:512' (min and max), 'lognormal:512:0.6' (median and
+            sigma of the log) or 'replay:/path/to/log.csv:column' (lengths of a production log, resampled).
+    Returns:
+        tuple: distribution name and its parameters
+    """
+    if isinstance(spec, int) or str(spec).isdigit():
+        return "fixed", (int(spec),)
+    name, _, params = str(spec).partition(":")
+    if name == "fixed":
+        return name, (int(params),)
+    if name == "uniform":
+        low, high = map(int, params.split(":"))
+        return name, (low, high)
+    if name == "lognormal":
+        median, sigma = map(float, params.split(":"))
+        return name, (median, sigma)
+    if name == "replay":
+        path, _, column = params.rpartition(":")
+        return name, (path, column) if path else (params, None)
+    raise ValueError(f"Unknown length distribution: {spec}")
+
+
+def read_replay_lengths(path, column=None):
+    """
+    Lengths of a production log: a CSV with a header (the column given, by default the first numeric one)
+    or a file with one length per line.
+    """
+    with open(path, "r", newline="") as log_file:
+        first_line = log_file.readline()
+        log_file.seek(0)
+        if first_line.strip().isdigit():
+            return [int(line) for line in log_file if line.strip()]
+        lengths = []
+        for row in csv.DictReader(log_file):
+            if column is None:
+                column = next(key for key, value in row.items() if value and value.replace(".", "", 1).isdigit())
+            if row.get(column):
+                lengths.append(int(float(row[column])))
+        return lengths
+
+
+def sample_lengths(spec, num, seed=0):
+    """
+    Samples num token lengths of a distribution (see parse_length_spec). The lengths are at least 1.
+
+    Args:
+        spec (str | int): Length distribution.
+        num (int): Number of lengths.
+        seed (int): Seed of the random generator, the same seed gives the same lengths.
+    Returns:
+        list[int]: lengths
+    """
+    name, params = parse_length_spec(spec)
+    rng = random.Random(seed)
+    if name == "fixed":
+        lengths = [params[0]] * num
+    elif name == "uniform":
+        lengths = [rng.randint(*params) for _ in range(num)]
+    elif name == "lognormal":
+        median, sigma = params
+        lengths = [round(rng.lognormvariate(math.log(median), sigma)) for _ in range(num)]
+    else:
+        observed = read_replay_lengths(*params)
+        lengths = [rng.choice(observed) for _ in range(num)]
+    return [max(1, length) for length in lengths]
+
+
+def _conversation_turns(record):
+    """First user turn and the assistant reply of a ShareGPT (from/value) or chat (role/content) record"""
+    turns = record.get("conversations") or record.get("messages") or []
+    prompt, output = None, None
+    for turn in turns:
+        role = turn.get("from") or turn.get("role")
+        text = turn.get("value") if "value" in turn else turn.get("content")
+        if prompt is None and role in ("human", "user"):
+            prompt = text
+        elif prompt is not None and role in ("gpt", "assistant", "chatgpt", "bard"):
+            output = text
+            break
+    return prompt, output
+
+
+def iter_dataset(path):
+    """
+    Streams the prompts of a dataset: JSONL with a prompt field (PROMPT_KEYS, reference completion in OUTPUT_KEYS),
+    or ShareGPT style conversations, either JSONL or a JSON array (the array is loaded at once).
+
+    Args:
+        path (str): Path of the dataset.
+    Returns:
+        generator: dicts with prompt and output (None if the record has no reference completion)
+    """
+    with open(path, "r", encoding="utf-8") as dataset_file:
+        first_char = dataset_file.read(1)
+        dataset_file.seek(0)
+        records = json.load(dataset_file) if first_char == "[" else (json.loads(line) for line in dataset_file if line.strip())
+        for record in records:
+            if isinstance(record, str):
+                record = {"prompt": record}
+            if "conversations" in record or "messages" in record:
+                prompt, output = _conversation_turns(record)
+            else:
+                prompt = next((record[key] for key in PROMPT_KEYS if record.get(key)), None)
+                output = next((record[key] for key in OUTPUT_KEYS if record.get(key)), None)
+            if prompt:
+                yield {"prompt": prompt, "output": output}
+
+
+def candidate_token_ids(tokenizer):
+    """Token ids of the synthetic prompts: the vocabulary without the special tokens"""
+    special_ids = set(tokenizer.all_special_ids)
+    return [token_id for token_id in range(tokenizer.vocab_size) if token_id not in special_ids]
+
+
+def synthetic_prompt(tokenizer, num_tokens, rng, candidates=None):
+    """
+    Prompt of exactly num_tokens tokens. Random tokens are decoded and encoded again until the text has the
+    target length, since decoding and encoding do not always preserve the number of tokens.
+
+    Args:
+        tokenizer: Tokenizer of the model (None: prompt of num_tokens words).
+        num_tokens (int): Target length.
+        rng (random.Random): Random generator.
+        candidates (list[int]): candidate_token_ids of the tokenizer (default, None: computed on each call).
+    Returns:
+        tuple: prompt text and its token ids (None without a tokenizer)
+    """
+    if tokenizer is None:
+        return " ".join(rng.choice(FALLBACK_WORDS) for _ in range(num_tokens)), None
+    candidates = candidates or candidate_token_ids(tokenizer)
+    token_ids = [rng.choice(candidates) for _ in range(num_tokens)]
+    for _ in range(10):
+        text = tokenizer.decode(token_ids)
+        encoded = tokenizer.encode(text, add_special_tokens=False)
+        if len(encoded) == num_tokens:
+            return text, encoded
+        # Too long: truncated, too short: completed with random tokens
+        token_ids = encoded[:num_tokens] + [rng.choice(candidates) for _ in range(num_tokens - len(encoded))]
+    return text, encoded
+
+
+def _cache_path(spec, tokenizer_key=None):
+    key = dict(spec)
+    # The encodings depend on the tokenizer rules, not on its name
+    key["tokenizer_hash"] = tokenizer_key
+    dataset = spec.get("dataset")
+    if dataset and os.path.isfile(dataset):
+        # A modified dataset gets a new cache entry
+        stat = os.stat(dataset)
+        key["dataset_version"] = f"{stat.st_size}:{stat.st_mtime_ns}"
+    for field in ("input_len", "output_len"):
+        # The same for the production logs of the replay lengths
+        name, params = parse_length_spec(spec[field]) if spec.get(field) is not None else (None, None)
+        if name == "replay" and os.path.isfile(params[0]):
+            stat = os.stat(params[0])
+            key[f"{field}_log_version"] = f"{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+    return os.path.join(workload_cache_dir, f"{digest}.json")
+
+
+def _read_cache(spec, tokenizer_key=None):
+    try:
+        with open(_cache_path(spec, tokenizer_key), "r") as cache_file:
+            return json.load(cache_file)["requests"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_cache(spec, requests, tokenizer_key=None):
+    try:
+        os.makedirs(workload_cache_dir, exist_ok=True)
+        path = _cache_path(spec, tokenizer_key)
+        # Written to a temporary file and renamed, so concurrent jobs never read a partial entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump({"spec": spec, "requests": requests}, cache_file)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not save the workload in the cache: {e}")
+
+
+def _dataset_batches(path, size):
+    batch = []
+    for record in iter_dataset(path):
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_workload(spec, tokenizer_service=None):
+    """
+    Builds the requests of a workload: prompts of a dataset, or synthetic prompts whose input lengths follow
+    a distribution, with the output length of each request. The tokenized workload is cached on disk
+    (WORKLOAD_CACHE) keyed by the spec, the hash of the tokenizer and the version of the dataset and replay log files.
+
+    Args:
+        spec (dict): Workload of data.json:
+            dataset (str): JSONL/ShareGPT dataset (default, None: synthetic prompts).
+            num_prompts (int): Number of requests (default, 100).
+            input_len (str | int): Input length distribution of the synthetic prompts (default, 'fixed:128').
+            output_len (str | int): Output length distribution (default: the length of the reference completions
+                of the dataset, 'fixed:128' for synthetic prompts or records without a completion).
+            max_input_len (int): Dataset prompts longer than this are skipped (default, None).
+            tokenizer (str): Model whose tokenizer measures the lengths (default, None: lengths in words).
+            seed (int): Seed of the lengths and synthetic prompts (default, 0).
+        tokenizer_service (TokenizerService): Shared tokenizers and encodings memo (default, None: a new one).
+    Returns:
+        list[dict]: prompt, input_len, output_len and prompt_token_ids (None without a tokenizer) of each request
+    """
+    tokenizer_service = tokenizer_service or TokenizerService(model_tokenizers=False)
+    tokenizer_name = spec.get("tokenizer")
+    tokenizer = None
+    if tokenizer_name:
+        tokenizer_service.add_tokenizer(tokenizer_name)
+        tokenizer = tokenizer_service.get_tokenizer(tokenizer_name)
+    tokenizer_key = tokenizer_service.get_hash(tokenizer_name) if tokenizer is not None else None
+    cached = _read_cache(spec, tokenizer_key)
+    if cached is not None:
+        return cached
+
+    num_prompts = int(spec.get("num_prompts", 100))
+    seed = int(spec.get("seed", 0))
+    rng = random.Random(seed)
+
+    requests = []
+    if spec.get("dataset"):
+        max_input_len = spec.get("max_input_len")
+        for batch in _dataset_batches(spec["dataset"], DATASET_BATCH):
+            prompts = [record["prompt"] for record in batch]
+            if tokenizer is None:
+                encodings = [None] * len(batch)
+                input_lens = [len(prompt.split()) for prompt in prompts]
+            else:
+                encodings = tokenizer_service.encode_batch(tokenizer_name, prompts)
+                input_lens = [len(token_ids) for token_ids in encodings]
+            output_lens = tokenizer_service.count_batch(tokenizer_name, [record["output"] for record in batch]) \
+                if tokenizer is not None else [len((record["output"] or "").split()) for record in batch]
+            for record, token_ids, input_len, output_len in zip(batch, encodings, input_lens, output_lens):
+                if max_input_len and input_len > max_input_len:
+                    continue
+                requests.append({"prompt": record["prompt"], "input_len": input_len, "output_len": output_len or 128,
+                                 "prompt_token_ids": token_ids})
+                if len(requests) == num_prompts:
+                    break
+            if len(requests) == num_prompts:
+                break
+    else:
+        candidates = candidate_token_ids(tokenizer) if tokenizer is not None else None
+        for input_len in sample_lengths(spec.get("input_len", "fixed:128"), num_prompts, seed):
+            prompt, token_ids = synthetic_prompt(tokenizer, input_len, rng, candidates)
+            requests.append({"prompt": prompt, "input_len": len(token_ids) if token_ids is not None else input_len,
+                             "output_len": 128, "prompt_token_ids": token_ids})
+
+    if spec.get("output_len") is not None:
+        # Different seed than the input lengths, so both are independent
+        for request, output_len in zip(requests, sample_lengths(spec["output_len"], len(requests), seed + 1)):
+            request["output_len"] = output_len
+
+    _write_cache(spec, requests, tokenizer_key)
+    return requests
+
+
+def workload_label(spec):
+    """Name of a workload in the results (e.g. 'input=lognormal:512:0.6,output=fixed:128,n=200')"""
+    source = os.path.basename(spec["dataset"]) if spec.get("dataset") else spec.get("input_len", "fixed:128")
+    output = spec.get("output_len", "dataset" if spec.get("dataset") else "fixed:128")
+    return f"input={source},output={output},n={spec.get('num_prompts', 100)}"
@@ -0,0 +1,58 @@
+import argparse, json, os, sys
+
+# --------------- PARSER CONFIG --------------
+
+parser = argparse.ArgumentParser(description="Downloads the models of the NLHPC AI BENCHMARK before the jobs are launched")
+
+parser.add_argument(
+    "--test_app",
+    type=str,
+    help="Application whose models are downloaded. Options: ollama-vLLM. Default=ollama",
+    required=False,
+    default="ollama",
+    choices=["ollama", "vLLM"],
+    dest="test_app"
+)
+
+parser.add_argument(
+    "--parallel",
+    type=int,
+    help="Maximum number of models downloaded at the same time. Default=MODEL_PULL_PARALLEL or 4",
+    required=False,
+    default=int(os.getenv('MODEL_PULL_PARALLEL') or "4"),
+    dest="parallel"
+)
+
+parser.add_argument(
+    "--retries",
+    type=int,
+    help="Attempts of each download. Default=MODEL_PULL_RETRIES or 3",
+    required=False,
+    default=int(os.getenv('MODEL_PULL_RETRIES') or "3"),
+    dest="retries"
+)
+
+args = parser.parse_args()
+
+# --------------- LOAD THE MODELS ----------
+
+test_data_json = os.getenv('TEST_DATA') or 'data.json'
+with open(test_data_json, 'r') as test_data_json_file:
+    models_name_list = json.load(test_data_json_file).get('models', [])
+
+# --------------- DOWNLOAD THE MISSING MODELS ----------
+
+if args.test_app == "ollama":
+    from modules.ollama.ollama_api import prepull_models_ollama
+    available = prepull_models_ollama(models_name_list, os.getenv('OLLAMA_HOST') or "127.0.0.1:11434", args.parallel, args.retries)
+else:
+    from modules.vLLM.models_prepull import prepull_models_hf
+    available = prepull_models_hf(models_name_list, args.parallel, args.retries)
+
+missing = [model for model, present in available.items() if not present]
+print(f"{len(available) - len(missing)}/{len(available)} models available")
+if missing:
+    print(f"Could not download: {', '.join(missing)}")
+
+# Non zero exit status when a model is missing, so the staging can gate the job submission
+sys.exit(1 if missing else 0)
@@ -0,0 +1,144 @@
+import argparse, csv, os
+
+from modules.results.results_store import open_results_store
+from modules.results.report import summarize_cells, CELL_FIELDS
+
+# --------------- PARSER CONFIG --------------
+
+parser = argparse.ArgumentParser(description="Report of the repetitions saved in the results database of the NLHPC AI BENCHMARK")
+
+parser.add_argument(
+    "--test_app",
+    type=str,
+    help="Only report this application",
+    required=False,
+    default=None,
+    dest="test_app"
+)
+
+parser.add_argument(
+    "--model",
+    type=str,
+    help="Only report this model",
+    required=False,
+    default=None,
+    dest="model"
+)
+
+parser.add_argument(
+    "--run",
+    type=int,
+    help="Id of the run to report. Default: the last run",
+    required=False,
+    default=None,
+    dest="run"
+)
+
+parser.add_argument(
+    "--config_hash",
+    type=str,
+    help="Pool the repetitions of every run with this configuration hash instead of a single run",
+    required=False,
+    default=None,
+    dest="config_hash"
+)
+
+parser.add_argument(
+    "--metrics",
+    type=lambda value: [metric.strip() for metric in value.split(",")],
+    help="Comma separated metrics to report. Default: tokens/s, latency, energy and goodput metrics",
+    required=False,
+    default=None,
+    dest="metrics"
+)
+
+parser.add_argument(
+    "--confidence",
+    type=float,
+    help="Confidence level of the bootstrap intervals. Default=0.95",
+    required=False,
+    default=0.95,
+    dest="confidence"
+)
+
+parser.add_argument(
+    "--outlier_threshold",
+    type=float,
+    help="Modified z-score above which a repetition is rejected as an outlier, 0 keeps all the repetitions. Default=3.5",
+    required=False,
+    default=3.5,
+    dest="outlier_threshold"
+)
+
+parser.add_argument(
+    "--noisy_cv",
+    type=float,
+    help="Cells whose coefficient of variation is above this value are flagged as noisy. Default=0.05",
+    required=False,
+    default=0.05,
+    dest="noisy_cv"
+)
+
+parser.add_argument(
+    "--skip_first",
+    action="store_true",
+    help="Drop the first repetition of every cell (cold caches, model load)",
+    required=False,
+    dest="skip_first"
+)
+
+args = parser.parse_args()
+
+if (args.run is not None and args.config_hash is not None):
+    parser.error("Use either --run or --config_hash")
+
+# --------------- LOAD THE MEASUREMENTS ----------
+
+result_path = os.getenv('RESULT_PATH') or "."
+results_store = open_results_store(result_path)
+if results_store is None:
+    parser.error("The results database is disabled (RESULTS_DB=none)")
+
+# Only the repetitions of one run (or of the runs with the same configuration) are pooled, so the intervals
+# and the outlier rejection do not mix runs of other software versions, nodes or configurations
+runs = {run["id"]: run for run in results_store.get_runs()}
+if not runs:
+    parser.error("There are no runs in the results database")
+if args.config_hash is not None:
+    report_runs = results_store.get_runs(config_hash=args.config_hash)
+    if not report_runs:
+        parser.error(f"There are no runs with the configuration {args.config_hash}")
+else:
+    run_id = args.run if args.run is not None else max(runs)
+    if run_id not in runs:
+        parser.error(f"Run {run_id} not found")
+    report_runs = [runs[run_id]]
+
+filters = {field: value for field, value in (("test_app", args.test_app), ("model", args.model)) if value is not None}
+measurements = [measurement for run in report_runs for measurement in results_store.query(run_id=run["id"], **filters)]
+results_store.close()
+print(f"Report of run(s) {', '.join(str(run['id']) for run in sorted(report_runs, key=lambda run: run['id']))}")
+
+# --------------- SUMMARIZE THE REPETITIONS ----------
+
+rows = summarize_cells(measurements,
+                       metrics=args.metrics,
+                       confidence=args.confidence,
+                       outlier_threshold=args.outlier_threshold or None,
+                       noisy_cv=args.noisy_cv,
+                       skip_first=args.skip_first)
+
+output_file = os.path.join(result_path, "report.csv")
+columns = list(CELL_FIELDS) + ["metric", "n", "n_rejected", "mean", "std", "median", "ci_low", "ci_high", "ci_rel_width", "cv", "noisy"]
+with open(output_file, mode='w', newline='', encoding='utf-8') as csvfile:
+    writer = csv.DictWriter(csvfile, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+for row in rows:
+    ci = f"[{row['ci_low']:.4g}, {row['ci_high']:.4g}]" if row["ci_low"] is not None else "[-]"
+    flags = (" NOISY" if row["noisy"] else "") + (f" ({row['n_rejected']} outliers rejected)" if row["n_rejected"] else "")
+    print(f"{row['model']} | {row['num_gpus']} gpus | {row['test_app']} {row['load_mode']} {row['workload']} | "
+          f"{row['metric']}: {row['mean']:.4g} {int(args.confidence * 100)}% CI {ci} n={row['n']}{flags}")
+
+print(f"\n{len(rows)} rows saved in {output_file}")
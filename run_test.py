@@ -40,7 +40,7 @@ parser.add_argument(
     "--gpu_backend",
     type=str,
     default="cuda",
-    help="gpu backend to be used for the test. Default=cuda. Options:cuda-rocm",
+    help="gpu backend to be used for the test. Default=cuda. Options:cuda-rocm-sim-auto",
     dest="gpu_backend"
 )
 